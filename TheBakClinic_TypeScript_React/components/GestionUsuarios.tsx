@@ -26,6 +26,7 @@ interface UserFormState extends Omit<UsuarioApi,
   'id_usuario' |
   'fecha_creacion' |
   'ultimo_acceso' |
+  'version' |
   'fecha_ingreso' // Estos son campos que generalmente no se envían en un formulario de creación/edición directamente
 > {
   contrasena?: string;
@@ -49,6 +50,8 @@ export function GestionUsuarios(/*{ onNavigate }: GestionUsuariosProps*/) {
   const [isDialogOpen, setIsDialogOpen] = useState(false);
   const [formMode, setFormMode] = useState<'create' | 'edit'>('create');
   const [selectedUserId, setSelectedUserId] = useState<number | null>(null);
+  // Versión del usuario al abrir el formulario: si otra persona lo modifica entretanto, el PUT responde 412
+  const [selectedUserVersion, setSelectedUserVersion] = useState<number | null>(null);
 
   const initialUserFormState: UserFormState = {
     nombre: '',
@@ -121,6 +124,7 @@ export function GestionUsuarios(/*{ onNavigate }: GestionUsuariosProps*/) {
     setMensajeExito(null);
     if (mode === 'edit' && usuario) {
       setSelectedUserId(usuario.id_usuario);
+      setSelectedUserVersion(usuario.version);
       setUserForm({
         nombre: usuario.nombre,
         apellido: usuario.apellido,
@@ -134,6 +138,7 @@ export function GestionUsuarios(/*{ onNavigate }: GestionUsuariosProps*/) {
       });
     } else {
       setSelectedUserId(null);
+      setSelectedUserVersion(null);
       setUserForm(initialUserFormState);
     }
     setIsDialogOpen(true);
@@ -165,11 +170,11 @@ export function GestionUsuarios(/*{ onNavigate }: GestionUsuariosProps*/) {
         };
         await crearUsuario(payload);
         mostrarMensajeTemporal(setMensajeExito, 'Usuario creado exitosamente.');
-      } else if (selectedUserId) {
+      } else if (selectedUserId && selectedUserVersion !== null) {
         // Para actualizar, no enviamos la contraseña. El payload de actualización es Partial<UsuarioApi>
         const { contrasena, ...updateFields } = userForm;
         const updatePayload: Partial<UsuarioApi> = updateFields;
-        await actualizarUsuario(selectedUserId, updatePayload);
+        await actualizarUsuario(selectedUserId, updatePayload, selectedUserVersion);
         mostrarMensajeTemporal(setMensajeExito, 'Usuario actualizado exitosamente.');
       }
       setIsDialogOpen(false);
@@ -188,7 +193,7 @@ export function GestionUsuarios(/*{ onNavigate }: GestionUsuariosProps*/) {
     setErrorApi(null);
     setMensajeExito(null);
     try {
-      await actualizarUsuario(usuario.id_usuario, { activo: !usuario.activo });
+      await actualizarUsuario(usuario.id_usuario, { activo: !usuario.activo }, usuario.version);
       mostrarMensajeTemporal(setMensajeExito, `Usuario ${usuario.activo ? 'desactivado' : 'activado'} exitosamente.`);
       fetchUsuarios();
     } catch (error: any) {
@@ -13,6 +13,8 @@ const clienteHttp = axios.create({
   headers: {
     'Content-Type': 'application/json',
   },
+  // Los arreglos se envían como ?estado=a&estado=b, que es lo que espera FastAPI
+  paramsSerializer: { indexes: null },
 });
 
 clienteHttp.interceptors.request.use(
@@ -42,19 +44,36 @@ export const get = async <T>(endpoint: string, params?: Record<string, any>): Pr
   }
 };
 
+// Cada POST lleva una Idempotency-Key propia que se repite en los reintentos: si la primera
+// solicitud llegó al backend pero la respuesta se perdió, el reintento devuelve el mismo registro
+// en vez de crear un duplicado (app/core/idempotencia.py).
+const REINTENTOS_POST = 2;
+
+const debeReintentar = (error: unknown): boolean =>
+  axios.isAxiosError(error) &&
+  // Sin respuesta (red caída, timeout) o la solicitud original todavía se está procesando
+  (!error.response || (error.response.status === 409 && error.response.headers['retry-after'] !== undefined));
+
 export const post = async <T, U>(endpoint: string, data: U): Promise<T> => {
-  try {
-    const response = await clienteHttp.post<T>(endpoint, data);
-    return response.data;
-  } catch (error) {
-    console.error(`Error en POST ${API_URL}${endpoint}:`, error);
-    throw error;
+  const headers = { 'Idempotency-Key': crypto.randomUUID() };
+  for (let intento = 0; ; intento++) {
+    try {
+      const response = await clienteHttp.post<T>(endpoint, data, { headers });
+      return response.data;
+    } catch (error) {
+      if (intento < REINTENTOS_POST && debeReintentar(error)) {
+        await new Promise((resolver) => setTimeout(resolver, 500 * (intento + 1)));
+        continue;
+      }
+      console.error(`Error en POST ${API_URL}${endpoint}:`, error);
+      throw error;
+    }
   }
 };
 
-export const put = async <T, U>(endpoint: string, data: U): Promise<T> => {
+export const put = async <T, U>(endpoint: string, data: U, headers?: Record<string, string>): Promise<T> => {
   try {
-    const response = await clienteHttp.put<T>(endpoint, data);
+    const response = await clienteHttp.put<T>(endpoint, data, { headers });
     return response.data;
   } catch (error) {
     console.error(`Error en PUT ${API_URL}${endpoint}:`, error);
@@ -72,5 +91,29 @@ export const del = async <T>(endpoint: string): Promise<T> => {
   }
 };
 
+// Varias lecturas en un solo request (POST /batch, máximo 10): las pantallas que cargan datos de
+// varias rutas a la vez (dashboard, reportes) pagan un solo viaje de red. Cada respuesta trae su
+// propio estado; se devuelven indexadas por id para que cada sección maneje su error por separado.
+export interface RespuestaLote<T = unknown> {
+  id: string;
+  estado: number;
+  cuerpo: T;
+}
+
+export const getLote = async (solicitudes: Record<string, string>): Promise<Record<string, RespuestaLote>> => {
+  const cuerpo = { solicitudes: Object.entries(solicitudes).map(([id, url]) => ({ id, url })) };
+  try {
+    const response = await clienteHttp.post<{ respuestas: RespuestaLote[] }>('/batch', cuerpo);
+    return Object.fromEntries(response.data.respuestas.map((respuesta) => [respuesta.id, respuesta]));
+  } catch (error) {
+    console.error(`Error en POST ${API_URL}/batch:`, error);
+    throw error;
+  }
+};
+
+// Cirugías, pacientes y usuarios se actualizan con control de concurrencia optimista: el PUT lleva la
+// versión leída (If-Match) y el backend responde 412 si otra persona modificó el registro entretanto.
+export const siCoincideVersion = (version: number): Record<string, string> => ({ 'If-Match': `"${version}"` });
+
 export default clienteHttp; // Exportar la instancia para uso en otros servicios si es necesario, o no exportarla si solo se usan get/post/put/del.
 // Por ahora la exporto, pero los servicios modulares usarán las funciones get/post/put/del.
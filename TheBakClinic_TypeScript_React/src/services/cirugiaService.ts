@@ -1,4 +1,4 @@
-import { get, post, put, del } from './api';
+import { get, post, put, del, siCoincideVersion } from './api';
 // Podríamos importar Paciente y Usuario si los anidamos en la interfaz Cirugia
 // import { Paciente } from './pacienteService';
 // import { Usuario } from './usuarioService';
@@ -18,6 +18,7 @@ export interface Cirugia {
   notas_postoperatorias?: string | null;
   fecha_creacion_registro: string; // ISO datetime string
   fecha_ultima_modificacion?: string | null; // ISO datetime string
+  version: number; // Se envía en If-Match al actualizar
 
   // paciente?: Paciente;
   // medico_principal?: Usuario;
@@ -28,6 +29,7 @@ export type CirugiaCreatePayload = Omit<Cirugia,
   'id_cirugia' |
   'fecha_creacion_registro' |
   'fecha_ultima_modificacion' |
+  'version' |
   'fecha_hora_fin_programada' // Se calcula en backend o es opcional si hay duración
 > & {
   fecha_hora_fin_programada?: string; // Permitir enviarla si se precalcula en frontend
@@ -50,14 +52,25 @@ export interface CirugiaListParams {
   fecha_hasta?: string; // YYYY-MM-DD
   id_paciente?: number;
   id_medico?: number; // Debería ser id_medico_principal
-  estado?: string;
-  // nombre_quirofano?: string; // Si el backend lo soporta
+  estado?: string | string[];
+  nombre_quirofano?: string | string[];
+  q?: string; // Texto en tipo de cirugía y notas
+  orden?: string; // fecha, tipo, estado, quirofano, medico, modificacion, id; prefijo '-' para descendente
 }
 
+// Solo algunos campos (el backend agrega siempre id_cirugia y version), p. ej. para el calendario sin las notas
+export type CampoCirugia = keyof Cirugia;
+
 export const obtenerCirugias = async (params?: CirugiaListParams): Promise<CirugiaListResponse> => {
   return get<CirugiaListResponse>('/cirugias', params);
 };
 
+export const obtenerCirugiasCampos = async <K extends CampoCirugia>(
+  campos: K[], params?: CirugiaListParams,
+): Promise<{ cirugias: Pick<Cirugia, K | 'id_cirugia' | 'version'>[]; total: number }> => {
+  return get('/cirugias', { ...params, fields: campos.join(',') });
+};
+
 export const obtenerCirugiaPorId = async (idCirugia: number): Promise<Cirugia> => {
   return get<Cirugia>(`/cirugias/${idCirugia}`);
 };
@@ -66,8 +79,26 @@ export const crearCirugia = async (datosCirugia: CirugiaCreatePayload): Promise<
   return post<Cirugia, CirugiaCreatePayload>('/cirugias', datosCirugia);
 };
 
-export const actualizarCirugia = async (idCirugia: number, datosCirugia: CirugiaUpdatePayload): Promise<Cirugia> => {
-  return put<Cirugia, CirugiaUpdatePayload>(`/cirugias/${idCirugia}`, datosCirugia);
+export interface CirugiaLoteResultado {
+  indice: number;
+  creada: boolean;
+  cirugia?: Cirugia | null;
+  error?: string | null;
+  advertencia?: string | null; // Ej. poca holgura para la rotación del quirófano
+}
+
+export interface CirugiaLoteResponse {
+  resultados: CirugiaLoteResultado[];
+  total_creadas: number;
+  total_rechazadas: number;
+}
+
+export const crearCirugiasLote = async (cirugias: CirugiaCreatePayload[]): Promise<CirugiaLoteResponse> => {
+  return post<CirugiaLoteResponse, { cirugias: CirugiaCreatePayload[] }>('/cirugias/lote', { cirugias });
+};
+
+export const actualizarCirugia = async (idCirugia: number, datosCirugia: CirugiaUpdatePayload, version: number): Promise<Cirugia> => {
+  return put<Cirugia, CirugiaUpdatePayload>(`/cirugias/${idCirugia}`, datosCirugia, siCoincideVersion(version));
 };
 
 export const eliminarCirugia = async (idCirugia: number): Promise<any> => {
@@ -1,4 +1,4 @@
-import { get, put } from './api';
+import { get, post, put } from './api';
 
 export interface EstadoQuirofano {
   nombre_quirofano: string;
@@ -33,7 +33,66 @@ export const actualizarEstadoQuirofano = async (nombreQuirofano: string, payload
   return put<EstadoQuirofano, EstadoQuirofanoUpdatePayload>(`/limpieza/quirofanos/${nombreQuirofano}/estado`, payload);
 };
 
-// Si se implementan Tareas de Limpieza, se añadirían aquí:
-// export interface TareaLimpieza { ... }
-// export const obtenerTareasLimpieza = async (...): Promise<...> => { ... };
-// etc.
+export type EstadoQuirofanoLoteItem = EstadoQuirofanoUpdatePayload & { nombre_quirofano: string };
+
+// Actualiza varios quirófanos en una sola operación (ej. reinicio de fin de día)
+export const actualizarEstadosQuirofanos = async (quirofanos: EstadoQuirofanoLoteItem[]): Promise<EstadoQuirofanoListResponse> => {
+  return put<EstadoQuirofanoListResponse, { quirofanos: EstadoQuirofanoLoteItem[] }>('/limpieza/quirofanos/estados', { quirofanos });
+};
+
+// --- Tareas de Limpieza ---
+
+export interface TareaLimpieza {
+  id_tarea_limpieza: number;
+  nombre_quirofano: string;
+  id_cirugia?: number | null;
+  asignada_a?: number | null;
+  solicitada_dt: string; // ISO datetime string
+  asignada_dt?: string | null;
+  completada_dt?: string | null;
+  estado_tarea: string; // Pendiente, En Progreso, Completada
+  ocupado_hasta?: string | null;
+  notas_tarea?: string | null;
+  proxima_cirugia_dt?: string | null; // Solo en /tareas/siguiente
+}
+
+export interface TareaLimpiezaListResponse {
+  tareas: TareaLimpieza[];
+  total: number;
+}
+
+export interface TareaLimpiezaListParams {
+  estado_tarea?: string;
+  nombre_quirofano?: string;
+  asignada_a?: number;
+  skip?: number;
+  limit?: number;
+}
+
+export type TareaLimpiezaUpdatePayload = {
+  asignada_a?: number | null;
+  estado_tarea?: string;
+  notas_tarea?: string | null;
+};
+
+export const obtenerTareasLimpieza = async (params?: TareaLimpiezaListParams): Promise<TareaLimpiezaListResponse> => {
+  return get<TareaLimpiezaListResponse>('/limpieza/tareas', params);
+};
+
+export const obtenerSiguienteTareaLimpieza = async (): Promise<TareaLimpieza> => {
+  return get<TareaLimpieza>('/limpieza/tareas/siguiente');
+};
+
+// Asigna al usuario actual la tarea más prioritaria (404 si no hay pendientes)
+export const tomarSiguienteTareaLimpieza = async (): Promise<TareaLimpieza> => {
+  return post<TareaLimpieza, Record<string, never>>('/limpieza/tareas/siguiente/tomar', {});
+};
+
+// 409 si otra persona ya la tomó
+export const tomarTareaLimpieza = async (idTarea: number): Promise<TareaLimpieza> => {
+  return post<TareaLimpieza, Record<string, never>>(`/limpieza/tareas/${idTarea}/tomar`, {});
+};
+
+export const actualizarTareaLimpieza = async (idTarea: number, payload: TareaLimpiezaUpdatePayload): Promise<TareaLimpieza> => {
+  return put<TareaLimpieza, TareaLimpiezaUpdatePayload>(`/limpieza/tareas/${idTarea}`, payload);
+};
@@ -1,4 +1,4 @@
-import { get, post, put, del } from './api';
+import { get, post, put, del, siCoincideVersion } from './api';
 
 export interface Paciente {
   id_paciente: number;
@@ -12,9 +12,10 @@ export interface Paciente {
   prevision?: string;
   numero_ficha?: string;
   fecha_registro: string; // ISO datetime string
+  version: number; // Se envía en If-Match al actualizar
 }
 
-export type PacienteCreatePayload = Omit<Paciente, 'id_paciente' | 'fecha_registro'>;
+export type PacienteCreatePayload = Omit<Paciente, 'id_paciente' | 'fecha_registro' | 'version'>;
 export type PacienteUpdatePayload = Partial<PacienteCreatePayload>;
 
 export interface PacienteListResponse {
@@ -30,12 +31,35 @@ export const obtenerPacientePorId = async (idPaciente: number): Promise<Paciente
   return get<Paciente>(`/pacientes/${idPaciente}`);
 };
 
+export interface PacienteResumen {
+  id_paciente: number;
+  nombre: string;
+  apellido: string;
+  rut: string;
+  numero_ficha?: string | null;
+  puntaje: number;
+}
+
+export interface PacienteBusquedaResponse {
+  resultados: PacienteResumen[];
+  total: number;
+  total_aproximado: boolean; // true con términos muy comunes: mostrar "más de N" / "~N"
+}
+
+export const buscarPacientes = async (q: string, limit: number = 20): Promise<PacienteBusquedaResponse> => {
+  return get<PacienteBusquedaResponse>('/pacientes/buscar', { q, limit });
+};
+
+export const obtenerPacientePorRut = async (rut: string): Promise<Paciente> => {
+  return get<Paciente>(`/pacientes/por-rut/${encodeURIComponent(rut)}`);
+};
+
 export const crearPaciente = async (datosPaciente: PacienteCreatePayload): Promise<Paciente> => {
   return post<Paciente, PacienteCreatePayload>('/pacientes', datosPaciente);
 };
 
-export const actualizarPaciente = async (idPaciente: number, datosPaciente: PacienteUpdatePayload): Promise<Paciente> => {
-  return put<Paciente, PacienteUpdatePayload>(`/pacientes/${idPaciente}`, datosPaciente);
+export const actualizarPaciente = async (idPaciente: number, datosPaciente: PacienteUpdatePayload, version: number): Promise<Paciente> => {
+  return put<Paciente, PacienteUpdatePayload>(`/pacientes/${idPaciente}`, datosPaciente, siCoincideVersion(version));
 };
 
 export const eliminarPaciente = async (idPaciente: number): Promise<any> => {
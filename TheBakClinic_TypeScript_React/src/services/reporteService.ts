@@ -16,4 +16,37 @@ export const obtenerReporteGeneral = async (): Promise<ReporteGeneralData> => {
   return get<ReporteGeneralData>('/reportes/general');
 };
 
+export interface EstadisticaRotacion {
+  nombre_quirofano?: string | null;
+  dia_semana?: number | null; // 0 = lunes
+  hora?: number | null;
+  cantidad: number;
+  mediana_minutos: number;
+  p90_minutos: number;
+}
+
+export interface ReporteRotacion {
+  desde: string;
+  hasta: string;
+  general?: EstadisticaRotacion | null;
+  por_quirofano: EstadisticaRotacion[];
+  por_franja: EstadisticaRotacion[];
+}
+
+export interface PrediccionRotacion {
+  nombre_quirofano: string;
+  mediana_minutos: number;
+  p90_minutos: number;
+  muestras: number;
+  nivel: string;
+}
+
+export const obtenerReporteRotacion = async (params?: { desde?: string; hasta?: string; nombre_quirofano?: string }): Promise<ReporteRotacion> => {
+  return get<ReporteRotacion>('/reportes/turnover', params);
+};
+
+export const obtenerPrediccionRotacion = async (nombreQuirofano: string, momento?: string): Promise<PrediccionRotacion> => {
+  return get<PrediccionRotacion>('/reportes/turnover/prediccion', { nombre_quirofano: nombreQuirofano, momento });
+};
+
 // Otras funciones para reportes específicos podrían ir aquí.
@@ -1,4 +1,4 @@
-import { get, post, put, del } from './api'; // Usar las funciones genéricas
+import { get, post, put, del, siCoincideVersion } from './api'; // Usar las funciones genéricas
 
 export interface Usuario {
   id_usuario: number;
@@ -12,6 +12,7 @@ export interface Usuario {
   activo: boolean;
   fecha_creacion?: string; // ISO datetime string
   ultimo_acceso?: string; // ISO datetime string
+  version: number; // Se envía en If-Match al actualizar
   // fecha_ingreso no está en el schema del backend, pero estaba en la interfaz anterior. Se omite por ahora.
 }
 
@@ -21,12 +22,12 @@ export interface UsuarioListResponse {
 }
 
 // Payload para crear, debe incluir la contraseña y coincidir con UserCreate del backend
-export type UsuarioCreatePayload = Omit<Usuario, 'id_usuario' | 'fecha_creacion' | 'ultimo_acceso'> & {
+export type UsuarioCreatePayload = Omit<Usuario, 'id_usuario' | 'fecha_creacion' | 'ultimo_acceso' | 'version'> & {
   contrasena: string;
 };
 
 // Payload para actualizar, todos los campos son opcionales y no se incluye contraseña
-export type UsuarioUpdatePayload = Partial<Omit<Usuario, 'id_usuario' | 'fecha_creacion' | 'ultimo_acceso' | 'contrasena'>>;
+export type UsuarioUpdatePayload = Partial<Omit<Usuario, 'id_usuario' | 'fecha_creacion' | 'ultimo_acceso' | 'version' | 'contrasena'>>;
 
 
 export const obtenerUsuarios = async (skip: number = 0, limit: number = 100): Promise<UsuarioListResponse> => {
@@ -42,8 +43,8 @@ export const crearUsuario = async (datosUsuario: UsuarioCreatePayload): Promise<
   return post<Usuario, UsuarioCreatePayload>('/usuarios', datosUsuario);
 };
 
-export const actualizarUsuario = async (idUsuario: number | string, datosUsuario: UsuarioUpdatePayload): Promise<Usuario> => {
-  return put<Usuario, UsuarioUpdatePayload>(`/usuarios/${idUsuario}`, datosUsuario);
+export const actualizarUsuario = async (idUsuario: number | string, datosUsuario: UsuarioUpdatePayload, version: number): Promise<Usuario> => {
+  return put<Usuario, UsuarioUpdatePayload>(`/usuarios/${idUsuario}`, datosUsuario, siCoincideVersion(version));
 };
 
 export const eliminarUsuario = async (idUsuario: number | string): Promise<any> => {
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Cachés con nombre, para exponer sus aciertos/fallos en /metrics
+caches_registradas: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    Caché LRU en memoria con expiración por antigüedad, segura para usar desde varios hilos.
+    Pensada para lecturas muy frecuentes de datos pequeños (por proceso; cada worker tiene la suya).
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl_segundos: float = 60.0, nombre: Optional[str] = None):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        if nombre:
+            caches_registradas[nombre] = self
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def set(self, clave: Hashable, valor: Any, ttl_segundos: Optional[float] = None) -> None:
+        expira = time.monotonic() + (self.ttl_segundos if ttl_segundos is None else ttl_segundos)
+        with self._lock:
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def eliminar_si(self, condicion: Callable[[Any], bool]) -> None:
+        """Elimina las entradas cuyo valor cumple la condición (recorre toda la caché; usar solo en escrituras)."""
+        with self._lock:
+            for clave in [c for c, (_, valor) in self._datos.items() if condicion(valor)]:
+                del self._datos[clave]
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
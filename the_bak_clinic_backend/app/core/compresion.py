@@ -0,0 +1,231 @@
+import os
+import threading
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import MutableHeaders
+
+from app.core import metricas
+
+# Compresión de respuestas según Accept-Encoding: zstd, brotli o gzip, en ese orden de preferencia.
+# gzip viene con Python; brotli (paquete `brotli`) y zstd (paquete `zstandard`) son opcionales y se
+# ofrecen solo si están instalados.
+#
+# El middleware comprime al vuelo las respuestas de texto/JSON desde MINIMO_BYTES (por debajo, el
+# ahorro no paga el CPU ni los bytes de cabecera). Las respuestas en varias partes (streaming) se
+# comprimen parte por parte, sin juntarlas. Lo que ya trae Content-Encoding pasa sin tocar: así una
+# respuesta cacheada puede guardar sus bytes comprimidos (CuerpoPrecomprimido) y comprimirse una vez.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MINIMO_BYTES = int(os.getenv("COMPRESION_MINIMO_BYTES", "1024"))
+
+# Niveles al vuelo (rápidos) y para cuerpos cacheados, que se comprimen una sola vez
+NIVELES_AL_VUELO = {"zstd": 3, "br": 4, "gzip": 6}
+NIVELES_PRECOMPRIMIDO = {"zstd": 12, "br": 9, "gzip": 9}
+
+CODIFICACIONES = tuple(
+    codificacion for codificacion, disponible in (("zstd", zstandard is not None), ("br", brotli is not None), ("gzip", True))
+    if disponible
+)
+
+TIPOS_COMPRIMIBLES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+bytes_compresion = metricas.Contador(
+    "bak_http_compresion_bytes_total", "Bytes de respuestas comprimidas, antes y después de comprimir",
+    ("codificacion", "cuerpo"),
+)
+
+
+@lru_cache(maxsize=256)
+def negociar(accept_encoding: str) -> Optional[str]:
+    """Codificación a usar según el header Accept-Encoding (con sus q=), o None para no comprimir."""
+    aceptadas: Dict[str, float] = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.partition(";")
+        calidad = 1.0
+        parametro, _, valor = parametros.strip().partition("=")
+        if parametro.strip() == "q":
+            try:
+                calidad = float(valor)
+            except ValueError:
+                calidad = 0.0
+        if nombre.strip():
+            aceptadas[nombre.strip()] = calidad
+    comodin = aceptadas.get("*", 0.0)
+    for codificacion in CODIFICACIONES:
+        if aceptadas.get(codificacion, comodin) > 0:
+            return codificacion
+    return None
+
+
+def comprimir(datos: bytes, codificacion: str, nivel: Optional[int] = None) -> bytes:
+    nivel = NIVELES_AL_VUELO[codificacion] if nivel is None else nivel
+    if codificacion == "gzip":
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+        return compresor.compress(datos) + compresor.flush()
+    if codificacion == "br":
+        return brotli.compress(datos, quality=nivel)
+    return zstandard.ZstdCompressor(level=nivel).compress(datos)
+
+
+class _Flujo:
+    """Compresor para respuestas en varias partes: cada parte sale comprimida y completa (flush)."""
+
+    def __init__(self, codificacion: str):
+        nivel = NIVELES_AL_VUELO[codificacion]
+        self.codificacion = codificacion
+        if codificacion == "gzip":
+            self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        elif codificacion == "br":
+            self._compresor = brotli.Compressor(quality=nivel)
+        else:
+            self._compresor = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def parte(self, datos: bytes) -> bytes:
+        if self.codificacion == "gzip":
+            return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+        if self.codificacion == "br":
+            return self._compresor.process(datos) + self._compresor.flush()
+        return self._compresor.compress(datos) + self._compresor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def fin(self) -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.finish()
+        return self._compresor.flush()
+
+
+class CuerpoPrecomprimido:
+    """
+    Cuerpo JSON de una respuesta cacheada junto a sus versiones comprimidas, que se calculan la
+    primera vez que un cliente las pide y se reutilizan mientras la caché conserve el objeto.
+    """
+
+    __slots__ = ("cuerpo", "_variantes", "_lock")
+
+    def __init__(self, cuerpo: bytes):
+        self.cuerpo = cuerpo
+        self._variantes: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_modelo(cls, modelo) -> "CuerpoPrecomprimido":
+        """Serializa igual que FastAPI lo haría con el response_model."""
+        return cls(JSONResponse(jsonable_encoder(modelo)).body)
+
+    def variante(self, codificacion: str) -> bytes:
+        comprimido = self._variantes.get(codificacion)
+        if comprimido is None:
+            with self._lock:
+                comprimido = self._variantes.get(codificacion)
+                if comprimido is None:
+                    comprimido = self._variantes[codificacion] = comprimir(self.cuerpo, codificacion, NIVELES_PRECOMPRIMIDO[codificacion])
+        return comprimido
+
+    def respuesta(self, accept_encoding: Optional[str]) -> Response:
+        codificacion = negociar(accept_encoding or "") if len(self.cuerpo) >= MINIMO_BYTES else None
+        if codificacion is None:
+            return Response(content=self.cuerpo, media_type="application/json", headers={"Vary": "Accept-Encoding"})
+        return Response(
+            content=self.variante(codificacion), media_type="application/json",
+            headers={"Content-Encoding": codificacion, "Vary": "Accept-Encoding"},
+        )
+
+
+class CompresionMiddleware:
+    """Middleware ASGI que comprime las respuestas según Accept-Encoding (ver el comentario del módulo)."""
+
+    def __init__(self, app, minimo_bytes: int = MINIMO_BYTES):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        codificacion = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"accept-encoding":
+                codificacion = negociar(valor.decode("latin-1"))
+                break
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio: dict = {}
+        flujo: Optional[_Flujo] = None
+        directo = False
+
+        async def enviar(mensaje):
+            nonlocal flujo, directo
+            tipo = mensaje["type"]
+            if tipo == "http.response.start":
+                inicio.update(mensaje)
+                return
+            if tipo != "http.response.body" or directo:
+                await send(mensaje)
+                return
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+
+            if flujo is not None:
+                comprimido = flujo.parte(cuerpo) if mas else flujo.parte(cuerpo) + flujo.fin()
+                self._contar(codificacion, len(cuerpo), len(comprimido))
+                await send({"type": "http.response.body", "body": comprimido, "more_body": mas})
+                return
+
+            # Primera parte del cuerpo: decidir si se comprime
+            headers = MutableHeaders(raw=inicio["headers"])
+            if not self._comprimible(inicio["status"], headers) or (not mas and len(cuerpo) < self.minimo_bytes):
+                directo = True
+                await send(inicio)
+                await send(mensaje)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if not mas:
+                comprimido = comprimir(cuerpo, codificacion)
+                if len(comprimido) >= len(cuerpo):
+                    directo = True
+                    await send(inicio)
+                    await send(mensaje)
+                    return
+                headers["Content-Encoding"] = codificacion
+                headers["Content-Length"] = str(len(comprimido))
+                self._contar(codificacion, len(cuerpo), len(comprimido))
+                await send(inicio)
+                await send({"type": "http.response.body", "body": comprimido})
+                return
+
+            flujo = _Flujo(codificacion)
+            headers["Content-Encoding"] = codificacion
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            comprimido = flujo.parte(cuerpo)
+            self._contar(codificacion, len(cuerpo), len(comprimido))
+            await send(inicio)
+            await send({"type": "http.response.body", "body": comprimido, "more_body": True})
+
+        await self.app(scope, receive, enviar)
+
+    @staticmethod
+    def _comprimible(estado: int, headers: MutableHeaders) -> bool:
+        if estado < 200 or estado in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        tipo = headers.get("content-type", "")
+        return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    @staticmethod
+    def _contar(codificacion: str, original: int, comprimido: int) -> None:
+        bytes_compresion.inc(codificacion, "original", cantidad=original)
+        bytes_compresion.inc(codificacion, "comprimido", cantidad=comprimido)
@@ -0,0 +1,58 @@
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+# Control de concurrencia optimista para cirugías, pacientes y usuarios.
+#
+# Cada fila tiene una columna `version` (sql/045_version_filas.sql) que sube en 1 con cada PUT. Las
+# respuestas la incluyen (campo `version` y header ETag) y el PUT debe traerla en If-Match: el
+# UPDATE solo aplica si la versión coincide (ActualizacionTabla con version=...), así que dos
+# personas editando lo mismo no se pisan y no hace falta bloquear la fila mientras editan.
+#
+#   sin If-Match           -> 428 Precondition Required
+#   versión distinta       -> 412 Precondition Failed (con el ETag de la versión actual)
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def version_if_match(if_match: Optional[str] = Header(None)) -> int:
+    """Dependencia de los PUT: versión (entero) del header If-Match."""
+    if not if_match or not if_match.strip():
+        raise HTTPException(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="Falta el header If-Match con la versión (ETag) del registro que se está editando.",
+        )
+    valor = if_match.strip()
+    if valor == "*":
+        raise HTTPException(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="If-Match debe indicar la versión (ETag) del registro; no se acepta '*'.",
+        )
+    # If-Match compara en forma fuerte: un ETag débil (W/"3") o mal formado nunca coincide
+    try:
+        if valor.startswith("W/"):
+            raise ValueError(valor)
+        return int(valor.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"La versión de If-Match ({valor[:40]}) no es válida para este registro.",
+        )
+
+
+def error_actualizacion(cursor, detalle_no_encontrado: str) -> HTTPException:
+    """
+    Para cuando el UPDATE con versión no devolvió fila: lee el segundo resultado de la misma
+    sentencia (la versión actual). Sin fila es un 404; con fila, la versión no coincidía (412).
+    Se devuelve la excepción para que el router haga rollback después de leer el resultado.
+    """
+    actual = cursor.fetchone() if cursor.nextset() else None
+    if actual is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detalle_no_encontrado)
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"El registro fue modificado por otra persona (versión actual {actual[0]}). Vuelva a cargarlo y repita el cambio.",
+        headers={"ETag": etag(actual[0])},
+    )
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.database import abrir_conexion
+
+# Pipeline de eventos con bandeja de salida (tabla EventosSalida, ver sql/038_eventos_salida.sql).
+#
+# - publicar_evento() inserta el evento con el cursor del router, dentro de su transacción: si el
+#   cambio se confirma, el evento también; si se revierte, el evento no existe.
+# - Un hilo (ProcesadorEventos) toma lotes de eventos pendientes y llama a los suscriptores
+#   registrados con @suscribir. Cada suscriptor corre en su propia transacción junto con el registro
+#   en EventosProcesados, de modo que un reintento solo repite los suscriptores que fallaron.
+# - Entrega al menos una vez: los suscriptores deben ser idempotentes.
+
+SEGUNDOS_ENTRE_SONDEOS = float(os.getenv("EVENTOS_SEGUNDOS_ENTRE_SONDEOS", "5"))
+# Tiempo que un evento tomado queda reservado para el worker que lo tomó
+SEGUNDOS_BLOQUEO = 60
+EVENTOS_POR_LOTE = 50
+MAX_INTENTOS = 10
+
+# Un suscriptor recibe (cursor, datos) y puede devolver una acción a ejecutar después del commit
+# (ej. actualizar cachés en memoria con lo que quedó confirmado).
+Suscriptor = Callable[[Any, Dict[str, Any]], Optional[Callable[[], None]]]
+
+_suscriptores: Dict[str, List[Tuple[str, Suscriptor]]] = {}
+
+# UPDLOCK + HOLDLOCK: la verificación toma un bloqueo de rango sobre la clave hasta el fin de la
+# transacción, así dos publicaciones concurrentes del mismo evento no llegan ambas al INSERT (la
+# segunda espera y no inserta nada, en vez de chocar con el índice único y fallar la transacción).
+QUERY_PUBLICAR = """
+    INSERT INTO EventosSalida (tipo, clave_idempotencia, datos)
+    SELECT ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM EventosSalida WITH (UPDLOCK, HOLDLOCK) WHERE clave_idempotencia = ?)
+"""
+# READPAST: varios workers pueden tomar lotes a la vez sin bloquearse ni tomar el mismo evento
+QUERY_TOMAR_LOTE = """
+    WITH lote AS (
+        SELECT TOP (?) id_evento, tipo, datos, intentos, disponible_desde
+        FROM EventosSalida WITH (READPAST, UPDLOCK, ROWLOCK)
+        WHERE procesado_dt IS NULL AND disponible_desde <= SYSUTCDATETIME() AND intentos < ?
+        ORDER BY id_evento
+    )
+    UPDATE lote
+    SET intentos = intentos + 1, disponible_desde = DATEADD(second, ?, SYSUTCDATETIME())
+    OUTPUT INSERTED.id_evento, INSERTED.tipo, INSERTED.datos, INSERTED.intentos;
+"""
+
+
+def suscribir(tipo: str, nombre: Optional[str] = None):
+    """Decorador que registra un suscriptor para un tipo de evento. `nombre` debe ser estable entre versiones."""
+    def registrar(suscriptor: Suscriptor) -> Suscriptor:
+        _suscriptores.setdefault(tipo, []).append((nombre or suscriptor.__name__, suscriptor))
+        return suscriptor
+    return registrar
+
+
+def publicar_evento(cursor, tipo: str, clave_idempotencia: str, datos: Dict[str, Any]) -> None:
+    """
+    Publica un evento en la transacción de quien llama. Tras el commit conviene llamar a
+    procesador_eventos.notificar() para no esperar al siguiente sondeo.
+    """
+    contenido = json.dumps(datos, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+    cursor.execute(QUERY_PUBLICAR, tipo, clave_idempotencia, contenido, clave_idempotencia)
+
+
+class ProcesadorEventos:
+    def __init__(self):
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ejecutar, name="procesador-eventos", daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        self._despertar.set()
+
+    def notificar(self) -> None:
+        """Despierta al worker (hay eventos recién confirmados)."""
+        self._despertar.set()
+
+    def _ejecutar(self) -> None:
+        conn = None
+        while not self._detener.is_set():
+            procesados = 0
+            try:
+                if conn is None:
+                    conn = abrir_conexion()
+                procesados = self.procesar_lote(conn)
+            except Exception as e:
+                print(f"Error en el procesador de eventos: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+            if procesados < EVENTOS_POR_LOTE:
+                self._despertar.wait(SEGUNDOS_ENTRE_SONDEOS)
+                self._despertar.clear()
+        if conn is not None:
+            conn.close()
+
+    def procesar_lote(self, conn) -> int:
+        """Toma y procesa un lote de eventos. Devuelve cuántos eventos tomó."""
+        with conn.cursor() as cursor:
+            cursor.execute(QUERY_TOMAR_LOTE, EVENTOS_POR_LOTE, MAX_INTENTOS, SEGUNDOS_BLOQUEO)
+            eventos = cursor.fetchall()
+            conn.commit()
+            for id_evento, tipo, datos, intentos in eventos:
+                self._procesar_evento(conn, cursor, id_evento, tipo, json.loads(datos), intentos)
+        return len(eventos)
+
+    def _procesar_evento(self, conn, cursor, id_evento: int, tipo: str, datos: Dict[str, Any], intentos: int) -> None:
+        cursor.execute("SELECT suscriptor FROM EventosProcesados WHERE id_evento = ?", id_evento)
+        ya_procesados = {fila[0] for fila in cursor.fetchall()}
+
+        for nombre, suscriptor in _suscriptores.get(tipo, []):
+            if nombre in ya_procesados:
+                continue
+            try:
+                despues_del_commit = suscriptor(cursor, datos)
+                cursor.execute("INSERT INTO EventosProcesados (id_evento, suscriptor) VALUES (?, ?)", id_evento, nombre)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                # Reintento con espera exponencial (10 s, 20 s, 40 s, ... hasta 1 hora)
+                espera = min(3600, 10 * 2 ** (intentos - 1))
+                cursor.execute(
+                    "UPDATE EventosSalida SET ultimo_error = ?, disponible_desde = DATEADD(second, ?, SYSUTCDATETIME()) WHERE id_evento = ?",
+                    f"{nombre}: {str(e)[:900]}", espera, id_evento,
+                )
+                conn.commit()
+                print(f"Error procesando evento {id_evento} ({tipo}) en '{nombre}' (intento {intentos}): {e}")
+                return
+            if despues_del_commit is not None:
+                try:
+                    despues_del_commit()
+                except Exception as e:
+                    print(f"Error en acción posterior del evento {id_evento} ({nombre}): {e}")
+
+        cursor.execute("UPDATE EventosSalida SET procesado_dt = SYSUTCDATETIME(), ultimo_error = NULL WHERE id_evento = ?", id_evento)
+        conn.commit()
+
+
+procesador_eventos = ProcesadorEventos()
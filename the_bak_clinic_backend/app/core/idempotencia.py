@@ -0,0 +1,309 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.tokens import TokenInvalido, usuario_desde_token
+from app.database import conexion_pool
+
+# Idempotency-Key para los POST (crear cirugía, paciente, usuario, tarea...).
+#
+# El frontend manda una clave por operación; si la reintenta (timeout, doble clic), el mismo POST
+# con la misma clave devuelve la respuesta original en vez de crear un duplicado. La clave es por
+# usuario y va atada a la solicitud (método, ruta y cuerpo): reutilizarla con otra es un 422.
+#
+# Almacenamiento en dos niveles: una caché LRU del proceso para las repeticiones inmediatas y la
+# tabla SolicitudesIdempotentes (sql/046) para que la clave valga entre workers y reinicios.
+#
+# Duplicados concurrentes: en el mismo proceso, el segundo espera en un asyncio.Event a que
+# termine el primero; entre procesos, la fila "en curso" de la tabla hace de candado y el segundo
+# consulta cada tanto con asyncio.sleep. En ningún caso se ocupa una conexión ni un hilo
+# mientras se espera. Si pasada la espera máxima sigue en curso, se responde 409 con Retry-After.
+
+RETENCION_SEGUNDOS = int(float(os.getenv("IDEMPOTENCIA_RETENCION_HORAS", "24")) * 3600)
+# Plazo de la fila "en curso": si el worker que la tomó se cae, otro la retoma al vencer
+PLAZO_EN_CURSO_SEGUNDOS = 60
+ESPERA_MAXIMA_SEGUNDOS = 10.0
+LARGO_MAXIMO_CLAVE = 100
+# Cada cuántas respuestas guardadas se borran las filas vencidas
+LIMPIEZA_CADA = 500
+
+# POST que solo leen (POST /batch): repetirlos es inofensivo y sus respuestas no se guardan
+RUTAS_SIN_IDEMPOTENCIA = frozenset({"/batch"})
+
+# Respuestas que dependen de las credenciales o del momento y no de la solicitud: no se guardan
+CODIGOS_NO_GUARDADOS = frozenset({401, 403, 408, 429})
+
+# Headers de la respuesta original que se repiten: ETag para el If-Match siguiente (app/core/concurrencia.py)
+# y Location del recurso creado. Los demás los agregan los middlewares de afuera en cada respuesta.
+HEADERS_REPETIDOS = frozenset({b"content-type", b"etag", b"location"})
+
+
+class RespuestaGuardada(NamedTuple):
+    huella: bytes
+    codigo: int
+    headers: Tuple[Tuple[bytes, bytes], ...]
+    cuerpo: bytes
+
+
+def _headers_a_texto(headers: Tuple[Tuple[bytes, bytes], ...]) -> str:
+    return json.dumps([[nombre.decode("latin-1"), valor.decode("latin-1")] for nombre, valor in headers])
+
+
+def _headers_de_texto(texto: Optional[str]) -> Tuple[Tuple[bytes, bytes], ...]:
+    return tuple((nombre.encode("latin-1"), valor.encode("latin-1")) for nombre, valor in json.loads(texto or "[]"))
+
+
+class AlmacenIdempotencia:
+    """Tabla SolicitudesIdempotentes. Cada método toma una conexión del pool (corre en el threadpool)."""
+
+    _RECLAMAR = """
+        SET NOCOUNT ON;
+        MERGE SolicitudesIdempotentes WITH (HOLDLOCK) AS destino
+        USING (SELECT ? AS id_usuario, ? AS clave) AS origen
+        ON destino.id_usuario = origen.id_usuario AND destino.clave = origen.clave
+        WHEN MATCHED AND destino.expira_dt < SYSUTCDATETIME() THEN
+            UPDATE SET huella = ?, codigo = NULL, headers = NULL, cuerpo = NULL,
+                       expira_dt = DATEADD(SECOND, ?, SYSUTCDATETIME())
+        WHEN NOT MATCHED THEN
+            INSERT (id_usuario, clave, huella, expira_dt)
+            VALUES (origen.id_usuario, origen.clave, ?, DATEADD(SECOND, ?, SYSUTCDATETIME()));
+        IF @@ROWCOUNT = 0
+            SELECT huella, codigo, headers, cuerpo
+            FROM SolicitudesIdempotentes WHERE id_usuario = ? AND clave = ?
+    """
+
+    def __init__(self):
+        self._guardadas = 0
+
+    def reclamar(self, id_usuario: int, clave: str, huella: bytes) -> Optional[tuple]:
+        """
+        Toma la clave para procesar la solicitud (None) o devuelve la fila que ya existe:
+        (huella, codigo, headers, cuerpo), con codigo None si otro worker la está procesando.
+        """
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(self._RECLAMAR, id_usuario, clave, huella, PLAZO_EN_CURSO_SEGUNDOS,
+                               huella, PLAZO_EN_CURSO_SEGUNDOS, id_usuario, clave, etiqueta="idempotencia.reclamar")
+                fila = cursor.fetchone() if cursor.description else None
+                conn.commit()
+        return tuple(fila) if fila else None
+
+    def guardar(self, id_usuario: int, clave: str, respuesta: RespuestaGuardada) -> None:
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE SolicitudesIdempotentes
+                    SET codigo = ?, headers = ?, cuerpo = ?, expira_dt = DATEADD(SECOND, ?, SYSUTCDATETIME())
+                    WHERE id_usuario = ? AND clave = ? AND huella = ?
+                    """,
+                    respuesta.codigo, _headers_a_texto(respuesta.headers), zlib.compress(respuesta.cuerpo), RETENCION_SEGUNDOS,
+                    id_usuario, clave, respuesta.huella, etiqueta="idempotencia.guardar",
+                )
+                self._guardadas += 1
+                if self._guardadas % LIMPIEZA_CADA == 0:
+                    cursor.execute("DELETE TOP (1000) FROM SolicitudesIdempotentes WHERE expira_dt < SYSUTCDATETIME()",
+                                   etiqueta="idempotencia.limpieza")
+                conn.commit()
+
+    def liberar(self, id_usuario: int, clave: str) -> None:
+        """Suelta una clave en curso cuya respuesta no se guarda (5xx, 401...): el reintento se procesa de nuevo."""
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM SolicitudesIdempotentes WHERE id_usuario = ? AND clave = ? AND codigo IS NULL",
+                    id_usuario, clave, etiqueta="idempotencia.liberar",
+                )
+                conn.commit()
+
+
+def _respuesta_de_fila(fila: tuple) -> RespuestaGuardada:
+    huella, codigo, headers, cuerpo = fila
+    return RespuestaGuardada(bytes(huella), codigo, _headers_de_texto(headers), zlib.decompress(cuerpo) if cuerpo else b"")
+
+
+class IdempotenciaMiddleware:
+    """
+    Middleware ASGI para los POST con header Idempotency-Key de usuarios autenticados. Sin el header
+    (o sin token válido, que de todos modos termina en 401) el request pasa sin cambios.
+    """
+
+    def __init__(self, app, almacen: Optional[AlmacenIdempotencia] = None):
+        self.app = app
+        self.almacen = almacen or AlmacenIdempotencia()
+        self.cache = TTLCache(max_entradas=4096, ttl_segundos=RETENCION_SEGUNDOS, nombre="idempotencia")
+        # (usuario, clave) -> evento que se marca cuando termina el request que la procesa en este proceso
+        self._en_curso: Dict[Tuple[int, str], asyncio.Event] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] in RUTAS_SIN_IDEMPOTENCIA:
+            await self.app(scope, receive, send)
+            return
+        clave, id_usuario = self._clave_y_usuario(scope)
+        if clave is None or id_usuario is None:
+            await self.app(scope, receive, send)
+            return
+        if not clave or len(clave) > LARGO_MAXIMO_CLAVE:
+            await self._responder_error(send, 400, f"Idempotency-Key debe tener entre 1 y {LARGO_MAXIMO_CLAVE} caracteres.")
+            return
+
+        cuerpo = await self._leer_cuerpo(receive)
+        huella = hashlib.sha256(b"\0".join((b"POST", scope["path"].encode(), scope.get("query_string", b""), cuerpo))).digest()
+        llave = (id_usuario, clave)
+        limite = time.monotonic() + ESPERA_MAXIMA_SEGUNDOS
+
+        # Mismo proceso: esperar al request que ya la está procesando y responder lo que guardó
+        while True:
+            guardada = self.cache.get(llave)
+            if guardada is not None:
+                await self._repetir(send, guardada, huella)
+                return
+            evento = self._en_curso.get(llave)
+            if evento is None:
+                break
+            try:
+                await asyncio.wait_for(evento.wait(), max(0.0, limite - time.monotonic()))
+            except asyncio.TimeoutError:
+                await self._responder_en_curso(send)
+                return
+            # Si el primero guardó respuesta se repite; si no (error 5xx) se vuelve a mirar _en_curso,
+            # porque otro de los que esperaban puede haber tomado la clave antes que este
+
+        evento = self._en_curso[llave] = asyncio.Event()
+        try:
+            # Entre procesos: la fila de la tabla decide quién procesa
+            espera = 0.05
+            while True:
+                try:
+                    existente = await run_in_threadpool(self.almacen.reclamar, id_usuario, clave, huella)
+                except Exception as e:
+                    # Sin la tabla (BD caída o migración pendiente) queda la protección del proceso
+                    print(f"Idempotencia: no se pudo reclamar la clave en la BD: {e}")
+                    existente = None
+                if existente is None:
+                    break
+                if existente[1] is not None:
+                    guardada = _respuesta_de_fila(existente)
+                    self.cache.set(llave, guardada)
+                    await self._repetir(send, guardada, huella)
+                    return
+                if bytes(existente[0]) != huella:
+                    await self._responder_error(send, 422, "La Idempotency-Key ya se usó con otra solicitud.")
+                    return
+                if time.monotonic() >= limite:
+                    await self._responder_en_curso(send)
+                    return
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 1.0)
+
+            await self._procesar(scope, send, cuerpo, llave, huella)
+        finally:
+            if self._en_curso.get(llave) is evento:
+                del self._en_curso[llave]
+            evento.set()
+
+    async def _procesar(self, scope, send, cuerpo: bytes, llave: Tuple[int, str], huella: bytes) -> None:
+        inicio: List[dict] = []
+        partes: List[bytes] = []
+
+        async def recibir():
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                inicio.append(mensaje)
+            elif mensaje["type"] == "http.response.body":
+                partes.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        id_usuario, clave = llave
+        try:
+            await self.app(scope, recibir, enviar)
+        except BaseException:
+            await self._liberar(id_usuario, clave)
+            raise
+
+        codigo = inicio[0]["status"] if inicio else 500
+        if codigo >= 500 or codigo in CODIGOS_NO_GUARDADOS:
+            await self._liberar(id_usuario, clave)
+            return
+        headers = tuple(
+            (nombre.lower(), valor) for nombre, valor in inicio[0].get("headers", []) if nombre.lower() in HEADERS_REPETIDOS
+        )
+        guardada = RespuestaGuardada(huella, codigo, headers, b"".join(partes))
+        self.cache.set(llave, guardada)
+        try:
+            await run_in_threadpool(self.almacen.guardar, id_usuario, clave, guardada)
+        except Exception as e:
+            print(f"Idempotencia: no se pudo guardar la respuesta en la BD: {e}")
+
+    async def _liberar(self, id_usuario: int, clave: str) -> None:
+        try:
+            await run_in_threadpool(self.almacen.liberar, id_usuario, clave)
+        except Exception as e:
+            print(f"Idempotencia: no se pudo liberar la clave en la BD: {e}")
+
+    @staticmethod
+    def _clave_y_usuario(scope) -> Tuple[Optional[str], Optional[int]]:
+        clave = autorizacion = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"idempotency-key":
+                clave = valor.decode("latin-1").strip()
+            elif nombre == b"authorization":
+                autorizacion = valor.decode("latin-1")
+        if clave is None or autorizacion is None:
+            return clave, None
+        esquema, _, token = autorizacion.partition(" ")
+        if esquema.lower() != "bearer" or not token:
+            return clave, None
+        try:
+            # Usa la caché de tokens verificados, igual que el límite de tasa
+            return clave, usuario_desde_token(token).id_usuario
+        except TokenInvalido:
+            return clave, None
+
+    @staticmethod
+    async def _leer_cuerpo(receive) -> bytes:
+        partes = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                break
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                break
+        return b"".join(partes)
+
+    async def _repetir(self, send, guardada: RespuestaGuardada, huella: bytes) -> None:
+        if guardada.huella != huella:
+            await self._responder_error(send, 422, "La Idempotency-Key ya se usó con otra solicitud.")
+            return
+        headers = [
+            (b"content-length", str(len(guardada.cuerpo)).encode()),
+            (b"idempotent-replayed", b"true"),
+            *guardada.headers,
+        ]
+        await send({"type": "http.response.start", "status": guardada.codigo, "headers": headers})
+        await send({"type": "http.response.body", "body": guardada.cuerpo})
+
+    @staticmethod
+    async def _responder_error(send, codigo: int, detalle: str, headers: Optional[List[tuple]] = None) -> None:
+        cuerpo = json.dumps({"detail": detalle}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": codigo,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode())] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    async def _responder_en_curso(self, send) -> None:
+        await self._responder_error(
+            send, 409, "Una solicitud con la misma Idempotency-Key todavía se está procesando.", [(b"retry-after", b"1")],
+        )
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.tokens import TokenInvalido, usuario_desde_token
+
+# Limitador de tasa por token bucket: cada clave (IP o usuario + clase de ruta) tiene un balde con
+# `capacidad` fichas que se rellena a `capacidad / periodo` fichas por segundo. Cada request
+# consume una ficha; si no quedan se responde 429 con Retry-After.
+#
+# Límites configurables por entorno con formato "requests/segundos" (p. ej. "10/60").
+LIMITES_POR_DEFECTO = {
+    "login": os.getenv("LIMITE_TASA_LOGIN", "10/60"),          # por IP: frena credential stuffing
+    # por email enviado, desde cualquier IP: frena el ataque a una cuenta repartido entre muchas IPs
+    "login_usuario": os.getenv("LIMITE_TASA_LOGIN_USUARIO", "10/300"),
+    "lectura": os.getenv("LIMITE_TASA_LECTURA", "600/60"),     # por usuario (o IP si es anónimo)
+    "escritura": os.getenv("LIMITE_TASA_ESCRITURA", "120/60"),
+}
+# Detrás del proxy de Azure la IP real viene en X-Forwarded-For. Cada proxy agrega al final la IP de
+# quien se le conectó y lo que está más a la izquierda lo escribe el cliente, así que la IP confiable
+# es la que agregó el primero de nuestros proxies: la N-ésima desde la derecha, con N la cantidad de
+# proxies propios delante de la API. 0 = no usar el header. LIMITE_TASA_CONFIAR_X_FORWARDED_FOR=1
+# (configuración anterior) equivale a un proxy.
+PROXIES_CONFIABLES = int(os.getenv("LIMITE_TASA_PROXIES_CONFIABLES") or os.getenv("LIMITE_TASA_CONFIAR_X_FORWARDED_FOR") or "0")
+# Backend compartido entre workers (opcional). Sin él, cada proceso limita por su cuenta.
+URL_REDIS = os.getenv("LIMITE_TASA_REDIS_URL")
+
+RUTAS_EXENTAS = frozenset({"/", "/docs", "/openapi.json", "/redoc", "/metrics", "/health/ready"})
+# POST que solo leen: cuentan contra el límite de lectura (/batch cobra además sus sub-solicitudes,
+# ver app/routers/batch.py)
+RUTAS_POST_LECTURA = frozenset({"/batch"})
+
+
+def parsear_limite(texto: str) -> Tuple[float, float]:
+    """'10/60' -> (capacidad=10, fichas por segundo=10/60)."""
+    cantidad, _, segundos = texto.partition("/")
+    capacidad = float(cantidad)
+    return capacidad, capacidad / float(segundos or 1)
+
+
+class BackendMemoria:
+    """
+    Baldes en un dict del proceso, ordenado del menos al más recientemente usado. Costo O(1) por
+    request; al llegar a max_claves se descartan los más antiguos para que la memoria no crezca con
+    IPs que no vuelven.
+    """
+
+    def __init__(self, max_claves: int = 100000, segundos_inactividad: float = 600):
+        self._baldes: "OrderedDict[str, List[float]]" = OrderedDict()  # clave -> [fichas, último relleno]
+        self._lock = threading.Lock()
+        self.max_claves = max_claves
+        # Debe superar el tiempo de relleno completo de cualquier límite configurado
+        self.segundos_inactividad = segundos_inactividad
+
+    async def consumir(self, clave: str, capacidad: float, tasa: float, costo: float = 1.0) -> float:
+        """Consume `costo` fichas. Devuelve 0 si se permitió, o los segundos que faltan para poder hacerlo."""
+        ahora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(clave)
+            if balde is None:
+                if len(self._baldes) >= self.max_claves:
+                    self._purgar(ahora)
+                balde = self._baldes[clave] = [capacidad, ahora]
+            else:
+                balde[0] = min(capacidad, balde[0] + (ahora - balde[1]) * tasa)
+                balde[1] = ahora
+                self._baldes.move_to_end(clave)
+            if balde[0] >= costo:
+                balde[0] -= costo
+                return 0.0
+            return (costo - balde[0]) / tasa
+
+    def _purgar(self, ahora: float) -> None:
+        # Un balde que ya se habría rellenado por completo equivale a uno nuevo: se puede descartar.
+        # Los inactivos están al principio, así que se recorre solo lo que se borra.
+        while self._baldes:
+            clave, (_, ultimo) = next(iter(self._baldes.items()))
+            if ahora - ultimo <= self.segundos_inactividad:
+                break
+            del self._baldes[clave]
+        # Si todos están activos se descarta el usado hace más tiempo; los que están limitando a
+        # alguien ahora mismo son los más recientes y se conservan
+        if len(self._baldes) >= self.max_claves:
+            self._baldes.popitem(last=False)
+
+
+class BackendRedis:
+    """
+    Baldes en Redis para compartir los límites entre workers/instancias. El relleno y el consumo
+    se hacen en un script Lua, así cada request es un solo round trip atómico.
+    """
+
+    _SCRIPT = """
+local capacidad = tonumber(ARGV[1])
+local tasa = tonumber(ARGV[2])
+local ahora = tonumber(ARGV[3])
+local costo = tonumber(ARGV[4])
+local datos = redis.call('HMGET', KEYS[1], 'f', 'u')
+local fichas = tonumber(datos[1]) or capacidad
+local ultimo = tonumber(datos[2]) or ahora
+fichas = math.min(capacidad, fichas + math.max(0, ahora - ultimo) * tasa)
+local espera = 0
+if fichas >= costo then fichas = fichas - costo else espera = (costo - fichas) / tasa end
+redis.call('HSET', KEYS[1], 'f', fichas, 'u', ahora)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacidad / tasa * 1000))
+return tostring(espera)
+"""
+
+    def __init__(self, url: str, prefijo: str = "limite_tasa:"):
+        import redis.asyncio as redis_asyncio  # Dependencia opcional, solo con LIMITE_TASA_REDIS_URL
+
+        self._cliente = redis_asyncio.from_url(url)
+        self._script = self._cliente.register_script(self._SCRIPT)
+        self.prefijo = prefijo
+
+    async def consumir(self, clave: str, capacidad: float, tasa: float, costo: float = 1.0) -> float:
+        espera = await self._script(keys=[self.prefijo + clave], args=[capacidad, tasa, time.time(), costo])
+        return float(espera)
+
+
+def crear_backend():
+    return BackendRedis(URL_REDIS) if URL_REDIS else BackendMemoria()
+
+
+# Backend del middleware y de los cobros que hacen los endpoints cuando conocen algo que el middleware
+# no ve (el email del formulario de login, la cantidad de sub-solicitudes de un /batch)
+backend_limites = crear_backend()
+_LIMITES = {clase: parsear_limite(texto) for clase, texto in LIMITES_POR_DEFECTO.items()}
+_MENSAJE_429 = "Demasiadas solicitudes. Intente nuevamente más tarde."
+
+
+async def limitar_login_por_usuario(username: str) -> None:
+    """Cuenta un intento de login contra el email enviado; lanza 429 si ese email superó su límite."""
+    # La clave va con hash: los emails no quedan en claro en memoria ni en Redis
+    usuario = hashlib.blake2b(username.strip().lower().encode("utf-8"), digest_size=16).hexdigest()
+    await cobrar("login_usuario", f"email:{usuario}")
+
+
+async def cobrar(clase: str, identidad: str, costo: float = 1.0) -> None:
+    """Consume `costo` fichas del balde de `identidad` en `clase`; lanza 429 si no alcanzan."""
+    capacidad, tasa = _LIMITES[clase]
+    espera = await backend_limites.consumir(f"{clase}:{identidad}", capacidad, tasa, costo)
+    if espera > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=_MENSAJE_429,
+            headers={"Retry-After": str(max(1, math.ceil(espera)))},
+        )
+
+
+class LimiteTasaMiddleware:
+    """
+    Middleware ASGI (sin BaseHTTPMiddleware, para no envolver cada respuesta) que aplica:
+    - POST /auth/login: límite por IP (el límite por email lo aplica el endpoint con
+      limitar_login_por_usuario).
+    - Resto de las rutas: límite por usuario del token (o por IP si no hay token válido),
+      separado en lectura (GET/HEAD) y escritura.
+    """
+
+    def __init__(self, app, backend=None, limites: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.backend = backend or backend_limites
+        self.limites = {clase: parsear_limite(texto) for clase, texto in limites.items()} if limites else _LIMITES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in RUTAS_EXENTAS:
+            await self.app(scope, receive, send)
+            return
+
+        clase, clave = self._clasificar(scope)
+        capacidad, tasa = self.limites[clase]
+        espera = await self.backend.consumir(f"{clase}:{clave}", capacidad, tasa)
+        if espera > 0:
+            await self._responder_429(send, espera)
+            return
+        await self.app(scope, receive, send)
+
+    def _clasificar(self, scope) -> Tuple[str, str]:
+        if scope["path"].rstrip("/") == "/auth/login":
+            return "login", "ip:" + self._ip_cliente(scope)
+        lectura = scope["method"] in ("GET", "HEAD") or scope["path"] in RUTAS_POST_LECTURA
+        clase = "lectura" if lectura else "escritura"
+        return clase, self._identidad(scope)
+
+    def _identidad(self, scope) -> str:
+        for nombre, valor in scope["headers"]:
+            if nombre == b"authorization":
+                esquema, _, token = valor.decode("latin-1").partition(" ")
+                if esquema.lower() == "bearer" and token:
+                    try:
+                        # Usa la caché de tokens verificados: normalmente un hash y un acceso a dict
+                        return f"usuario:{usuario_desde_token(token).id_usuario}"
+                    except TokenInvalido:
+                        pass
+                break
+        return "ip:" + self._ip_cliente(scope)
+
+    @staticmethod
+    def _ip_cliente(scope) -> str:
+        if PROXIES_CONFIABLES:
+            # Varios headers X-Forwarded-For equivalen a uno con sus valores unidos por comas
+            entradas = [
+                entrada.strip()
+                for nombre, valor in scope["headers"] if nombre == b"x-forwarded-for"
+                for entrada in valor.decode("latin-1").split(",") if entrada.strip()
+            ]
+            if entradas:
+                # Con menos entradas que proxies, todas las escribieron proxies propios
+                return entradas[-PROXIES_CONFIABLES] if len(entradas) >= PROXIES_CONFIABLES else entradas[0]
+        cliente = scope.get("client")
+        return cliente[0] if cliente else "desconocido"
+
+    @staticmethod
+    async def _responder_429(send, espera: float) -> None:
+        cuerpo = json.dumps({"detail": _MENSAJE_429}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(max(1, math.ceil(espera))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
@@ -0,0 +1,233 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from app.core.cache import TTLCache, caches_registradas
+
+# Métricas del proceso en formato de texto de Prometheus (GET /metrics).
+#
+# Camino caliente sin locks: cada hilo escribe en su propio fragmento (un dict por hilo y métrica)
+# y solo el scrape recorre y suma los fragmentos. Registrar un valor cuesta un getattr de
+# threading.local y una actualización de dict, menos de un microsegundo.
+#
+# Las métricas son por proceso: con varios workers de uvicorn, cada uno expone las suyas y
+# Prometheus las distingue por instancia.
+
+# Límites (segundos) por defecto de los histogramas de duración
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Etiquetas = Tuple[str, ...]
+
+_registradas: List["_Metrica"] = []
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(nombres: Sequence[str], valores: Sequence, extra: str = "") -> str:
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatear_numero(valor: float) -> str:
+    if isinstance(valor, float):
+        if math.isinf(valor):
+            return "+Inf" if valor > 0 else "-Inf"
+        return repr(valor)
+    return str(valor)
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        _registradas.append(self)
+
+    def lineas(self) -> List[str]:
+        raise NotImplementedError
+
+    def exponer(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"] + self.lineas()
+
+
+class _PorHilo(_Metrica):
+    """Base de las métricas fragmentadas por hilo."""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._local = threading.local()
+        self._fragmentos: List[dict] = []
+        self._lock = threading.Lock()  # solo para registrar el fragmento de un hilo nuevo
+
+    def _fragmento(self) -> dict:
+        fragmento = getattr(self._local, "datos", None)
+        if fragmento is None:
+            fragmento = self._local.datos = {}
+            with self._lock:
+                self._fragmentos.append(fragmento)
+        return fragmento
+
+
+class Contador(_PorHilo):
+    tipo = "counter"
+
+    def inc(self, *valores_etiquetas, cantidad: float = 1) -> None:
+        fragmento = self._fragmento()
+        fragmento[valores_etiquetas] = fragmento.get(valores_etiquetas, 0) + cantidad
+
+    def valores(self) -> Dict[tuple, float]:
+        total: Dict[tuple, float] = {}
+        for fragmento in list(self._fragmentos):
+            for clave, valor in list(fragmento.items()):
+                total[clave] = total.get(clave, 0) + valor
+        return total
+
+    def lineas(self) -> List[str]:
+        valores = self.valores()
+        if not valores and not self.etiquetas:
+            return [f"{self.nombre} 0"]
+        return [
+            f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}"
+            for clave, valor in sorted(valores.items())
+        ]
+
+
+class Medidor(Contador):
+    """Valor que sube y baja (ej. requests en curso). inc/dec pueden ocurrir en hilos distintos."""
+    tipo = "gauge"
+
+    def dec(self, *valores_etiquetas, cantidad: float = 1) -> None:
+        self.inc(*valores_etiquetas, cantidad=-cantidad)
+
+
+class Histograma(_PorHilo):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = (), limites: Sequence[float] = LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+
+    def observar(self, valor: float, *valores_etiquetas) -> None:
+        fragmento = self._fragmento()
+        datos = fragmento.get(valores_etiquetas)
+        if datos is None:
+            # Un conteo por bucket (el último es +Inf) y la suma al final
+            datos = fragmento[valores_etiquetas] = [0] * (len(self.limites) + 1) + [0.0]
+        datos[bisect_left(self.limites, valor)] += 1
+        datos[-1] += valor
+
+    def valores(self) -> Dict[tuple, List[float]]:
+        total: Dict[tuple, List[float]] = {}
+        for fragmento in list(self._fragmentos):
+            for clave, datos in list(fragmento.items()):
+                acumulado = total.get(clave)
+                if acumulado is None:
+                    total[clave] = list(datos)
+                else:
+                    for i, valor in enumerate(datos):
+                        acumulado[i] += valor
+        return total
+
+    def lineas(self) -> List[str]:
+        lineas = []
+        for clave, datos in sorted(self.valores().items()):
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (math.inf,), datos):
+                acumulado += conteo
+                le = 'le="' + _formatear_numero(float(limite)) + '"'
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_numero(datos[-1])}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+class MedidorFuncion(_Metrica):
+    """Métrica calculada al momento del scrape (tamaños de cachés, colas, etc.)."""
+
+    def __init__(
+        self, nombre: str, ayuda: str, funcion: Callable[[], Union[float, Dict[tuple, float]]],
+        etiquetas: Etiquetas = (), tipo: str = "gauge",
+    ):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def lineas(self) -> List[str]:
+        valor = self.funcion()
+        if not isinstance(valor, dict):
+            return [f"{self.nombre} {_formatear_numero(valor)}"]
+        return [
+            f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(v)}"
+            for clave, v in sorted(valor.items())
+        ]
+
+
+def exposicion() -> str:
+    """Todas las métricas registradas, en formato de texto de Prometheus (version=0.0.4)."""
+    lineas: List[str] = []
+    for metrica in list(_registradas):
+        try:
+            lineas.extend(metrica.exponer())
+        except Exception as e:
+            # Una métrica rota no debe tumbar el scrape de las demás
+            print(f"Error exponiendo la métrica {metrica.nombre}: {e}")
+    return "\n".join(lineas) + "\n"
+
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Métricas de la API ---
+
+solicitudes_http = Contador(
+    "bak_http_solicitudes_total", "Requests atendidos por ruta, método y código de estado",
+    ("metodo", "ruta", "estado"),
+)
+duracion_http = Histograma(
+    "bak_http_duracion_segundos", "Duración de los requests hasta el inicio de la respuesta",
+    ("metodo", "ruta"),
+)
+fases_http = Contador(
+    "bak_http_fase_segundos_total", "Tiempo acumulado por fase (db_conexion, db_consulta, mapeo, app)",
+    ("ruta", "fase"),
+)
+solicitudes_en_curso = Medidor("bak_http_solicitudes_en_curso", "Requests que se están atendiendo")
+
+# --- Base de datos ---
+
+consultas_bd = Contador("bak_db_consultas_total", "Sentencias ejecutadas por etiqueta", ("etiqueta",))
+duracion_consultas_bd = Histograma(
+    "bak_db_consulta_duracion_segundos", "Duración de cada sentencia (execute + fetch) por etiqueta",
+    ("etiqueta",),
+)
+errores_consultas_bd = Contador("bak_db_errores_total", "Sentencias que fallaron por etiqueta", ("etiqueta",))
+conexiones_en_uso = Medidor("bak_db_conexiones_en_uso", "Conexiones entregadas a requests y aún no devueltas")
+duracion_conexion_bd = Histograma("bak_db_conexion_duracion_segundos", "Tiempo para obtener una conexión")
+errores_conexion_bd = Contador("bak_db_errores_conexion_total", "Intentos fallidos de obtener una conexión")
+conexiones_abiertas_bd = Contador("bak_db_conexiones_abiertas_total", "Conexiones nuevas abiertas por el pool")
+pool_agotado_bd = Contador("bak_db_pool_agotado_total", "Requests que no obtuvieron conexión del pool a tiempo (503)")
+
+
+def _por_cache(funcion: Callable[[TTLCache], float]) -> Callable[[], Dict[tuple, float]]:
+    def leer() -> Dict[tuple, float]:
+        return {(nombre,): funcion(cache) for nombre, cache in list(caches_registradas.items())}
+    return leer
+
+
+def _tasa_aciertos(cache: TTLCache) -> float:
+    total = cache.aciertos + cache.fallos
+    return cache.aciertos / total if total else 0.0
+
+
+MedidorFuncion("bak_cache_aciertos_total", "Lecturas de caché con acierto", _por_cache(lambda c: c.aciertos), ("cache",), tipo="counter")
+MedidorFuncion("bak_cache_fallos_total", "Lecturas de caché sin acierto o expiradas", _por_cache(lambda c: c.fallos), ("cache",), tipo="counter")
+MedidorFuncion("bak_cache_tasa_aciertos", "Aciertos / lecturas desde que arrancó el proceso", _por_cache(_tasa_aciertos), ("cache",))
+MedidorFuncion("bak_cache_entradas", "Entradas actualmente en la caché", _por_cache(len), ("cache",))
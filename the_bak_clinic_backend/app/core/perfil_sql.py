@@ -0,0 +1,138 @@
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from app.core import metricas
+
+# Perfil de las sentencias SQL que emiten los routers.
+#
+# Cada sentencia lleva una etiqueta estable ("cirugias.list.count"): la pasa el router con
+# cursor.execute(sql, *params, etiqueta=...) o, si no la pasa, se deriva del SQL (verbo y primera
+# tabla). Por etiqueta se acumulan ejecuciones, duración, máximo, filas, errores y sentencias
+# lentas; las que superan el umbral se registran en el log con los parámetros redactados (solo
+# tipo y largo: los valores pueden ser datos de pacientes).
+
+UMBRAL_LENTA_SEGUNDOS = float(os.getenv("SQL_UMBRAL_LENTA_MS", "500")) / 1000
+# Largo máximo del SQL en el log de sentencias lentas
+MAX_CARACTERES_SQL_LOG = 1000
+
+ORDENES_REPORTE = ("total", "promedio", "maximo", "ejecuciones", "filas")
+
+filas_bd = metricas.Contador("bak_db_filas_total", "Filas leídas o afectadas por etiqueta", ("etiqueta",))
+consultas_lentas_bd = metricas.Contador(
+    "bak_db_consultas_lentas_total", "Sentencias sobre el umbral SQL_UMBRAL_LENTA_MS por etiqueta", ("etiqueta",),
+)
+
+
+class _MaximoPorEtiqueta(metricas._PorHilo):
+    """Mayor duración vista por etiqueta (cada hilo guarda su máximo; el scrape toma el mayor)."""
+    tipo = "gauge"
+
+    def observar(self, valor: float, etiqueta: str) -> None:
+        fragmento = self._fragmento()
+        if valor > fragmento.get(etiqueta, 0.0):
+            fragmento[etiqueta] = valor
+
+    def valores(self) -> Dict[str, float]:
+        maximos: Dict[str, float] = {}
+        for fragmento in list(self._fragmentos):
+            for etiqueta, valor in list(fragmento.items()):
+                if valor > maximos.get(etiqueta, 0.0):
+                    maximos[etiqueta] = valor
+        return maximos
+
+    def lineas(self) -> List[str]:
+        return [
+            f'{self.nombre}{{etiqueta="{metricas._escapar(etiqueta)}"}} {valor!r}'
+            for etiqueta, valor in sorted(self.valores().items())
+        ]
+
+
+duracion_maxima_bd = _MaximoPorEtiqueta(
+    "bak_db_consulta_maxima_segundos", "Mayor duración de una sentencia por etiqueta desde el arranque", ("etiqueta",),
+)
+
+_TABLA_SENTENCIA = re.compile(r"\b(?:FROM|INTO|UPDATE|MERGE)\s+(?:INTO\s+)?\[?([A-Za-z_]\w*)", re.IGNORECASE)
+_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def etiqueta_sql(sql: str) -> str:
+    """Etiqueta por defecto de una sentencia sin etiquetar: verbo y primera tabla (ej. 'select.Cirugias')."""
+    palabras = sql.split(None, 1)
+    verbo = palabras[0].lower() if palabras else "vacia"
+    tabla = _TABLA_SENTENCIA.search(sql)
+    return f"{verbo}.{tabla.group(1)}" if tabla else verbo
+
+
+def redactar_parametro(valor) -> str:
+    """Describe un parámetro sin revelar su valor: tipo y, para textos y binarios, largo."""
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, (str, bytes, bytearray)):
+        return f"{type(valor).__name__}({len(valor)})"
+    if isinstance(valor, (bool, int, float, Decimal, datetime, date)):
+        return type(valor).__name__
+    if isinstance(valor, (list, tuple)):
+        return f"{type(valor).__name__}[{len(valor)}]"
+    return type(valor).__name__
+
+
+def redactar_parametros(params: Sequence) -> str:
+    # pyodbc acepta los parámetros sueltos o en una sola tupla/lista
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        params = params[0]
+    if len(params) > 20:
+        return f"[{', '.join(redactar_parametro(p) for p in params[:20])}, ... ({len(params)} en total)]"
+    return f"[{', '.join(redactar_parametro(p) for p in params)}]"
+
+
+def registrar_sentencia(etiqueta: str, sql: str, params: Sequence, duracion: float, filas: int) -> None:
+    """Acumula una sentencia terminada (execute + fetch) y la registra en el log si fue lenta."""
+    metricas.consultas_bd.inc(etiqueta)
+    metricas.duracion_consultas_bd.observar(duracion, etiqueta)
+    duracion_maxima_bd.observar(duracion, etiqueta)
+    if filas:
+        filas_bd.inc(etiqueta, cantidad=filas)
+    if duracion >= UMBRAL_LENTA_SEGUNDOS:
+        consultas_lentas_bd.inc(etiqueta)
+        texto = _ESPACIOS.sub(" ", sql).strip()[:MAX_CARACTERES_SQL_LOG]
+        print(
+            f"Consulta lenta [{etiqueta}] {duracion * 1000:.1f} ms, {filas} filas: {texto} "
+            f"| parámetros: {redactar_parametros(params)}"
+        )
+
+
+def reporte_sentencias(top: int = 20, orden: str = "total", etiqueta: Optional[str] = None) -> List[Dict]:
+    """
+    Top-N de sentencias de este proceso desde que arrancó. `orden`: total (tiempo acumulado),
+    promedio, maximo, ejecuciones o filas. `etiqueta` filtra por prefijo (ej. 'cirugias.list').
+    """
+    duraciones = metricas.duracion_consultas_bd.valores()
+    maximos = duracion_maxima_bd.valores()
+    filas = filas_bd.valores()
+    errores = metricas.errores_consultas_bd.valores()
+    lentas = consultas_lentas_bd.valores()
+
+    reporte = []
+    for (nombre,), datos in duraciones.items():
+        if etiqueta and not nombre.startswith(etiqueta):
+            continue
+        ejecuciones = sum(datos[:-1])
+        total = datos[-1]
+        reporte.append({
+            "etiqueta": nombre,
+            "ejecuciones": ejecuciones,
+            "total_ms": round(total * 1000, 2),
+            "promedio_ms": round(total * 1000 / ejecuciones, 3) if ejecuciones else 0.0,
+            "maximo_ms": round(maximos.get(nombre, 0.0) * 1000, 2),
+            "filas": int(filas.get((nombre,), 0)),
+            "errores": int(errores.get((nombre,), 0)),
+            "lentas": int(lentas.get((nombre,), 0)),
+        })
+    clave = {"total": "total_ms", "promedio": "promedio_ms", "maximo": "maximo_ms"}.get(orden, orden)
+    reporte.sort(key=lambda fila: fila[clave], reverse=True)
+    return reporte[:top]
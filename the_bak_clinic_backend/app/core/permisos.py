@@ -0,0 +1,120 @@
+import os
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+import pyodbc
+from fastapi import Depends, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.tokens import get_current_user
+from app.database import conexion_pool
+from app.schemas.user_schema import UsuarioAutenticado
+
+# Modelo de permisos: rol -> acciones permitidas sobre cada recurso (router).
+# "leer" cubre GET/HEAD/OPTIONS; "escribir" el resto de los métodos.
+# Se carga una vez al importar; cada chequeo es una búsqueda en un frozenset.
+_PERMISOS_DECLARADOS: Dict[str, Tuple[str, ...]] = {
+    "administrador": ("*",),
+    "medico": (
+        "cirugias:leer", "cirugias:escribir",
+        "pacientes:leer", "pacientes:escribir",
+        "limpieza:leer", "reportes:leer", "usuarios:leer",
+        "notificaciones:leer", "notificaciones:escribir",
+    ),
+    "enfermero": (
+        "cirugias:leer", "pacientes:leer", "pacientes:escribir",
+        "limpieza:leer", "notificaciones:leer", "notificaciones:escribir",
+    ),
+    "limpieza": (
+        "limpieza:leer", "limpieza:escribir", "cirugias:leer",
+        "notificaciones:leer", "notificaciones:escribir",
+    ),
+}
+
+PERMISOS_POR_ROL: Dict[str, FrozenSet[Tuple[str, str]]] = {
+    rol: frozenset(tuple(permiso.split(":")) for permiso in permisos if permiso != "*")
+    for rol, permisos in _PERMISOS_DECLARADOS.items()
+}
+ROLES_CON_ACCESO_TOTAL = frozenset(rol for rol, permisos in _PERMISOS_DECLARADOS.items() if "*" in permisos)
+
+_METODOS_LECTURA = frozenset({"GET", "HEAD", "OPTIONS"})
+_SIN_TILDES = str.maketrans("áéíóú", "aeiou")
+
+# Rol y estado vigentes por usuario (id -> (rol, activo)), leídos de Usuarios. El rol del token es
+# el de cuando se emitió y nunca se usa para autorizar: si el usuario no está en la caché se consulta
+# la BD. update_usuario/delete_usuario actualizan la caché al momento en su worker; en los demás el
+# cambio aplica cuando vence la entrada (PERMISOS_SEGUNDOS_CACHE).
+SEGUNDOS_CACHE_USUARIOS = float(os.getenv("PERMISOS_SEGUNDOS_CACHE", "30"))
+_usuarios = TTLCache(max_entradas=10000, ttl_segundos=SEGUNDOS_CACHE_USUARIOS, nombre="permisos_usuarios")
+
+
+def normalizar_rol(rol: Optional[str]) -> str:
+    return (rol or "").strip().lower().translate(_SIN_TILDES)
+
+
+def registrar_usuario(id_usuario: int, rol: Optional[str], activo: bool) -> None:
+    _usuarios.set(id_usuario, (normalizar_rol(rol), bool(activo)))
+
+
+def eliminar_usuario(id_usuario: int) -> None:
+    """Un usuario eliminado queda bloqueado aunque su token siga vigente."""
+    _usuarios.set(id_usuario, (None, False))
+
+
+def _cargar_usuario(id_usuario: int) -> Tuple[Optional[str], bool]:
+    with conexion_pool() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT rol, activo FROM Usuarios WHERE id_usuario = ?", id_usuario, etiqueta="permisos.usuario")
+            fila = cursor.fetchone()
+    # Si ya no existe, queda bloqueado igual que con eliminar_usuario
+    entrada = (normalizar_rol(fila[0]), bool(fila[1])) if fila else (None, False)
+    _usuarios.set(id_usuario, entrada)
+    return entrada
+
+
+async def rol_vigente(usuario: UsuarioAutenticado) -> Optional[str]:
+    """
+    Rol efectivo del usuario según Usuarios, o None si fue desactivado o eliminado. Solo consulta la
+    BD (en el threadpool) cuando no está en la caché.
+    """
+    entrada = _usuarios.get(usuario.id_usuario)
+    if entrada is None:
+        try:
+            entrada = await run_in_threadpool(_cargar_usuario, usuario.id_usuario)
+        except (pyodbc.Error, TimeoutError) as e:
+            print(f"Error cargando el rol del usuario {usuario.id_usuario}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No se pudieron verificar los permisos, intente nuevamente",
+                headers={"Retry-After": "1"},
+            )
+    rol, activo = entrada
+    return rol if activo else None
+
+
+def tiene_permiso(rol: Optional[str], recurso: str, accion: str) -> bool:
+    if rol is None:
+        return False
+    return rol in ROLES_CON_ACCESO_TOTAL or (recurso, accion) in PERMISOS_POR_ROL.get(rol, frozenset())
+
+
+@lru_cache(maxsize=None)
+def autorizar(recurso: str) -> Callable[..., UsuarioAutenticado]:
+    """
+    Crea una dependencia que exige permiso sobre `recurso`; la acción se deduce del método HTTP.
+    Uso: app.include_router(router, dependencies=[Depends(autorizar("cirugias"))])
+    Es async para correr directo en el event loop: con el usuario en caché no hace I/O y así evita el
+    salto al threadpool.
+    Se devuelve la misma dependencia por recurso, de modo que puede anularse con dependency_overrides.
+    """
+    async def dependencia(request: Request, usuario: UsuarioAutenticado = Depends(get_current_user)) -> UsuarioAutenticado:
+        accion = "leer" if request.method in _METODOS_LECTURA else "escribir"
+        rol = await rol_vigente(usuario)
+        if rol is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario inactivo o eliminado.", headers={"WWW-Authenticate": "Bearer"})
+        if not tiene_permiso(rol, recurso, accion):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"El rol '{rol}' no tiene permiso para {accion} {recurso}.")
+        return usuario
+
+    return dependencia
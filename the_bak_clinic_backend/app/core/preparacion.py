@@ -0,0 +1,69 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+# Precalentamiento de un worker nuevo: abrir conexiones, cargar cachés y construir lo que de otro
+# modo se arma en el primer request. Corre en segundo plano después del arranque; GET /health/ready
+# responde 503 hasta que todos los pasos terminan bien, así el balanceador no le manda tráfico a un
+# worker frío durante un reinicio escalonado.
+#
+# Un paso que falla (p. ej. la BD todavía no responde) se reintenta con espera creciente. Mientras
+# tanto la API funciona igual: cada caché se carga sola en su primera lectura.
+
+ESPERA_INICIAL_REINTENTO = 1.0
+ESPERA_MAXIMA_REINTENTO = 30.0
+
+
+class Preparacion:
+    def __init__(self):
+        self._pasos: List[Tuple[str, Callable[[], None]]] = []
+        self._resultados: Dict[str, dict] = {}
+        self._tarea: Optional[asyncio.Task] = None
+        self.listo = False
+
+    def registrar(self, nombre: str, funcion: Callable[[], None]) -> None:
+        """Agrega un paso (síncrono, corre en el threadpool). Los pasos corren en el orden registrado."""
+        self._pasos.append((nombre, funcion))
+        self._resultados[nombre] = {"listo": False, "duracion_ms": None, "intentos": 0, "error": None}
+
+    def iniciar(self) -> None:
+        self.listo = False
+        self._tarea = asyncio.create_task(self._ejecutar())
+
+    def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def _ejecutar(self) -> None:
+        pendientes = list(self._pasos)
+        espera = ESPERA_INICIAL_REINTENTO
+        inicio_total = time.perf_counter()
+        while pendientes:
+            fallidos = []
+            for nombre, funcion in pendientes:
+                resultado = self._resultados[nombre]
+                resultado["intentos"] += 1
+                inicio = time.perf_counter()
+                try:
+                    await run_in_threadpool(funcion)
+                except Exception as e:
+                    resultado["error"] = str(e)[:200]
+                    fallidos.append((nombre, funcion))
+                    print(f"Precalentamiento: falló '{nombre}' (intento {resultado['intentos']}): {e}")
+                    continue
+                resultado.update(listo=True, duracion_ms=round((time.perf_counter() - inicio) * 1000, 1), error=None)
+            pendientes = fallidos
+            if pendientes:
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, ESPERA_MAXIMA_REINTENTO)
+        self.listo = True
+        print(f"Precalentamiento completo en {(time.perf_counter() - inicio_total) * 1000:.0f} ms")
+
+    def estado(self) -> Dict[str, dict]:
+        return {nombre: dict(resultado) for nombre, resultado in self._resultados.items()}
+
+
+preparacion = Preparacion()
@@ -0,0 +1,97 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response, status
+
+from app.core.tiempos import FASE_MAPEO, medido
+
+# Campos a elegir (?fields=) en los GET de cirugías, pacientes y usuarios.
+#
+# Sin `fields` los endpoints responden como siempre (modelo Pydantic completo). Con `fields` el
+# SELECT pide solo esas columnas y las filas se serializan directo a JSON, sin pasar por el modelo:
+# una vista de calendario no arrastra las notas de cada cirugía ni paga su validación.
+#
+# Cada combinación de campos se resuelve una vez (texto del SELECT, orden de columnas y
+# conversiones) y queda en caché; por fila solo queda un zip y las conversiones indicadas.
+
+
+class Proyeccion:
+    """Columnas elegidas, en el orden de la tabla, con su lista para el SELECT ya armada."""
+
+    __slots__ = ("columnas", "select", "_conversiones")
+
+    def __init__(self, columnas: Tuple[str, ...], conversiones: Dict[str, Callable]):
+        self.columnas = columnas
+        self.select = ", ".join(columnas)
+        self._conversiones = tuple((i, conversiones[c]) for i, c in enumerate(columnas) if c in conversiones)
+
+    @medido(FASE_MAPEO)
+    def filas(self, rows: Sequence) -> List[dict]:
+        """Filas del SELECT (en el orden de `select`) a dicts listos para serializar."""
+        columnas = self.columnas
+        if not self._conversiones:
+            return [dict(zip(columnas, row)) for row in rows]
+        resultado = []
+        for row in rows:
+            valores = list(row)
+            for indice, convertir in self._conversiones:
+                if valores[indice] is not None:
+                    valores[indice] = convertir(valores[indice])
+            resultado.append(dict(zip(columnas, valores)))
+        return resultado
+
+
+class Proyecciones:
+    """
+    Campos que admite `fields` en un recurso. `obligatorias` van siempre (id y version, que usan el
+    frontend y el ETag); `conversiones` ajusta valores que la BD entrega en otro tipo (BIT -> bool).
+    """
+
+    def __init__(self, columnas: Sequence[str], obligatorias: Sequence[str], conversiones: Optional[Dict[str, Callable]] = None):
+        self.columnas = tuple(columnas)
+        self.obligatorias = frozenset(obligatorias)
+        self.conversiones = conversiones or {}
+        self._validas = frozenset(self.columnas)
+        # Hay 2^n combinaciones posibles; en la práctica el frontend usa unas pocas
+        self._proyeccion = lru_cache(maxsize=128)(self._armar)
+
+    def _armar(self, elegidas: FrozenSet[str]) -> Proyeccion:
+        incluidas = elegidas | self.obligatorias
+        return Proyeccion(tuple(c for c in self.columnas if c in incluidas), self.conversiones)
+
+    def resolver(self, fields: Optional[str]) -> Optional[Proyeccion]:
+        """None si no se pidió `fields` (respuesta completa); 400 si trae campos que no existen."""
+        if fields is None or not fields.strip():
+            return None
+        elegidas = frozenset(campo.strip() for campo in fields.split(",") if campo.strip())
+        desconocidos = elegidas - self._validas
+        if desconocidos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Campos no válidos en fields: {', '.join(sorted(desconocidos))}. Opciones: {', '.join(self.columnas)}.",
+            )
+        return self._proyeccion(elegidas)
+
+    def parametro(
+        self,
+        fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (ej: id_cirugia,nombre_quirofano). El id y la versión van siempre."),
+    ) -> Optional[Proyeccion]:
+        """Dependencia de FastAPI para el query param `fields`."""
+        return self.resolver(fields)
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"{type(valor).__name__} no es serializable a JSON")
+
+
+def respuesta_json(contenido, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serializa dicts/listas con fechas en ISO 8601, igual que FastAPI para los modelos."""
+    cuerpo = json.dumps(contenido, default=_a_json, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
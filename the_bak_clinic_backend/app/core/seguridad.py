@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+# Este módulo se importa también en los procesos del pool (contexto "spawn"),
+# por eso solo depende de la biblioteca estándar.
+
+# Parámetros de scrypt. Subirlos encarece cada login; los hashes guardados con parámetros
+# distintos se regeneran de forma transparente en el siguiente login exitoso.
+SCRYPT_N = int(os.getenv("HASH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("HASH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("HASH_SCRYPT_P", "1"))
+LARGO_SAL = 16
+LARGO_HASH = 32
+# Procesos dedicados al hashing; acota cuánta CPU pueden ocupar los logins simultáneos
+PROCESOS_HASH = int(os.getenv("HASH_PROCESOS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+PREFIJO_LEGADO = "placeholder_for_"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_hash_ficticio: Optional[str] = None
+
+
+def _b64(datos: bytes) -> str:
+    return base64.b64encode(datos).decode("ascii")
+
+
+def _scrypt(contrasena: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(contrasena.encode("utf-8"), salt=sal, n=n, r=r, p=p, dklen=LARGO_HASH, maxmem=256 * n * r + 1024 * 1024)
+
+
+def calcular_hash(contrasena: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """Hash en formato 'scrypt$n$r$p$sal$hash' (sal y hash en base64). Costoso: ejecutar en el pool."""
+    sal = secrets.token_bytes(LARGO_SAL)
+    return f"scrypt${n}${r}${p}${_b64(sal)}${_b64(_scrypt(contrasena, sal, n, r, p))}"
+
+
+def _parsear(hash_guardado: str) -> Optional[Tuple[int, int, int, bytes, bytes]]:
+    partes = hash_guardado.split("$")
+    if len(partes) != 6 or partes[0] != "scrypt":
+        return None
+    try:
+        return int(partes[1]), int(partes[2]), int(partes[3]), base64.b64decode(partes[4]), base64.b64decode(partes[5])
+    except (ValueError, TypeError):
+        return None
+
+
+def comprobar_hash(contrasena: str, hash_guardado: Optional[str]) -> bool:
+    """Verifica la contraseña contra el hash guardado en Usuarios.contrasena_hash. Costoso: ejecutar en el pool."""
+    if not hash_guardado:
+        return False
+    if hash_guardado.startswith(PREFIJO_LEGADO):
+        # Registros creados antes del hashing real; se regeneran al primer login correcto
+        return hmac.compare_digest(hash_guardado[len(PREFIJO_LEGADO):].encode("utf-8"), contrasena.encode("utf-8"))
+    datos = _parsear(hash_guardado)
+    if datos is None:
+        return False
+    n, r, p, sal, esperado = datos
+    return hmac.compare_digest(_scrypt(contrasena, sal, n, r, p), esperado)
+
+
+def necesita_rehash(hash_guardado: Optional[str]) -> bool:
+    """True si el hash es legado o fue generado con parámetros distintos a los actuales."""
+    datos = _parsear(hash_guardado or "")
+    return datos is None or datos[:3] != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=PROCESOS_HASH, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def precalentar_pool() -> None:
+    """
+    Arranca todos los procesos del pool (con "spawn" cada uno importa Python desde cero) y deja
+    listo el hash ficticio, para que los primeros logins no paguen ese costo.
+    """
+    global _hash_ficticio
+    pool = obtener_pool()
+    hashes = [futuro.result() for futuro in [pool.submit(calcular_hash, secrets.token_urlsafe(16)) for _ in range(PROCESOS_HASH)]]
+    if _hash_ficticio is None:
+        _hash_ficticio = hashes[0]
+
+
+def cerrar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# --- API para los routers ---
+# Las variantes async no bloquean el event loop; las síncronas (para endpoints `def`) bloquean solo
+# el hilo del threadpool mientras el cálculo corre en otro proceso.
+
+def generar_hash_contrasena(contrasena: str) -> str:
+    return obtener_pool().submit(calcular_hash, contrasena).result()
+
+
+async def generar_hash_contrasena_async(contrasena: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(obtener_pool(), calcular_hash, contrasena)
+
+
+async def verificar_contrasena_async(contrasena: str, hash_guardado: Optional[str]) -> bool:
+    global _hash_ficticio
+    if hash_guardado is None:
+        # Usuario inexistente: se verifica igual contra un hash ficticio para que el tiempo de
+        # respuesta no revele qué emails están registrados.
+        if _hash_ficticio is None:
+            _hash_ficticio = await generar_hash_contrasena_async(secrets.token_urlsafe(16))
+        await asyncio.get_running_loop().run_in_executor(obtener_pool(), comprobar_hash, contrasena, _hash_ficticio)
+        return False
+    return await asyncio.get_running_loop().run_in_executor(obtener_pool(), comprobar_hash, contrasena, hash_guardado)
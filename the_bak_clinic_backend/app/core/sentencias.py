@@ -0,0 +1,123 @@
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import pyodbc
+
+# Sentencias de texto fijo para las actualizaciones parciales (PUT con campos opcionales).
+#
+# Armar "UPDATE ... SET [a] = ?, [c] = ?" con los campos recibidos produce un texto distinto por
+# cada combinación de campos, y SQL Server compila y guarda un plan por cada texto. Aquí cada
+# tabla tiene UNA sentencia que lista todas sus columnas actualizables:
+#
+#     [col] = CASE WHEN ? = 1 THEN ? ELSE [col] END
+#
+# El primer parámetro indica si la columna venía en la solicitud y el segundo es el valor (puede
+# ser NULL a propósito, cosa que COALESCE no permitiría). Además se fija el tipo declarado de cada
+# parámetro con setinputsizes: pyodbc declara los textos como nvarchar(largo del valor) y los NULL
+# según lo que deduzca, y "@P2 nvarchar(5)" / "@P2 nvarchar(7)" también serían planes distintos.
+
+ENTERO = (pyodbc.SQL_INTEGER, 0, 0)
+BIT = (pyodbc.SQL_BIT, 1, 0)
+FECHA = (pyodbc.SQL_TYPE_DATE, 10, 0)
+FECHA_HORA = (pyodbc.SQL_TYPE_TIMESTAMP, 27, 7)
+
+
+def texto(largo: int = 0) -> tuple:
+    """nvarchar(largo); largo 0 = nvarchar(max)."""
+    return (pyodbc.SQL_WVARCHAR, largo, 0)
+
+
+class ActualizacionTabla:
+    """
+    UPDATE parcial de una tabla con texto y tipos de parámetros fijos.
+
+    `columnas`: columna permitida -> tipo declarado del parámetro (ENTERO, FECHA_HORA, texto(50), ...).
+    `salida`: columnas a devolver con OUTPUT INSERTED (vacío = sin OUTPUT).
+    `anteriores`: columnas a devolver además con su valor previo (DELETED.[col] AS [col_anterior]),
+    al final de la fila. Sin ninguna de las dos, "no encontrado" se detecta con rowcount == 0.
+    `version`: columna entera de concurrencia optimista. El UPDATE la incrementa y solo aplica si
+    coincide con la versión recibida; si no aplica, la misma sentencia devuelve en un segundo
+    resultado la versión actual (vacío si la fila no existe), sin otro viaje a la BD.
+    """
+
+    def __init__(
+        self, tabla: str, clave: str, columnas: Dict[str, tuple],
+        salida: Sequence[str] = (), anteriores: Sequence[str] = (), version: Optional[str] = None,
+    ):
+        self.tabla = tabla
+        self.clave = clave
+        self.columnas = dict(columnas)
+        self.salida = tuple(salida)
+        self.anteriores = tuple(anteriores)
+        self.version = version
+
+        asignaciones = ",\n            ".join(
+            f"[{col}] = CASE WHEN ? = 1 THEN ? ELSE [{col}] END" for col in self.columnas
+        )
+        output = ""
+        devueltas = [f"INSERTED.[{col}]" for col in self.salida] + [f"DELETED.[{col}] AS [{col}_anterior]" for col in self.anteriores]
+        if devueltas:
+            output = "\n        OUTPUT " + ", ".join(devueltas)
+        if version:
+            asignaciones += f",\n            [{version}] = [{version}] + 1"
+            self.sentencia = f"""
+        UPDATE {tabla}
+        SET {asignaciones}{output}
+        WHERE [{clave}] = ? AND [{version}] = ?;
+        IF @@ROWCOUNT = 0
+            SELECT [{version}] FROM {tabla} WHERE [{clave}] = ?
+    """
+        else:
+            self.sentencia = f"""
+        UPDATE {tabla}
+        SET {asignaciones}{output}
+        WHERE [{clave}] = ?
+    """
+
+        # Un par (indicador, valor) por columna y al final la clave (y versión y clave otra vez)
+        self.tamanos: List[tuple] = []
+        for tipo in self.columnas.values():
+            self.tamanos += [BIT, tipo]
+        self.tamanos += [ENTERO, ENTERO, ENTERO] if version else [ENTERO]
+
+    def parametros(self, datos: Dict[str, Any], valor_clave: Any, version: Optional[int] = None) -> List[Any]:
+        desconocidas = set(datos) - self.columnas.keys()
+        if desconocidas:
+            raise ValueError(f"Columnas no permitidas para actualizar {self.tabla}: {', '.join(sorted(desconocidas))}")
+        params: List[Any] = []
+        for col in self.columnas:
+            if col in datos:
+                params += [1, datos[col]]
+            else:
+                params += [0, None]
+        params.append(valor_clave)
+        if self.version:
+            if version is None:
+                raise ValueError(f"La actualización de {self.tabla} requiere la versión de la fila")
+            params += [version, valor_clave]
+        return params
+
+    def ejecutar(
+        self, cursor, datos: Dict[str, Any], valor_clave: Any,
+        etiqueta: Optional[str] = None, version: Optional[int] = None,
+    ):
+        """Ejecuta el UPDATE con el cursor de quien llama (y en su transacción). Devuelve el cursor."""
+        params = self.parametros(datos, valor_clave, version)
+        cursor.setinputsizes(self.tamanos)
+        try:
+            return cursor.execute(self.sentencia, params, etiqueta=etiqueta)
+        finally:
+            # setinputsizes queda en el cursor: se limpia para no afectar las sentencias siguientes
+            cursor.setinputsizes(None)
+
+
+def restriccion_violada(error: Exception, mensajes: Mapping[str, str]) -> Optional[str]:
+    """
+    Mensaje para un IntegrityError según la restricción o índice único que nombra SQL Server
+    ("... with unique index 'UX_Usuarios_email' ..."). None si no es ninguna de `mensajes`.
+    Las verificaciones de unicidad las hace la BD en la misma sentencia, sin un SELECT previo.
+    """
+    texto_error = str(error)
+    for restriccion, mensaje in mensajes.items():
+        if f"'{restriccion}'" in texto_error:
+            return mensaje
+    return None
@@ -0,0 +1,221 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core import metricas
+
+# Medición de tiempos por fase de cada request.
+#
+# El middleware abre un acumulador por request en una ContextVar; los hooks (get_connection, el
+# cursor medido y los db_row_to_*) le suman la duración de su fase. Las ContextVar se copian al
+# threadpool donde corren los endpoints sync, pero el dict es el mismo objeto, así que lo medido
+# en el hilo llega al middleware. Fuera de un request (tareas en segundo plano) no se mide nada.
+
+FASE_CONEXION = "db_conexion"
+FASE_CONSULTA = "db_consulta"
+FASE_MAPEO = "mapeo"
+FASES = (FASE_CONEXION, FASE_CONSULTA, FASE_MAPEO)
+# Lo que no cae en ninguna fase: validación de la entrada, lógica del endpoint y serialización
+FASE_RESTO = "app"
+
+# Límites superiores (ms) de los buckets del histograma de duración por ruta
+LIMITES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+RUTA_DESCONOCIDA = "sin_ruta"
+
+_mediciones: ContextVar[Optional[Dict[str, float]]] = ContextVar("mediciones_request", default=None)
+
+
+def iniciar_medicion() -> Dict[str, float]:
+    mediciones = {fase: 0.0 for fase in FASES}
+    mediciones["consultas"] = 0
+    _mediciones.set(mediciones)
+    return mediciones
+
+
+def sumar(fase: str, segundos: float) -> None:
+    mediciones = _mediciones.get()
+    if mediciones is not None:
+        mediciones[fase] += segundos
+
+
+def contar_consulta() -> None:
+    mediciones = _mediciones.get()
+    if mediciones is not None:
+        mediciones["consultas"] += 1
+
+
+@contextmanager
+def medir(fase: str) -> Iterator[None]:
+    mediciones = _mediciones.get()
+    if mediciones is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        mediciones[fase] += time.perf_counter() - inicio
+
+
+def medido(fase: str) -> Callable[[Callable], Callable]:
+    """Decorador: suma la duración de cada llamada a la fase indicada (ej. @medido(FASE_MAPEO))."""
+    def decorar(funcion: Callable) -> Callable:
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            mediciones = _mediciones.get()
+            if mediciones is None:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                mediciones[fase] += time.perf_counter() - inicio
+        return envoltura
+    return decorar
+
+
+class HistogramaRuta:
+    """Duraciones de una ruta: conteo por bucket, suma total y suma por fase (para promedios)."""
+
+    __slots__ = ("buckets", "cantidad", "suma", "maximo", "suma_fases")
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(LIMITES_MS) + 1)
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.suma_fases: Dict[str, float] = {fase: 0.0 for fase in FASES + (FASE_RESTO,)}
+
+    def registrar(self, total_ms: float, fases_ms: Dict[str, float]) -> None:
+        self.buckets[bisect_left(LIMITES_MS, total_ms)] += 1
+        self.cantidad += 1
+        self.suma += total_ms
+        if total_ms > self.maximo:
+            self.maximo = total_ms
+        for fase, duracion in fases_ms.items():
+            self.suma_fases[fase] += duracion
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Estimación del percentil p (0-100): límite superior del bucket donde cae (o el máximo visto, si es el último)."""
+        if not self.cantidad:
+            return None
+        objetivo = self.cantidad * p / 100
+        acumulado = 0
+        for i, conteo in enumerate(self.buckets):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return round(min(LIMITES_MS[i], self.maximo), 2) if i < len(LIMITES_MS) else round(self.maximo, 2)
+        return round(self.maximo, 2)
+
+
+# (método, plantilla de ruta) -> histograma. Solo se escribe desde el event loop (el middleware),
+# así que no necesita lock.
+histogramas: Dict[Tuple[str, str], HistogramaRuta] = {}
+
+
+def registrar_request(metodo: str, ruta: str, total_ms: float, fases_ms: Dict[str, float]) -> None:
+    histograma = histogramas.get((metodo, ruta))
+    if histograma is None:
+        histograma = histogramas[(metodo, ruta)] = HistogramaRuta()
+    histograma.registrar(total_ms, fases_ms)
+
+
+def resumen_rutas() -> List[Dict]:
+    """Resumen por ruta, de la más lenta (p95) a la más rápida."""
+    resumen = []
+    for (metodo, ruta), h in list(histogramas.items()):
+        if not h.cantidad:
+            continue
+        resumen.append({
+            "metodo": metodo,
+            "ruta": ruta,
+            "solicitudes": h.cantidad,
+            "promedio_ms": round(h.suma / h.cantidad, 2),
+            "p50_ms": h.percentil(50),
+            "p95_ms": h.percentil(95),
+            "p99_ms": h.percentil(99),
+            "maximo_ms": round(h.maximo, 2),
+            "promedio_fases_ms": {fase: round(s / h.cantidad, 2) for fase, s in h.suma_fases.items()},
+        })
+    resumen.sort(key=lambda r: (r["p95_ms"], r["promedio_ms"]), reverse=True)
+    return resumen
+
+
+def _ruta(scope) -> str:
+    """
+    Plantilla de la ruta que atendió el request (/cirugias/{cirugia_id}), para no crear una serie
+    por cada id. Según la versión de FastAPI, la ruta del scope trae la plantilla completa o solo la
+    parte del router incluido; en ese caso se antepone el prefijo tomado del path real.
+    """
+    plantilla = getattr(scope.get("route"), "path", None)
+    if not plantilla:
+        return RUTA_DESCONOCIDA
+    segmentos = scope["path"].split("/")[1:]
+    prefijo = segmentos[:max(0, len(segmentos) - plantilla.count("/"))]
+    return "/" + "/".join(prefijo) + plantilla if prefijo else plantilla
+
+
+class TiemposMiddleware:
+    """
+    Middleware ASGI que mide cada request, agrega el header Server-Timing con el desglose por fase
+    (visible en la pestaña Network del navegador) y registra la duración en el histograma de su ruta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        mediciones = iniciar_medicion()
+        medido_hasta: List[float] = []
+        estado: List[int] = []
+        metricas.solicitudes_en_curso.inc()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                # Se mide hasta que la respuesta está lista para salir
+                medido_hasta.append(time.perf_counter())
+                estado.append(mensaje["status"])
+                # Timing-Allow-Origin: el frontend corre en otro origen y sin él el navegador oculta Server-Timing
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"server-timing", self._server_timing(mediciones, medido_hasta[0] - inicio).encode("latin-1")),
+                    (b"timing-allow-origin", b"*"),
+                ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas.solicitudes_en_curso.dec()
+            total = (medido_hasta[0] if medido_hasta else time.perf_counter()) - inicio
+            fases_ms = {fase: mediciones[fase] * 1000 for fase in FASES}
+            fases_ms[FASE_RESTO] = max(0.0, total * 1000 - sum(fases_ms.values()))
+            metodo, ruta = scope["method"], _ruta(scope)
+            registrar_request(metodo, ruta, total * 1000, fases_ms)
+            # Sin respuesta iniciada, la excepción termina en un 500 del ServerErrorMiddleware
+            metricas.solicitudes_http.inc(metodo, ruta, str(estado[0]) if estado else "500")
+            metricas.duracion_http.observar(total, metodo, ruta)
+            for fase, duracion in fases_ms.items():
+                metricas.fases_http.inc(ruta, fase, cantidad=duracion / 1000)
+
+    @staticmethod
+    def _server_timing(mediciones: Dict[str, float], total: float) -> str:
+        partes = []
+        for fase in FASES:
+            if mediciones[fase]:
+                parte = f"{fase};dur={mediciones[fase] * 1000:.2f}"
+                if fase == FASE_CONSULTA:
+                    parte += f';desc="{mediciones["consultas"]} consultas"'
+                partes.append(parte)
+        resto = max(0.0, total - sum(mediciones[fase] for fase in FASES))
+        partes.append(f"{FASE_RESTO};dur={resto * 1000:.2f}")
+        partes.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(partes)
@@ -0,0 +1,215 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+
+from app.core.cache import TTLCache
+from app.database import conexion_pool
+from app.schemas.user_schema import UsuarioAutenticado
+
+# Tokens JWT firmados con HS256. La verificación es solo criptográfica (sin BD): el token ya
+# trae id, email y rol del usuario.
+CLAVE_SECRETA = os.getenv("JWT_SECRET_KEY") or ""
+if not CLAVE_SECRETA:
+    # Sin clave configurada se usa una aleatoria: los tokens no sobreviven reinicios ni sirven
+    # entre workers. Configurar JWT_SECRET_KEY en producción.
+    print("Advertencia: JWT_SECRET_KEY no está definida; se usará una clave aleatoria por proceso.")
+    CLAVE_SECRETA = secrets.token_urlsafe(48)
+_CLAVE = CLAVE_SECRETA.encode("utf-8")
+
+MINUTOS_EXPIRACION_TOKEN = int(os.getenv("JWT_MINUTOS_EXPIRACION", "480"))  # un turno
+_ENCABEZADO = base64.urlsafe_b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode()).rstrip(b"=")
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+# Tokens ya verificados, por hash del token (no se guardan tokens en claro en memoria)
+_cache_tokens = TTLCache(max_entradas=10000, ttl_segundos=300, nombre="tokens")
+# Cada cuánto cada worker trae las revocaciones hechas en otros (el logout en otro worker tarda a lo
+# más esto en aplicar aquí)
+SEGUNDOS_SINCRONIZACION_REVOCADOS = float(os.getenv("JWT_SEGUNDOS_SINCRONIZACION_REVOCADOS", "5"))
+SEGUNDOS_ENTRE_PURGAS_REVOCADOS = 3600
+
+
+class TokenInvalido(ValueError):
+    pass
+
+
+def _b64_decodificar(segmento: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segmento + b"=" * (-len(segmento) % 4))
+
+
+def _firmar(contenido: bytes) -> bytes:
+    return base64.urlsafe_b64encode(hmac.new(_CLAVE, contenido, hashlib.sha256).digest()).rstrip(b"=")
+
+
+def crear_token_acceso(id_usuario: int, email: str, rol: str, minutos: int = MINUTOS_EXPIRACION_TOKEN) -> str:
+    ahora = int(time.time())
+    claims = {
+        "sub": str(id_usuario),
+        "email": email,
+        "rol": rol,
+        "iat": ahora,
+        "exp": ahora + minutos * 60,
+        "jti": secrets.token_hex(8),
+    }
+    carga = base64.urlsafe_b64encode(json.dumps(claims, separators=(",", ":")).encode()).rstrip(b"=")
+    contenido = _ENCABEZADO + b"." + carga
+    return (contenido + b"." + _firmar(contenido)).decode("ascii")
+
+
+def decodificar_token(token: str) -> Dict[str, Any]:
+    """Verifica firma y expiración y devuelve los claims. Lanza TokenInvalido si no es válido."""
+    try:
+        encabezado, carga, firma = token.encode("ascii").split(b".")
+    except (ValueError, UnicodeEncodeError):
+        raise TokenInvalido("Token mal formado")
+    if encabezado != _ENCABEZADO or not hmac.compare_digest(firma, _firmar(encabezado + b"." + carga)):
+        raise TokenInvalido("Firma inválida")
+    try:
+        claims = json.loads(_b64_decodificar(carga))
+    except ValueError:
+        raise TokenInvalido("Contenido del token inválido")
+    if claims.get("exp", 0) <= time.time():
+        raise TokenInvalido("Token expirado")
+    return claims
+
+
+class ListaRevocados:
+    """
+    jti revocados -> exp. La verificación consulta solo el dict en memoria; el logout además escribe
+    en la tabla TokensRevocados (sql/032) y cada worker trae de ahí las revocaciones de los demás
+    (y todas las vigentes al arrancar) con la marca de agua de su columna ROWVERSION.
+    """
+
+    def __init__(self):
+        self._revocados: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._marca: Optional[bytes] = None
+        self._ultima_purga = float("-inf")
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def __contains__(self, jti: Optional[str]) -> bool:
+        return jti in self._revocados
+
+    def _agregar(self, filas) -> None:
+        ahora = time.time()
+        with self._lock:
+            for jti, exp in filas:
+                self._revocados[jti] = float(exp)
+            # Se purgan cuando el token habría expirado de todos modos
+            for jti_vencido in [j for j, e in self._revocados.items() if e <= ahora]:
+                del self._revocados[jti_vencido]
+
+    def revocar(self, jti: str, exp: float) -> None:
+        """
+        Revoca en la tabla para los demás workers y después en este. Corre en el threadpool. Si la BD
+        falla no se revoca en ningún lado, así el cliente puede reintentar con el mismo token.
+        """
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO TokensRevocados (jti, exp) SELECT ?, ?
+                    WHERE NOT EXISTS (SELECT 1 FROM TokensRevocados WITH (UPDLOCK, HOLDLOCK) WHERE jti = ?)
+                    """,
+                    jti, int(exp), jti, etiqueta="tokens.revocar",
+                )
+                conn.commit()
+        self._agregar([(jti, exp)])
+
+    def sincronizar(self) -> None:
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                # Hasta MIN_ACTIVE_ROWVERSION(): una revocación que aún no confirma no queda atrás de la marca
+                cursor.execute("SELECT MIN_ACTIVE_ROWVERSION()", etiqueta="tokens.revocados.marca")
+                hasta = bytes(cursor.fetchone()[0])
+                if self._marca is None:
+                    cursor.execute(
+                        "SELECT jti, exp FROM TokensRevocados WHERE exp > ? AND cambio < ?",
+                        int(time.time()), hasta, etiqueta="tokens.revocados.carga",
+                    )
+                else:
+                    cursor.execute(
+                        "SELECT jti, exp FROM TokensRevocados WHERE cambio >= ? AND cambio < ?",
+                        self._marca, hasta, etiqueta="tokens.revocados.cambios",
+                    )
+                filas = cursor.fetchall()
+                if time.monotonic() - self._ultima_purga > SEGUNDOS_ENTRE_PURGAS_REVOCADOS:
+                    # Los vencidos ya no sirven de nada; cualquier worker puede borrarlos
+                    cursor.execute("DELETE FROM TokensRevocados WHERE exp <= ?", int(time.time()), etiqueta="tokens.revocados.purga")
+                    conn.commit()
+                    self._ultima_purga = time.monotonic()
+        self._agregar(filas)
+        self._marca = hasta
+
+    def iniciar_sincronizacion(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._sincronizar_periodicamente, name="sincronizacion-revocados", daemon=True)
+            self._hilo.start()
+
+    def detener_sincronizacion(self) -> None:
+        self._detener.set()
+
+    def _sincronizar_periodicamente(self) -> None:
+        while not self._detener.wait(SEGUNDOS_SINCRONIZACION_REVOCADOS):
+            try:
+                self.sincronizar()
+            except Exception as e:
+                print(f"Error sincronizando tokens revocados: {e}")
+
+
+lista_revocados = ListaRevocados()
+
+
+def revocar_token(jti: str, exp: float) -> None:
+    lista_revocados.revocar(jti, exp)
+
+
+def esta_revocado(jti: Optional[str]) -> bool:
+    return jti in lista_revocados
+
+
+def usuario_desde_token(token: str) -> UsuarioAutenticado:
+    """
+    Resuelve el usuario de un token: primero la caché de tokens ya verificados (un hash y una
+    búsqueda en dict), luego la verificación HMAC completa. La revocación se revisa siempre.
+    """
+    clave = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    usuario = _cache_tokens.get(clave)
+    if usuario is None:
+        claims = decodificar_token(token)
+        usuario = UsuarioAutenticado(
+            id_usuario=int(claims["sub"]), email=claims["email"], rol=claims["rol"],
+            jti=claims["jti"], exp=claims["exp"],
+        )
+        _cache_tokens.set(clave, usuario, ttl_segundos=min(_cache_tokens.ttl_segundos, claims["exp"] - time.time()))
+    elif usuario.exp <= time.time():
+        raise TokenInvalido("Token expirado")
+    if esta_revocado(usuario.jti):
+        raise TokenInvalido("Token revocado")
+    return usuario
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UsuarioAutenticado:
+    """
+    Dependencia de FastAPI: usuario autenticado a partir del header Authorization: Bearer.
+    Es async porque no hace I/O; así no ocupa un hilo del threadpool por request.
+    """
+    try:
+        return usuario_desde_token(token)
+    except TokenInvalido as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Credenciales inválidas: {e}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
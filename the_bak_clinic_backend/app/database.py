@@ -1,10 +1,23 @@
 import pyodbc
 from dotenv import load_dotenv
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core import metricas, perfil_sql
+from app.core.tiempos import FASE_CONEXION, FASE_CONSULTA, contar_consulta, medir, sumar
 
 load_dotenv()
 
-def get_connection():
+def abrir_conexion() -> pyodbc.Connection:
+    """
+    Abre una conexión nueva a la base de datos.
+    Para código que corre fuera de un request (tareas en segundo plano); quien la abre debe cerrarla.
+    """
     server = os.getenv("AZURE_SQL_SERVER")
     database = os.getenv("AZURE_SQL_DATABASE")
     username = os.getenv("AZURE_SQL_USERNAME")
@@ -18,19 +31,334 @@ def get_connection():
         f"UID={username};"
         f"PWD={password};"
     )
+    return pyodbc.connect(connection_string)
+
+
+class CursorMedido:
+    """
+    Cursor de pyodbc que mide y etiqueta cada sentencia.
+
+    execute/executemany aceptan `etiqueta=` (ej. "cirugias.list.count"); sin ella se deriva del SQL.
+    El tiempo de execute + fetch se suma a la fase db_consulta del request y, al pasar a la siguiente
+    sentencia o cerrar el cursor, se registra en el perfil SQL (métricas, filas y log de lentas).
+    El resto de los atributos (description, rowcount, fast_executemany...) pasa al cursor real.
+    """
+
+    __slots__ = ("_cursor", "_conexion", "_etiqueta", "_sql", "_params", "_duracion", "_filas")
+
+    def __init__(self, cursor: pyodbc.Cursor, conexion: Optional["ConexionMedida"] = None):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_conexion", conexion)
+        object.__setattr__(self, "_etiqueta", None)
+
+    def _ejecutar(self, metodo, sql: str, params, etiqueta: Optional[str]):
+        self._cerrar_sentencia()
+        if self._conexion is not None:
+            self._conexion.transaccion_abierta = True
+        etiqueta = etiqueta or perfil_sql.etiqueta_sql(sql)
+        contar_consulta()
+        inicio = time.perf_counter()
+        try:
+            metodo(sql, *params)
+        except Exception:
+            duracion = time.perf_counter() - inicio
+            sumar(FASE_CONSULTA, duracion)
+            metricas.errores_consultas_bd.inc(etiqueta)
+            perfil_sql.registrar_sentencia(etiqueta, sql, params, duracion, 0)
+            raise
+        duracion = time.perf_counter() - inicio
+        sumar(FASE_CONSULTA, duracion)
+        # rowcount es -1 en los SELECT; las filas leídas se cuentan en los fetch
+        filas = getattr(self._cursor, "rowcount", -1)
+        for nombre, valor in (("_etiqueta", etiqueta), ("_sql", sql), ("_params", params), ("_duracion", duracion), ("_filas", max(filas, 0))):
+            object.__setattr__(self, nombre, valor)
+        return self
+
+    def _leer(self, metodo, *args, cuenta_filas: bool = True):
+        inicio = time.perf_counter()
+        resultado = None
+        try:
+            resultado = metodo(*args)
+            return resultado
+        finally:
+            duracion = time.perf_counter() - inicio
+            sumar(FASE_CONSULTA, duracion)
+            if self._etiqueta is not None:
+                object.__setattr__(self, "_duracion", self._duracion + duracion)
+                if isinstance(resultado, list):
+                    object.__setattr__(self, "_filas", self._filas + len(resultado))
+                elif resultado is not None and cuenta_filas:
+                    object.__setattr__(self, "_filas", self._filas + 1)
+
+    def _cerrar_sentencia(self) -> None:
+        if self._etiqueta is not None:
+            perfil_sql.registrar_sentencia(self._etiqueta, self._sql, self._params, self._duracion, self._filas)
+            object.__setattr__(self, "_etiqueta", None)
+            object.__setattr__(self, "_params", None)
+
+    def execute(self, sql: str, *params, etiqueta: Optional[str] = None):
+        return self._ejecutar(self._cursor.execute, sql, params, etiqueta)
+
+    def executemany(self, sql: str, params, etiqueta: Optional[str] = None):
+        return self._ejecutar(self._cursor.executemany, sql, (params,), etiqueta)
+
+    def fetchone(self):
+        return self._leer(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._leer(self._cursor.fetchall)
+
+    def fetchmany(self, size: int = 1):
+        return self._leer(self._cursor.fetchmany, size)
+
+    def nextset(self):
+        return self._leer(self._cursor.nextset, cuenta_filas=False)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self) -> None:
+        self._cerrar_sentencia()
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cerrar_sentencia()
+        # El cursor de pyodbc hace commit al salir del bloque si no hubo excepción
+        with medir(FASE_CONSULTA):
+            resultado = self._cursor.__exit__(*exc)
+        if exc[0] is None and self._conexion is not None:
+            self._conexion.transaccion_abierta = False
+        return resultado
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cursor, nombre, valor)
+
+
+class ConexionMedida:
+    """
+    Conexión que entrega cursores medidos y mide commit/rollback. El resto pasa a la conexión real.
+    `transaccion_abierta` indica si hubo sentencias después del último commit/rollback: el pool
+    solo hace rollback al recibirla de vuelta en ese caso.
+    """
+
+    __slots__ = ("_conn", "transaccion_abierta")
+
+    def __init__(self, conn: pyodbc.Connection):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "transaccion_abierta", False)
+
+    def cursor(self) -> CursorMedido:
+        return CursorMedido(self._conn.cursor(), self)
+
+    def commit(self) -> None:
+        with medir(FASE_CONSULTA):
+            self._conn.commit()
+        object.__setattr__(self, "transaccion_abierta", False)
+
+    def rollback(self) -> None:
+        with medir(FASE_CONSULTA):
+            self._conn.rollback()
+        object.__setattr__(self, "transaccion_abierta", False)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def __setattr__(self, nombre, valor):
+        if nombre == "transaccion_abierta":
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._conn, nombre, valor)
+
+
+# Pool de conexiones de los requests. Abrir una conexión a Azure SQL cuesta varios round trips
+# (TCP, TLS, login); el pool las reutiliza y acota cuántas se usan a la vez, para que una ráfaga
+# (p. ej. POST /batch o varias pestañas del dashboard) espere su turno en vez de abrir una por request.
+POOL_TAMANO = int(os.getenv("DB_POOL_TAMANO", "10"))
+POOL_ESPERA_SEGUNDOS = float(os.getenv("DB_POOL_ESPERA_SEGUNDOS", "10"))
+# Una conexión libre más tiempo que esto se cierra en vez de reutilizarse (el servidor o un
+# firewall intermedio pueden haberla cortado)
+POOL_INACTIVIDAD_SEGUNDOS = float(os.getenv("DB_POOL_INACTIVIDAD_SEGUNDOS", "300"))
+# Conexiones que se abren al arrancar el worker (app/core/preparacion.py)
+POOL_PRECALENTAR = int(os.getenv("DB_POOL_PRECALENTAR", "2"))
+
+
+class PoolConexiones:
+    """
+    Hasta `tamano` conexiones en uso a la vez; las devueltas quedan libres para el siguiente request
+    (la última devuelta se entrega primero, así las que sobran envejecen y se cierran). Si no hay
+    cupo se espera hasta `espera_segundos`. obtener/devolver bloquean: se llaman desde el threadpool.
+    """
+
+    def __init__(self, tamano: int, espera_segundos: float, inactividad_segundos: float):
+        self.tamano = tamano
+        self.espera_segundos = espera_segundos
+        self.inactividad_segundos = inactividad_segundos
+        self._cupos = threading.BoundedSemaphore(tamano)
+        self._libres: List[Tuple[pyodbc.Connection, float]] = []
+        self._lock = threading.Lock()
+        self.en_uso = 0
+
+    def obtener(self) -> pyodbc.Connection:
+        """Una conexión libre o nueva. Lanza TimeoutError si no se liberó un cupo a tiempo."""
+        if not self._cupos.acquire(timeout=self.espera_segundos):
+            raise TimeoutError(f"Sin conexiones disponibles tras {self.espera_segundos:g} s (pool de {self.tamano})")
+        try:
+            conn = None
+            vencidas = []
+            limite = time.monotonic() - self.inactividad_segundos
+            with self._lock:
+                while self._libres:
+                    candidata, devuelta = self._libres.pop()
+                    if devuelta >= limite:
+                        conn = candidata
+                        break
+                    vencidas.append(candidata)
+                self.en_uso += 1
+            for vencida in vencidas:
+                self._cerrar(vencida)
+            if conn is None:
+                conn = abrir_conexion()
+                metricas.conexiones_abiertas_bd.inc()
+            return conn
+        except BaseException:
+            with self._lock:
+                self.en_uso -= 1
+            self._cupos.release()
+            raise
+
+    def devolver(self, conn: pyodbc.Connection, reutilizable: bool = True) -> None:
+        try:
+            if reutilizable:
+                with self._lock:
+                    self._libres.append((conn, time.monotonic()))
+            else:
+                self._cerrar(conn)
+        finally:
+            with self._lock:
+                self.en_uso -= 1
+            self._cupos.release()
+
+    def precalentar(self, cantidad: int) -> None:
+        """Deja al menos `cantidad` conexiones abiertas y libres (hasta el tamaño del pool)."""
+        conexiones = []
+        try:
+            for _ in range(min(cantidad, self.tamano) - len(self._libres)):
+                conexiones.append(self.obtener())
+        finally:
+            for conn in conexiones:
+                self.devolver(conn)
+
+    def libres(self) -> int:
+        return len(self._libres)
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones libres (al apagar). Las que están en uso se cierran al devolverse."""
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for conn, _ in libres:
+            self._cerrar(conn)
+
+    @staticmethod
+    def _cerrar(conn: pyodbc.Connection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+pool_conexiones = PoolConexiones(POOL_TAMANO, POOL_ESPERA_SEGUNDOS, POOL_INACTIVIDAD_SEGUNDOS)
+
+metricas.MedidorFuncion("bak_db_pool_tamano", "Máximo de conexiones en uso a la vez", lambda: pool_conexiones.tamano)
+metricas.MedidorFuncion("bak_db_pool_libres", "Conexiones abiertas esperando un request", pool_conexiones.libres)
+metricas.MedidorFuncion(
+    "bak_db_pool_utilizacion", "Conexiones en uso / tamaño del pool",
+    lambda: pool_conexiones.en_uso / pool_conexiones.tamano,
+)
+
+
+@contextmanager
+def conexion_pool():
+    """
+    Conexión del pool para código que no recibe la de un request (hilos en segundo plano, funciones
+    que corren en el threadpool). Lanza TimeoutError si no hay cupo. Lo no confirmado se descarta.
+    """
+    try:
+        conn = pool_conexiones.obtener()
+    except TimeoutError:
+        metricas.pool_agotado_bd.inc()
+        raise
+    metricas.conexiones_en_uso.inc()
+    conexion = ConexionMedida(conn)
+    reutilizable = True
+    try:
+        yield conexion
+    except pyodbc.Error:
+        # La conexión puede haber quedado rota: no vuelve al pool
+        reutilizable = False
+        raise
+    finally:
+        if reutilizable and conexion.transaccion_abierta:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                reutilizable = False
+        metricas.conexiones_en_uso.dec()
+        pool_conexiones.devolver(conn, reutilizable)
+
+
+def get_connection():
     conn = None
+    reutilizable = True
     try:
-        conn = pyodbc.connect(connection_string)
-        yield conn # Ceder la conexión para su uso
+        inicio = time.perf_counter()
+        try:
+            conn = pool_conexiones.obtener()
+        except TimeoutError as e:
+            metricas.pool_agotado_bd.inc()
+            print(f"Pool de conexiones agotado: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El servicio está ocupado. Intente nuevamente en unos segundos.",
+                headers={"Retry-After": "1"},
+            )
+        except Exception:
+            metricas.errores_conexion_bd.inc()
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            sumar(FASE_CONEXION, duracion)
+            metricas.duracion_conexion_bd.observar(duracion)
+        metricas.conexiones_en_uso.inc()
+        conexion = ConexionMedida(conn)
+        try:
+            yield conexion # Ceder la conexión para su uso
+        finally:
+            if reutilizable and conexion.transaccion_abierta:
+                # Lo que el endpoint no confirmó se descarta antes de prestarla a otro request
+                try:
+                    conn.rollback()
+                except pyodbc.Error:
+                    reutilizable = False
     except pyodbc.Error as e: # Capturar errores específicos de pyodbc
         print(f"Error de base de datos (pyodbc): {e}")
+        # La conexión puede haber quedado rota: no vuelve al pool
+        reutilizable = False
         # Podríamos relanzar una excepción personalizada o HTTPException aquí si es necesario
         # dependiendo de cómo queramos manejar los errores de conexión globalmente.
         # Por ahora, imprimimos y la excepción original se propagará si no se maneja en el endpoint.
         raise # Relanzar para que FastAPI lo maneje o un middleware de error global
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error general al intentar conectar a la base de datos: {e}")
         raise
     finally:
         if conn:
-            conn.close() # Asegurar que la conexión se cierre al final
+            metricas.conexiones_en_uso.dec()
+            pool_conexiones.devolver(conn, reutilizable) # Devolverla al pool (o cerrarla si quedó inutilizable)
@@ -1,9 +1,53 @@
-from fastapi import FastAPI
+import hmac
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import usuarios, cirugias, pacientes, limpieza, auth, reportes, notificaciones # Importar notificaciones
-from app.database import get_connection
+from app.routers import usuarios, cirugias, pacientes, limpieza, auth, reportes, notificaciones, monitoreo, batch # Importar notificaciones
+from app.database import POOL_PRECALENTAR, pool_conexiones
+from app.core import seguridad
+from app.core.permisos import autorizar
+from app.core.compresion import CompresionMiddleware
+from app.core.idempotencia import IdempotenciaMiddleware
+from app.core.limite_tasa import LimiteTasaMiddleware
+from app.core.tiempos import TiemposMiddleware
+from app.core import metricas
+from app.core.preparacion import preparacion
+from app.services.estado_quirofanos import registro_quirofanos
+from app.services.busqueda_pacientes import indice_pacientes
+from app.services.rotacion_quirofanos import predictor_rotacion
+from app.core.eventos import procesador_eventos
+from app.core.tokens import lista_revocados
 
-app = FastAPI(title="The BAK Clinic API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Precalentamiento en segundo plano (conexiones, cachés, esquemas); /health/ready espera a que termine.
+    # Si la BD no responde al arrancar, se reintenta y cada caché se carga igual en su primera lectura.
+    preparacion.iniciar()
+    registro_quirofanos.iniciar_reconciliacion()
+    procesador_eventos.iniciar()
+    lista_revocados.iniciar_sincronizacion()
+    yield
+    lista_revocados.detener_sincronizacion()
+    preparacion.detener()
+    procesador_eventos.detener()
+    registro_quirofanos.detener_reconciliacion()
+    # Al apagar: liberar los procesos del pool de hashing de contraseñas y las conexiones libres
+    seguridad.cerrar_pool()
+    pool_conexiones.cerrar()
+
+
+app = FastAPI(title="The BAK Clinic API", version="0.1.0", lifespan=lifespan)
+
+# Idempotency-Key en los POST. Va por dentro del límite de tasa para que las repeticiones
+# también cuenten contra el límite.
+app.add_middleware(IdempotenciaMiddleware)
+
+# Límite de tasa por IP/usuario. Se agrega antes que CORS para que CORS lo envuelva y
+# las respuestas 429 también lleven los headers CORS.
+app.add_middleware(LimiteTasaMiddleware)
 
 # Middleware CORS
 app.add_middleware(
@@ -12,16 +56,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ETag lleva la versión para If-Match (app/core/concurrencia.py); Idempotent-Replayed marca
+    # las respuestas repetidas de un POST con Idempotency-Key (app/core/idempotencia.py)
+    expose_headers=["ETag", "Idempotent-Replayed", "Retry-After"],
 )
 
+# Compresión gzip/brotli/zstd según Accept-Encoding. Por fuera de CORS para comprimir la respuesta
+# final (incluidas las 429); por dentro de Tiempos para que su costo aparezca en la duración.
+app.add_middleware(CompresionMiddleware)
+
+# Tiempos por fase (header Server-Timing e histogramas por ruta). Va por fuera de todo para medir
+# el request completo, incluidos el límite de tasa y CORS.
+app.add_middleware(TiemposMiddleware)
+
 # Rutas principales
-app.include_router(usuarios.router, prefix="/usuarios", tags=["usuarios"])
-app.include_router(cirugias.router, prefix="/cirugias", tags=["cirugias"])
-app.include_router(pacientes.router, prefix="/pacientes", tags=["pacientes"])
-app.include_router(limpieza.router, prefix="/limpieza", tags=["limpieza"])
+# Cada router exige permiso sobre su recurso (leer/escribir según el método); /auth queda abierto para el login.
+app.include_router(usuarios.router, prefix="/usuarios", tags=["usuarios"], dependencies=[Depends(autorizar("usuarios"))])
+app.include_router(cirugias.router, prefix="/cirugias", tags=["cirugias"], dependencies=[Depends(autorizar("cirugias"))])
+app.include_router(pacientes.router, prefix="/pacientes", tags=["pacientes"], dependencies=[Depends(autorizar("pacientes"))])
+app.include_router(limpieza.router, prefix="/limpieza", tags=["limpieza"], dependencies=[Depends(autorizar("limpieza"))])
 app.include_router(auth.router, prefix="/auth", tags=["autenticación"])
-app.include_router(reportes.router, prefix="/reportes", tags=["reportes"])
-app.include_router(notificaciones.router, prefix="/notificaciones", tags=["notificaciones"])
+app.include_router(reportes.router, prefix="/reportes", tags=["reportes"], dependencies=[Depends(autorizar("reportes"))])
+app.include_router(notificaciones.router, prefix="/notificaciones", tags=["notificaciones"], dependencies=[Depends(autorizar("notificaciones"))])
+app.include_router(monitoreo.router, prefix="/monitoreo", tags=["monitoreo"], dependencies=[Depends(autorizar("monitoreo"))])
+# /batch solo exige sesión: cada sub-solicitud pasa por los permisos de su propio router
+app.include_router(batch.router, prefix="/batch", tags=["batch"])
 
 
 @app.get("/")
@@ -29,14 +88,34 @@ def root():
     return {"message": "API Clínica BAK activa"}
 
 
-@app.get("/test-db")
-def test_db():
-    conn = get_connection()
-    if not conn:
-        return {"error": "No se pudo conectar a la base de datos"}
+# Token que debe enviar Prometheus (Authorization: Bearer ...). Sin configurar, /metrics queda abierto:
+# solo expone conteos y tiempos por plantilla de ruta, sin datos de pacientes.
+TOKEN_METRICAS = os.getenv("METRICAS_TOKEN")
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metricas(request: Request):
+    if TOKEN_METRICAS:
+        autorizacion = request.headers.get("authorization", "")
+        if not hmac.compare_digest(autorizacion.encode(), f"Bearer {TOKEN_METRICAS}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de métricas inválido")
+    return Response(content=metricas.exposicion(), media_type=metricas.TIPO_CONTENIDO)
+
+
+# Pasos del precalentamiento de cada worker, en orden
+preparacion.registrar("conexiones_bd", lambda: pool_conexiones.precalentar(POOL_PRECALENTAR))
+# Un worker recién iniciado no debe aceptar tokens cerrados con logout en otro
+preparacion.registrar("tokens_revocados", lista_revocados.sincronizar)
+preparacion.registrar("estados_quirofanos", registro_quirofanos.cargar_desde_bd)
+preparacion.registrar("indice_pacientes", indice_pacientes.asegurar_cargado)
+preparacion.registrar("rotaciones_quirofanos", predictor_rotacion.cargar_desde_bd)
+# El esquema OpenAPI (JSON Schema de todos los modelos de request y respuesta) se arma en el primer /docs
+preparacion.registrar("esquemas", app.openapi)
+preparacion.registrar("pool_hash_contrasenas", seguridad.precalentar_pool)
+
 
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sys.databases")
-    dbs = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return {"bases_de_datos": dbs}
\ No newline at end of file
+@app.get("/health/ready", include_in_schema=False)
+def health_ready():
+    """Para el balanceador: 200 solo cuando el worker terminó de precalentarse; 503 mientras tanto."""
+    contenido = {"listo": preparacion.listo, "pasos": preparacion.estado()}
+    return JSONResponse(contenido, status_code=status.HTTP_200_OK if preparacion.listo else status.HTTP_503_SERVICE_UNAVAILABLE)
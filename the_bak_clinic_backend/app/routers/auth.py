@@ -1,70 +1,121 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Dict, Optional # Añadido Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, Optional # Añadido Optional
+import pyodbc
+from app.database import conexion_pool
+from app.core.seguridad import verificar_contrasena_async, generar_hash_contrasena_async, necesita_rehash
+from app.core.tokens import crear_token_acceso, get_current_user, revocar_token
+from app.core.limite_tasa import limitar_login_por_usuario
+from app.core import permisos
+from app.schemas.user_schema import UsuarioAutenticado
 # from pydantic import EmailStr # Podríamos usarlo para validar el formato del email si el username fuera un campo de un schema
 
 router = APIRouter()
 
-# Simulación de una base de datos de usuarios o un servicio de autenticación.
 # El 'username' que espera OAuth2PasswordRequestForm será el email.
-USUARIO_AUTORIZADO_EMAIL = "admin@clinicabak.cl"
-CONTRASENA_AUTORIZADA = "admin" # Mantener simple para la demo
+#
+# El login no usa Depends(get_connection): esa conexión quedaría tomada mientras se calcula el hash
+# (decenas de ms en el pool de procesos) y una ráfaga de logins agotaría el pool de conexiones.
+# Cada acceso a la BD toma una conexión del pool y la devuelve apenas termina.
 
-# En una aplicación real, esta función consultaría la tabla Usuarios por email.
-# Y la contraseña estaría hasheada.
-def obtener_usuario_por_email(email: str) -> Optional[Dict[str, any]]:
+def obtener_usuario_por_email(email: str) -> Optional[Dict[str, Any]]:
     """
-    Simula la obtención de un usuario de la base de datos por email.
+    Obtiene de la tabla Usuarios los datos necesarios para autenticar (incluido contrasena_hash).
     """
-    if email.lower() == USUARIO_AUTORIZADO_EMAIL.lower():
-        return {
-            "email": USUARIO_AUTORIZADO_EMAIL,
-            "hashed_password": CONTRASENA_AUTORIZADA, # Simula contraseña "hasheada"
-            "nombre_completo": "Usuario Admin BAK", # Nombre de ejemplo
-            "rol": "administrador", # Rol de ejemplo
-            "activo": True,
-            "id_usuario": 1 # ID de ejemplo
-            # Podríamos añadir el RUT aquí si es necesario para el token o la app
-            # "rut": "11.111.111-1"
-        }
-    return None
+    query = """
+        SELECT id_usuario, email, nombre, apellido, rol, activo, contrasena_hash
+        FROM Usuarios WHERE email = ?
+    """
+    with conexion_pool() as db:
+        with db.cursor() as cursor:
+            cursor.execute(query, email, etiqueta="auth.usuario_por_email")
+            row = cursor.fetchone()
+            if not row:
+                return None
+            columns = [col[0] for col in cursor.description]
+            return dict(zip(columns, row))
+
+
+def registrar_acceso(id_usuario: int, nuevo_hash: Optional[str]) -> None:
+    """Actualiza ultimo_acceso y, si corresponde, reemplaza el hash por uno con los parámetros actuales."""
+    with conexion_pool() as db:
+        with db.cursor() as cursor:
+            if nuevo_hash:
+                cursor.execute("UPDATE Usuarios SET ultimo_acceso = GETUTCDATE(), contrasena_hash = ? WHERE id_usuario = ?", nuevo_hash, id_usuario, etiqueta="auth.acceso.rehash")
+            else:
+                cursor.execute("UPDATE Usuarios SET ultimo_acceso = GETUTCDATE() WHERE id_usuario = ?", id_usuario, etiqueta="auth.acceso")
+            db.commit()
+
 
 @router.post("/login", response_model=Dict[str, str]) # El response_model sigue siendo el token
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Endpoint de login. Valida credenciales (email y contraseña) y devuelve un token de acceso.
     FastAPI espera que el cliente envíe 'username' (que será nuestro email) y 'password'.
+    El acceso a BD va al threadpool y el hashing al pool de procesos, así el event loop
+    queda libre aunque lleguen muchos logins a la vez; mientras se calcula el hash no se
+    ocupa ninguna conexión.
     """
-    # Aquí form_data.username es el email enviado por el cliente.
-    usuario_db = obtener_usuario_por_email(form_data.username)
+    credenciales_invalidas = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Email o contraseña incorrectos", # Mensaje genérico
+        headers={"WWW-Authenticate": "Bearer"},
+    )
 
-    if not usuario_db:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Email o contraseña incorrectos", # Mensaje genérico
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    # El límite por IP ya lo aplicó LimiteTasaMiddleware; este es por cuenta
+    await limitar_login_por_usuario(form_data.username)
 
-    # Comparación directa de contraseña (NO PARA PRODUCCIÓN)
-    if form_data.password != usuario_db['hashed_password']:
+    try:
+        usuario_db = await run_in_threadpool(obtener_usuario_por_email, form_data.username)
+    except TimeoutError:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Email o contraseña incorrectos",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio está ocupado. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": "1"},
         )
+    except pyodbc.Error as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al autenticar: {str(e)[:200]}")
+
+    hash_guardado = usuario_db["contrasena_hash"] if usuario_db else None
+    if not await verificar_contrasena_async(form_data.password, hash_guardado):
+        raise credenciales_invalidas
+    if not usuario_db.get("activo"):
+        raise credenciales_invalidas
 
-    # Generación de token (simulado)
-    # En una implementación real, el "sub" del token JWT podría ser el email o el id_usuario.
-    # access_token_subject = usuario_db["email"] # o usuario_db["id_usuario"]
-    # access_token = create_access_token(data={"sub": access_token_subject, "rol": usuario_db["rol"]})
+    # Rehash transparente: hashes legados o con parámetros de costo antiguos se regeneran ahora,
+    # que es el único momento en que se conoce la contraseña en claro.
+    nuevo_hash = await generar_hash_contrasena_async(form_data.password) if necesita_rehash(hash_guardado) else None
+    try:
+        await run_in_threadpool(registrar_acceso, usuario_db["id_usuario"], nuevo_hash)
+    except (pyodbc.Error, TimeoutError) as e:
+        print(f"No se pudo registrar el acceso del usuario {usuario_db['id_usuario']}: {e}")
 
-    access_token = f"fake_jwt_token_for_{usuario_db['email']}" # Token simulado
+    permisos.registrar_usuario(usuario_db["id_usuario"], usuario_db["rol"], usuario_db["activo"])
+    access_token = crear_token_acceso(usuario_db["id_usuario"], usuario_db["email"], usuario_db["rol"])
 
     return {"access_token": access_token, "token_type": "bearer"}
 
-# Opcional: Endpoint /me para obtener datos del usuario autenticado (requiere manejo de token)
-# from app.schemas.user_schema import UserPublic # Suponiendo que UserPublic es el schema de respuesta
-# async def get_current_active_user(token: str = Depends(oauth2_scheme)): ... (necesitaría oauth2_scheme)
-# @router.get("/me", response_model=UserPublic)
-# async def read_users_me(current_user: UserPublic = Depends(get_current_active_user)):
-#    return current_user
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(usuario: UsuarioAutenticado = Depends(get_current_user)):
+    """
+    Revoca el token actual: en este worker al momento y, vía la tabla TokensRevocados, en los demás
+    a los pocos segundos (JWT_SEGUNDOS_SINCRONIZACION_REVOCADOS) y en los que arranquen después.
+    """
+    try:
+        revocar_token(usuario.jti, usuario.exp)
+    except (pyodbc.Error, TimeoutError) as e:
+        # Sin la fila en TokensRevocados el token sigue vigente en todos lados: el cliente debe reintentar
+        print(f"Error registrando el logout: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No se pudo cerrar la sesión, intente nuevamente",
+            headers={"Retry-After": "1"},
+        )
+    return None
+
+
+@router.get("/me", response_model=UsuarioAutenticado)
+def read_users_me(usuario: UsuarioAutenticado = Depends(get_current_user)):
+    return usuario
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+from typing import Tuple
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app.core.limite_tasa import cobrar
+from app.core.tokens import get_current_user
+from app.schemas.batch_schema import LoteRequest, LoteResponse, SolicitudLote
+from app.schemas.user_schema import UsuarioAutenticado
+
+router = APIRouter()
+
+# Sub-solicitudes de un mismo lote que se atienden a la vez. Cada una que use la BD toma su
+# conexión del pool (app/database.py), que además acota el total entre todos los requests.
+CONCURRENCIA_LOTE = int(os.getenv("BATCH_CONCURRENCIA", "4"))
+
+# Del request original solo pasan estos headers a las sub-solicitudes
+_HEADERS_HEREDADOS = frozenset({b"authorization", b"accept", b"accept-language", b"user-agent"})
+_SCOPE_DEL_REQUEST = ("route", "endpoint", "path_params", "fastapi_inner_astack", "fastapi_function_astack")
+
+
+@router.post("", response_model=None, responses={200: {"model": LoteResponse}})
+async def ejecutar_lote(lote: LoteRequest, request: Request, usuario: UsuarioAutenticado = Depends(get_current_user)):
+    """
+    Ejecuta varias lecturas (GET) en un solo request, p. ej. todo lo que carga el dashboard.
+    Cada sub-solicitud pasa por el enrutador como si llegara sola (permisos, validación, caché) y
+    su resultado se devuelve con el código y el cuerpo que habría tenido; que una falle no afecta
+    a las demás.
+    """
+    for solicitud in lote.solicitudes:
+        partes = urlsplit(solicitud.url)
+        if partes.scheme or partes.netloc or not partes.path.startswith("/"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"La URL de '{solicitud.id}' debe ser una ruta de esta API (ej: /reportes/kpis).")
+    if len({solicitud.id for solicitud in lote.solicitudes}) != len(lote.solicitudes):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Los id de las solicitudes deben ser únicos.")
+    # Las sub-solicitudes no pasan por LimiteTasaMiddleware: cada una cuenta como una lectura. El
+    # middleware ya cobró una por el POST; aquí se cobra el resto en el mismo balde.
+    if len(lote.solicitudes) > 1:
+        await cobrar("lectura", f"usuario:{usuario.id_usuario}", len(lote.solicitudes) - 1)
+
+    cupos = asyncio.Semaphore(CONCURRENCIA_LOTE)
+
+    async def ejecutar(solicitud: SolicitudLote) -> Tuple[int, bytes]:
+        async with cupos:
+            return await _sub_solicitud(request, solicitud.url)
+
+    resultados = await asyncio.gather(*(ejecutar(solicitud) for solicitud in lote.solicitudes))
+
+    # Los cuerpos ya vienen serializados en JSON: se insertan tal cual, sin decodificar y volver a codificar
+    respuestas = [
+        b'{"id":' + json.dumps(solicitud.id).encode() + b',"estado":' + str(estado).encode() + b',"cuerpo":' + cuerpo + b"}"
+        for solicitud, (estado, cuerpo) in zip(lote.solicitudes, resultados)
+    ]
+    return Response(content=b'{"respuestas":[' + b",".join(respuestas) + b"]}", media_type="application/json")
+
+
+async def _sub_solicitud(request: Request, url: str) -> Tuple[int, bytes]:
+    """Atiende un GET por el enrutador de la app, sin repetir los middlewares. Devuelve (estado, cuerpo JSON)."""
+    partes = urlsplit(url)
+    scope = {clave: valor for clave, valor in request.scope.items() if clave not in _SCOPE_DEL_REQUEST}
+    ruta = request.scope.get("root_path", "") + partes.path
+    scope.update(
+        method="GET",
+        path=ruta,
+        raw_path=ruta.encode(),
+        query_string=partes.query.encode(),
+        headers=[(nombre, valor) for nombre, valor in request.scope["headers"] if nombre in _HEADERS_HEREDADOS],
+    )
+
+    inicio = {}
+    cuerpo = []
+
+    async def recibir():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def enviar(mensaje):
+        if mensaje["type"] == "http.response.start":
+            inicio.update(mensaje)
+        elif mensaje["type"] == "http.response.body":
+            cuerpo.append(mensaje.get("body", b""))
+
+    try:
+        await request.app.router(scope, recibir, enviar)
+    except StarletteHTTPException as e:
+        # Ruta inexistente (404) o que no acepta GET (405): el enrutador las lanza en vez de responder
+        return e.status_code, json.dumps({"detail": e.detail}).encode()
+    except Exception as e:
+        print(f"Error en la sub-solicitud GET {url} del lote: {e}")
+        return 500, b'{"detail":"Error interno del servidor"}'
+
+    contenido = b"".join(cuerpo)
+    tipo = next((valor for nombre, valor in inicio.get("headers", []) if nombre.lower() == b"content-type"), b"")
+    if not contenido:
+        contenido = b"null"
+    elif not tipo.startswith(b"application/json"):
+        contenido = json.dumps(contenido.decode("utf-8", "replace")).encode()
+    return inicio.get("status", 500), contenido
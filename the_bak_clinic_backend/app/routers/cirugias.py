@@ -1,14 +1,45 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
+from typing import Dict, List, Optional, Tuple
 from app.database import get_connection
 import pyodbc
-from app.schemas.cirugia_schema import CirugiaCreate, CirugiaUpdate, CirugiaPublic, CirugiaListResponse
-from datetime import datetime, date
+from app.schemas.cirugia_schema import (
+    CirugiaCreate, CirugiaUpdate, CirugiaPublic, CirugiaListResponse,
+    CirugiaLoteCreate, CirugiaLoteResultado, CirugiaLoteResponse,
+)
+from app.services.cola_limpieza import cola_limpieza
+from app.services.rotacion_quirofanos import EVENTO_CIRUGIA_REALIZADA, predictor_rotacion
+from app.core.eventos import publicar_evento, procesador_eventos
+from app.core.tiempos import FASE_MAPEO, medido
+from app.core.sentencias import ActualizacionTabla, ENTERO, FECHA_HORA, texto
+from app.core.concurrencia import error_actualizacion, etag, version_if_match
+from app.core.proyecciones import Proyeccion, Proyecciones, respuesta_json
+from datetime import datetime, date, timedelta
+from functools import lru_cache
 
 router = APIRouter()
 
+COLUMNAS_CIRUGIA = [
+    "id_cirugia", "id_paciente", "id_medico_principal", "id_quirofano", "nombre_quirofano",
+    "fecha_hora_inicio_programada", "duracion_estimada_minutos", "fecha_hora_fin_programada",
+    "tipo_cirugia", "estado_cirugia", "notas_preoperatorias", "notas_postoperatorias",
+    "fecha_creacion_registro", "fecha_ultima_modificacion", "version",
+]
+
+# ?fields= en GET /cirugias y GET /cirugias/{id} (p. ej. el calendario sin las notas)
+PROYECCIONES_CIRUGIA = Proyecciones(COLUMNAS_CIRUGIA, obligatorias=["id_cirugia", "version"])
+SELECT_CIRUGIA = ", ".join(COLUMNAS_CIRUGIA)
+
+# Columnas que puede cambiar PUT /cirugias/{id}; fecha_ultima_modificacion la pone el router
+ACTUALIZACION_CIRUGIAS = ActualizacionTabla("Cirugias", "id_cirugia", {
+    "id_paciente": ENTERO, "id_medico_principal": ENTERO, "id_quirofano": ENTERO, "nombre_quirofano": texto(100),
+    "fecha_hora_inicio_programada": FECHA_HORA, "duracion_estimada_minutos": ENTERO, "tipo_cirugia": texto(255),
+    "estado_cirugia": texto(50), "notas_preoperatorias": texto(), "notas_postoperatorias": texto(),
+    "fecha_ultima_modificacion": FECHA_HORA,
+}, salida=COLUMNAS_CIRUGIA, version="version")
+
 # --- Funciones Auxiliares ---
 
+@medido(FASE_MAPEO)
 def db_row_to_cirugia_public(row: pyodbc.Row, columns: List[str]) -> CirugiaPublic:
     """Convierte una fila de la base de datos a un objeto CirugiaPublic."""
     cirugia_data_raw = dict(zip(columns, row))
@@ -39,6 +70,158 @@ def db_row_to_cirugia_public(row: pyodbc.Row, columns: List[str]) -> CirugiaPubl
         raise HTTPException(status_code=500, detail=f"Error de validación de datos de la cirugía: {str(e)[:200]}")
 
 
+def calcular_fecha_fin(cirugia_in: CirugiaCreate) -> Optional[datetime]:
+    """Devuelve la fecha de término informada o la calcula a partir de la duración estimada."""
+    if cirugia_in.fecha_hora_fin_programada:
+        return cirugia_in.fecha_hora_fin_programada
+    if cirugia_in.duracion_estimada_minutos:
+        return cirugia_in.fecha_hora_inicio_programada + timedelta(minutes=cirugia_in.duracion_estimada_minutos)
+    return None
+
+
+def agrupar_quirofanos(cirugias: List[CirugiaCreate]) -> Tuple[List[Optional[tuple]], Dict[tuple, str]]:
+    """
+    Quirófano de cada cirugía del lote, como un grupo común a id_quirofano y nombre_quirofano: una
+    cirugía que trae ambos los une, así que otra que trae solo uno de los dos cae en el mismo grupo
+    (unión-búsqueda sobre las claves del lote). Devuelve (grupo por índice, None si no indica
+    quirófano) y el nombre conocido de cada grupo.
+    """
+    padre: Dict[tuple, tuple] = {}
+
+    def raiz(clave: tuple) -> tuple:
+        while padre.setdefault(clave, clave) != clave:
+            padre[clave] = padre[padre[clave]]
+            clave = padre[clave]
+        return clave
+
+    claves: List[Optional[tuple]] = []
+    for cirugia in cirugias:
+        propias = []
+        if cirugia.id_quirofano is not None:
+            propias.append(("id", cirugia.id_quirofano))
+        if cirugia.nombre_quirofano:
+            propias.append(("nombre", cirugia.nombre_quirofano))
+        for clave in propias[1:]:
+            padre[raiz(clave)] = raiz(propias[0])
+        claves.append(propias[0] if propias else None)
+
+    grupos = [raiz(clave) if clave is not None else None for clave in claves]
+    nombres: Dict[tuple, str] = {}
+    for grupo, cirugia in zip(grupos, cirugias):
+        if grupo is not None and cirugia.nombre_quirofano:
+            nombres.setdefault(grupo, cirugia.nombre_quirofano)
+    return grupos, nombres
+
+
+def detectar_solapamientos(cirugias: List[CirugiaCreate], fechas_fin: List[Optional[datetime]]) -> Dict[int, str]:
+    """
+    Detecta cirugías del mismo lote que se solapan en quirófano o médico.
+    Ordena una sola vez por recurso y recorre los intervalos guardando el término máximo visto,
+    por lo que el costo es O(n log n) en vez de comparar todas las parejas.
+    Devuelve {indice: motivo} para las cirugías que chocan con una anterior del lote.
+    """
+    grupos, nombres = agrupar_quirofanos(cirugias)
+    intervalos_por_recurso: Dict[Tuple[str, object], List[Tuple[datetime, datetime, int]]] = {}
+    for indice, (cirugia, fin, grupo) in enumerate(zip(cirugias, fechas_fin, grupos)):
+        inicio = cirugia.fecha_hora_inicio_programada
+        termino = fin or inicio
+        if grupo is not None:
+            intervalos_por_recurso.setdefault(("quirófano", grupo), []).append((inicio, termino, indice))
+        intervalos_por_recurso.setdefault(("médico", cirugia.id_medico_principal), []).append((inicio, termino, indice))
+
+    conflictos: Dict[int, str] = {}
+    for (tipo_recurso, recurso), intervalos in intervalos_por_recurso.items():
+        if tipo_recurso == "quirófano":
+            recurso = nombres.get(recurso, recurso[1])
+        intervalos.sort()
+        termino_max, indice_max, inicio_previo = None, None, None
+        for inicio, termino, indice in intervalos:
+            if termino_max is not None and (inicio < termino_max or inicio == inicio_previo):
+                conflictos.setdefault(indice, f"Se solapa en {tipo_recurso} '{recurso}' con la cirugía del índice {indice_max} del mismo lote.")
+            if termino_max is None or termino > termino_max:
+                termino_max, indice_max = termino, indice
+            inicio_previo = inicio
+    return conflictos
+
+
+def advertir_rotaciones(cirugias: List[CirugiaCreate], fechas_fin: List[Optional[datetime]], excluidas: Dict[int, str]) -> Dict[int, str]:
+    """
+    Revisa la holgura entre cirugías consecutivas del lote en un mismo quirófano contra la rotación
+    que predice el historial (p90). Devuelve {indice: advertencia}; no rechaza la cirugía.
+    Agrupa por quirófano igual que detectar_solapamientos; el historial es por nombre, así que un
+    grupo sin nombre conocido en el lote no se revisa.
+    """
+    grupos, nombres = agrupar_quirofanos(cirugias)
+    por_quirofano: Dict[tuple, List[Tuple[datetime, int]]] = {}
+    for indice, (cirugia, grupo) in enumerate(zip(cirugias, grupos)):
+        if indice not in excluidas and grupo in nombres:
+            por_quirofano.setdefault(grupo, []).append((cirugia.fecha_hora_inicio_programada, indice))
+
+    advertencias: Dict[int, str] = {}
+    for grupo, agenda in por_quirofano.items():
+        nombre_quirofano = nombres[grupo]
+        agenda.sort()
+        for (_, anterior), (inicio, indice) in zip(agenda, agenda[1:]):
+            fin_anterior = fechas_fin[anterior]
+            if fin_anterior is None:
+                continue
+            prediccion = predictor_rotacion.predecir(nombre_quirofano, fin_anterior)
+            holgura = (inicio - fin_anterior).total_seconds() / 60
+            if holgura < prediccion.p90_minutos:
+                advertencias[indice] = (
+                    f"Solo {holgura:.0f} min después de la cirugía del índice {anterior} en '{nombre_quirofano}'; "
+                    f"la rotación suele tomar {prediccion.mediana_minutos:.0f} min (p90 {prediccion.p90_minutos:.0f} min)."
+                )
+    return advertencias
+
+
+# Claves de orden aceptadas por list_cirugias -> columna. Solo se interpolan columnas de esta lista.
+CAMPOS_ORDEN_CIRUGIAS = {
+    "fecha": "fecha_hora_inicio_programada",
+    "tipo": "tipo_cirugia",
+    "estado": "estado_cirugia",
+    "quirofano": "nombre_quirofano",
+    "medico": "id_medico_principal",
+    "modificacion": "fecha_ultima_modificacion",
+    "id": "id_cirugia",
+}
+
+
+def escapar_like(texto: str) -> str:
+    """Escapa los comodines de LIKE de SQL Server para buscar el texto literal."""
+    return texto.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+
+
+COLUMNAS_INSERT_CIRUGIA = (
+    "id_paciente", "id_medico_principal", "id_quirofano", "nombre_quirofano",
+    "fecha_hora_inicio_programada", "duracion_estimada_minutos", "fecha_hora_fin_programada",
+    "tipo_cirugia", "estado_cirugia", "notas_preoperatorias", "notas_postoperatorias",
+)
+# SQL Server admite como máximo 2100 parámetros por sentencia; cada fila usa len(COLUMNAS_INSERT_CIRUGIA) + 1.
+FILAS_POR_SENTENCIA_LOTE = 150
+
+
+@lru_cache(maxsize=8)
+def sentencia_insert_lote(cantidad_filas: int) -> str:
+    """
+    Construye un MERGE de inserción para `cantidad_filas` cirugías.
+    Se usa MERGE en lugar de INSERT porque su OUTPUT puede incluir columnas del origen,
+    lo que permite relacionar cada id_cirugia generado con el índice del lote.
+    """
+    fila_valores = "(" + ", ".join(["?"] * (len(COLUMNAS_INSERT_CIRUGIA) + 1)) + ")"
+    columnas = ", ".join(COLUMNAS_INSERT_CIRUGIA)
+    columnas_origen = ", ".join(f"origen.{col}" for col in COLUMNAS_INSERT_CIRUGIA)
+    return f"""
+        MERGE INTO Cirugias AS destino
+        USING (VALUES {", ".join([fila_valores] * cantidad_filas)}) AS origen (indice, {columnas})
+        ON 1 = 0
+        WHEN NOT MATCHED THEN
+            INSERT ({columnas}, fecha_creacion_registro, fecha_ultima_modificacion)
+            VALUES ({columnas_origen}, GETUTCDATE(), GETUTCDATE())
+        OUTPUT origen.indice, INSERTED.*;
+    """
+
+
 # --- Endpoints CRUD para Cirugías ---
 
 @router.post("/", response_model=CirugiaPublic, status_code=status.HTTP_201_CREATED)
@@ -62,12 +245,7 @@ def create_cirugia(cirugia_in: CirugiaCreate, db: pyodbc.Connection = Depends(ge
     """
     # GETUTCDATE() es para SQL Server.
     # Calcular fecha_hora_fin_programada si no se provee y hay duración
-    fecha_fin_calculada = None
-    if cirugia_in.fecha_hora_fin_programada:
-        fecha_fin_calculada = cirugia_in.fecha_hora_fin_programada
-    elif cirugia_in.duracion_estimada_minutos:
-        from datetime import timedelta
-        fecha_fin_calculada = cirugia_in.fecha_hora_inicio_programada + timedelta(minutes=cirugia_in.duracion_estimada_minutos)
+    fecha_fin_calculada = calcular_fecha_fin(cirugia_in)
 
     params = (
         cirugia_in.id_paciente, cirugia_in.id_medico_principal, cirugia_in.id_quirofano, cirugia_in.nombre_quirofano,
@@ -77,7 +255,7 @@ def create_cirugia(cirugia_in: CirugiaCreate, db: pyodbc.Connection = Depends(ge
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_insert, params)
+            cursor.execute(query_insert, params, etiqueta="cirugias.create.insert")
             created_row = cursor.fetchone()
             if not created_row:
                 db.rollback()
@@ -86,7 +264,9 @@ def create_cirugia(cirugia_in: CirugiaCreate, db: pyodbc.Connection = Depends(ge
             db.commit()
             columns = [col[0] for col in cursor.description]
             # La fila devuelta por OUTPUT INSERTED.* ya tiene fecha_creacion_registro y fecha_ultima_modificacion
-            return db_row_to_cirugia_public(created_row, columns)
+            cirugia = db_row_to_cirugia_public(created_row, columns)
+            cola_limpieza.registrar_cirugia(cirugia.nombre_quirofano, cirugia.fecha_hora_inicio_programada, cirugia.estado_cirugia)
+            return cirugia
 
         except pyodbc.IntegrityError as e: # Foreign key constraints, etc.
             db.rollback()
@@ -103,35 +283,97 @@ def create_cirugia(cirugia_in: CirugiaCreate, db: pyodbc.Connection = Depends(ge
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al agendar cirugía: {str(e)[:200]}")
 
 
+@router.post("/lote", response_model=CirugiaLoteResponse, status_code=status.HTTP_201_CREATED)
+def create_cirugias_lote(lote_in: CirugiaLoteCreate, db: pyodbc.Connection = Depends(get_connection)):
+    """
+    Agenda muchas cirugías en una sola transacción.
+    Las cirugías inválidas (término anterior al inicio o solapadas con otra del lote en quirófano
+    o médico) se rechazan individualmente; las válidas se insertan en bloques de
+    FILAS_POR_SENTENCIA_LOTE filas por sentencia y se confirman con un único commit.
+    """
+    cirugias = lote_in.cirugias
+    fechas_fin = [calcular_fecha_fin(c) for c in cirugias]
+
+    errores: Dict[int, str] = {}
+    for indice, (cirugia, fin) in enumerate(zip(cirugias, fechas_fin)):
+        if fin is not None and fin <= cirugia.fecha_hora_inicio_programada:
+            errores[indice] = "La fecha de término debe ser posterior a la de inicio."
+    for indice, motivo in detectar_solapamientos(cirugias, fechas_fin).items():
+        errores.setdefault(indice, motivo)
+
+    filas_validas = [
+        (indice, c.id_paciente, c.id_medico_principal, c.id_quirofano, c.nombre_quirofano,
+         c.fecha_hora_inicio_programada, c.duracion_estimada_minutos, fechas_fin[indice],
+         c.tipo_cirugia, c.estado_cirugia, c.notas_preoperatorias, c.notas_postoperatorias)
+        for indice, c in enumerate(cirugias) if indice not in errores
+    ]
+
+    creadas: Dict[int, CirugiaPublic] = {}
+    if filas_validas:
+        with db.cursor() as cursor:
+            try:
+                for inicio_bloque in range(0, len(filas_validas), FILAS_POR_SENTENCIA_LOTE):
+                    bloque = filas_validas[inicio_bloque:inicio_bloque + FILAS_POR_SENTENCIA_LOTE]
+                    params = tuple(valor for fila in bloque for valor in fila)
+                    cursor.execute(sentencia_insert_lote(len(bloque)), params, etiqueta="cirugias.lote.insert")
+                    rows = cursor.fetchall()
+                    columns = [col[0] for col in cursor.description]
+                    for row in rows:
+                        creadas[row[0]] = db_row_to_cirugia_public(row[1:], columns[1:])
+
+                if len(creadas) != len(filas_validas):
+                    db.rollback()
+                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo agendar el lote (la inserción no devolvió todas las filas).")
+                db.commit()
+                for cirugia in creadas.values():
+                    cola_limpieza.registrar_cirugia(cirugia.nombre_quirofano, cirugia.fecha_hora_inicio_programada, cirugia.estado_cirugia)
+
+            except pyodbc.IntegrityError as e:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al agendar el lote; no se agendó ninguna cirugía. Verifique IDs de paciente, médico, quirófano. (Error DB: {str(e)[:100]})")
+            except HTTPException:
+                raise
+            except Exception as e:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al agendar el lote de cirugías: {str(e)[:200]}")
+
+    advertencias = advertir_rotaciones(cirugias, fechas_fin, errores)
+    resultados = [
+        CirugiaLoteResultado(indice=indice, creada=indice in creadas, cirugia=creadas.get(indice),
+                             error=errores.get(indice), advertencia=advertencias.get(indice))
+        for indice in range(len(cirugias))
+    ]
+    return CirugiaLoteResponse(resultados=resultados, total_creadas=len(creadas), total_rechazadas=len(errores))
+
+
 @router.get("/", response_model=CirugiaListResponse)
 def list_cirugias(
     fecha_desde: Optional[date] = Query(None, description="Filtrar cirugías desde esta fecha (YYYY-MM-DD)"),
     fecha_hasta: Optional[date] = Query(None, description="Filtrar cirugías hasta esta fecha (YYYY-MM-DD)"),
     id_paciente: Optional[int] = Query(None),
     id_medico: Optional[int] = Query(None),
-    estado: Optional[str] = Query(None),
-    skip: int = 0,
-    limit: int = 100,
+    estado: Optional[List[str]] = Query(None, description="Uno o más estados (?estado=Programada&estado=Confirmada)"),
+    nombre_quirofano: Optional[List[str]] = Query(None, description="Uno o más quirófanos"),
+    q: Optional[str] = Query(None, max_length=100, description="Texto a buscar en tipo de cirugía y notas"),
+    orden: str = Query("fecha", description=f"Campo de orden; prefijo '-' para descendente. Opciones: {', '.join(CAMPOS_ORDEN_CIRUGIAS)}"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_CIRUGIA.parametro),
     db: pyodbc.Connection = Depends(get_connection)
 ):
-    select_query = """
-        SELECT id_cirugia, id_paciente, id_medico_principal, id_quirofano, nombre_quirofano,
-               fecha_hora_inicio_programada, duracion_estimada_minutos, fecha_hora_fin_programada,
-               tipo_cirugia, estado_cirugia, notas_preoperatorias, notas_postoperatorias,
-               fecha_creacion_registro, fecha_ultima_modificacion
-        FROM Cirugias
-    """
+    select_query = f"SELECT {proyeccion.select if proyeccion else SELECT_CIRUGIA} FROM Cirugias"
     count_query = "SELECT COUNT(*) FROM Cirugias"
 
     where_clauses = []
     params = []
 
+    # Comparar la columna directamente (sin CONVERT) permite usar los índices por fecha
     if fecha_desde:
-        where_clauses.append("CONVERT(date, fecha_hora_inicio_programada) >= ?")
-        params.append(fecha_desde)
+        where_clauses.append("fecha_hora_inicio_programada >= ?")
+        params.append(datetime.combine(fecha_desde, datetime.min.time()))
     if fecha_hasta:
-        where_clauses.append("CONVERT(date, fecha_hora_inicio_programada) <= ?")
-        params.append(fecha_hasta)
+        where_clauses.append("fecha_hora_inicio_programada < ?")
+        params.append(datetime.combine(fecha_hasta + timedelta(days=1), datetime.min.time()))
     if id_paciente is not None:
         where_clauses.append("id_paciente = ?")
         params.append(id_paciente)
@@ -139,15 +381,29 @@ def list_cirugias(
         where_clauses.append("id_medico_principal = ?")
         params.append(id_medico)
     if estado:
-        where_clauses.append("estado_cirugia = ?")
-        params.append(estado)
+        where_clauses.append(f"estado_cirugia IN ({', '.join(['?'] * len(estado))})")
+        params.extend(estado)
+    if nombre_quirofano:
+        where_clauses.append(f"nombre_quirofano IN ({', '.join(['?'] * len(nombre_quirofano))})")
+        params.extend(nombre_quirofano)
+    if q and q.strip():
+        patron = f"%{escapar_like(q.strip())}%"
+        where_clauses.append("(tipo_cirugia LIKE ? OR notas_preoperatorias LIKE ? OR notas_postoperatorias LIKE ?)")
+        params.extend([patron, patron, patron])
+
+    descendente = orden.startswith("-")
+    columna_orden = CAMPOS_ORDEN_CIRUGIAS.get(orden.lstrip("-"))
+    if not columna_orden:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Orden '{orden}' no válido. Opciones: {', '.join(CAMPOS_ORDEN_CIRUGIAS)}.")
+    direccion = "DESC" if descendente else "ASC"
 
     if where_clauses:
         where_sql = " WHERE " + " AND ".join(where_clauses)
         select_query += where_sql
         count_query += where_sql
 
-    select_query += " ORDER BY fecha_hora_inicio_programada OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+    # id_cirugia desempata para que la paginación sea estable
+    select_query += f" ORDER BY {columna_orden} {direccion}, id_cirugia {direccion} OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
     # Convert params to tuple for pyodbc for the main query
     paged_params = tuple(params + [skip, limit])
 
@@ -156,13 +412,15 @@ def list_cirugias(
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(count_query, tuple(params)) # Params for count query (without skip/limit)
+            cursor.execute(count_query, tuple(params), etiqueta="cirugias.list.count") # Params for count query (without skip/limit)
             count_row = cursor.fetchone()
             if count_row:
                 total_count = count_row[0]
 
-            cursor.execute(select_query, paged_params)
+            cursor.execute(select_query, paged_params, etiqueta="cirugias.list.page")
             rows = cursor.fetchall()
+            if proyeccion:
+                return respuesta_json({"cirugias": proyeccion.filas(rows), "total": total_count})
             if rows:
                 columns = [col[0] for col in cursor.description]
                 for row in rows:
@@ -175,23 +433,26 @@ def list_cirugias(
 
 
 @router.get("/{cirugia_id}", response_model=CirugiaPublic)
-def get_cirugia(cirugia_id: int, db: pyodbc.Connection = Depends(get_connection)):
-    query = """
-        SELECT id_cirugia, id_paciente, id_medico_principal, id_quirofano, nombre_quirofano,
-               fecha_hora_inicio_programada, duracion_estimada_minutos, fecha_hora_fin_programada,
-               tipo_cirugia, estado_cirugia, notas_preoperatorias, notas_postoperatorias,
-               fecha_creacion_registro, fecha_ultima_modificacion
-        FROM Cirugias WHERE id_cirugia = ?
-    """
+def get_cirugia(
+    cirugia_id: int, response: Response,
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_CIRUGIA.parametro),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    query = f"SELECT {proyeccion.select if proyeccion else SELECT_CIRUGIA} FROM Cirugias WHERE id_cirugia = ?"
     with db.cursor() as cursor:
         try:
-            cursor.execute(query, cirugia_id)
+            cursor.execute(query, cirugia_id, etiqueta="cirugias.get")
             row = cursor.fetchone()
             if not row:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Cirugía con ID {cirugia_id} no encontrada.")
 
+            if proyeccion:
+                fila, = proyeccion.filas([row])
+                return respuesta_json(fila, headers={"ETag": etag(fila["version"])})
             columns = [col[0] for col in cursor.description]
-            return db_row_to_cirugia_public(row, columns)
+            cirugia = db_row_to_cirugia_public(row, columns)
+            response.headers["ETag"] = etag(cirugia.version)
+            return cirugia
         except HTTPException:
             raise
         except Exception as e:
@@ -199,7 +460,10 @@ def get_cirugia(cirugia_id: int, db: pyodbc.Connection = Depends(get_connection)
 
 
 @router.put("/{cirugia_id}", response_model=CirugiaPublic)
-def update_cirugia(cirugia_id: int, cirugia_in: CirugiaUpdate, db: pyodbc.Connection = Depends(get_connection)):
+def update_cirugia(
+    cirugia_id: int, cirugia_in: CirugiaUpdate, response: Response,
+    version: int = Depends(version_if_match), db: pyodbc.Connection = Depends(get_connection),
+):
     update_data = cirugia_in.dict(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
@@ -208,44 +472,31 @@ def update_cirugia(cirugia_id: int, cirugia_in: CirugiaUpdate, db: pyodbc.Connec
     update_data["fecha_ultima_modificacion"] = datetime.utcnow()
 
     with db.cursor() as cursor:
-        # Verificar si la cirugía existe
-        cursor.execute("SELECT id_cirugia FROM Cirugias WHERE id_cirugia = ?", cirugia_id)
-        if not cursor.fetchone():
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Cirugía con ID {cirugia_id} no encontrada para actualizar.")
-
-        # Validar IDs si se están cambiando (paciente, medico, etc.)
-        # if 'id_paciente' in update_data: ... (similar a la validación en create)
-
-        set_clause_parts = [f"[{key}] = ?" for key in update_data.keys()]
-        params = list(update_data.values())
-        params.append(cirugia_id)
-        set_clause = ", ".join(set_clause_parts)
-
-        query_update = f"UPDATE Cirugias SET {set_clause} WHERE id_cirugia = ?"
-
         try:
-            cursor.execute(query_update, tuple(params))
-            db.commit()
-
-            # Devolver la cirugía actualizada usando la función get_cirugia
-            # Esto asegura que se devuelva el mismo formato y se evite duplicar la lógica de selección.
-            # Necesitamos crear un nuevo cursor para esto, ya que get_cirugia espera su propia conexión/cursor.
-            # O, mejor, replicar la lógica de get_cirugia aquí con el cursor actual.
-
-            query_select_updated = """
-                SELECT id_cirugia, id_paciente, id_medico_principal, id_quirofano, nombre_quirofano,
-                       fecha_hora_inicio_programada, duracion_estimada_minutos, fecha_hora_fin_programada,
-                       tipo_cirugia, estado_cirugia, notas_preoperatorias, notas_postoperatorias,
-                       fecha_creacion_registro, fecha_ultima_modificacion
-                FROM Cirugias WHERE id_cirugia = ?
-            """
-            cursor.execute(query_select_updated, cirugia_id)
+            # Un solo viaje: el UPDATE devuelve la fila nueva (OUTPUT INSERTED) si la versión coincide;
+            # si no, la versión actual (412) o nada (404). Los IDs cambiados (paciente, médico,
+            # quirófano) los validan las FK: violarlas es un 409.
+            ACTUALIZACION_CIRUGIAS.ejecutar(cursor, update_data, cirugia_id, etiqueta="cirugias.update.update", version=version)
             updated_db_row = cursor.fetchone()
             if not updated_db_row:
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error crítico: Cirugía no encontrada después de actualización.")
+                error = error_actualizacion(cursor, f"Cirugía con ID {cirugia_id} no encontrada para actualizar.")
+                db.rollback()
+                raise error
+
+            # Al finalizar la cirugía se publica el evento en la misma transacción; marcar el quirófano
+            # y encolar su limpieza lo hace el procesador de eventos sin demorar esta respuesta.
+            finalizada = update_data.get("estado_cirugia") == "Realizada"
+            if finalizada:
+                publicar_evento(cursor, EVENTO_CIRUGIA_REALIZADA, f"{EVENTO_CIRUGIA_REALIZADA}:{cirugia_id}",
+                                {"id_cirugia": cirugia_id, "finalizada_dt": update_data["fecha_ultima_modificacion"]})
+            db.commit()
+            if finalizada:
+                procesador_eventos.notificar()
 
-            columns = [col[0] for col in cursor.description]
-            return db_row_to_cirugia_public(updated_db_row, columns)
+            cirugia = db_row_to_cirugia_public(updated_db_row, COLUMNAS_CIRUGIA)
+            response.headers["ETag"] = etag(cirugia.version)
+            cola_limpieza.registrar_cirugia(cirugia.nombre_quirofano, cirugia.fecha_hora_inicio_programada, cirugia.estado_cirugia)
+            return cirugia
 
         except pyodbc.IntegrityError as e:
             db.rollback()
@@ -261,17 +512,16 @@ def update_cirugia(cirugia_id: int, cirugia_in: CirugiaUpdate, db: pyodbc.Connec
 def delete_cirugia(cirugia_id: int, db: pyodbc.Connection = Depends(get_connection)):
     with db.cursor() as cursor:
         try:
-            cursor.execute("SELECT id_cirugia FROM Cirugias WHERE id_cirugia = ?", cirugia_id)
-            if not cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Cirugía con ID {cirugia_id} no encontrada para eliminar.")
-
-            cursor.execute("DELETE FROM Cirugias WHERE id_cirugia = ?", cirugia_id)
-            if cursor.rowcount == 0: # Inesperado si la verificación anterior pasó
+            cursor.execute("DELETE FROM Cirugias WHERE id_cirugia = ?", cirugia_id, etiqueta="cirugias.delete.delete")
+            if cursor.rowcount == 0:
                 db.rollback()
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No se eliminó la cirugía (inesperado).")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Cirugía con ID {cirugia_id} no encontrada para eliminar.")
 
             db.commit()
             return None
+        except pyodbc.IntegrityError as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"La cirugía tiene registros asociados y no se puede eliminar: {str(e)[:100]}")
         except HTTPException:
             raise
         except Exception as e:
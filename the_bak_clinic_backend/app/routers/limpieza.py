@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request
 from typing import List, Optional
 from app.database import get_connection
 import pyodbc
@@ -6,20 +6,34 @@ from app.schemas.limpieza_schema import (
     EstadoQuirofanoPublic,
     EstadoQuirofanoUpdate,
     EstadoQuirofanoListResponse,
+    EstadoQuirofanoLoteUpdate,
+    TareaLimpieza,
+    TareaLimpiezaCreate,
+    TareaLimpiezaUpdate,
+    TareaLimpiezaListResponse,
     # EstadoQuirofanoCreate # No lo usaré directamente si los quirófanos se gestionan por nombre
 )
+from app.services.estado_quirofanos import registro_quirofanos, LISTA_QUIROFANOS_SISTEMA
+from app.services.cola_limpieza import (
+    cola_limpieza, fila_a_tarea, COLUMNAS_TAREA, ESTADO_PENDIENTE, ESTADO_EN_PROGRESO, ESTADO_COMPLETADA,
+)
+from app.services.rotacion_quirofanos import registrar_rotaciones
+from app.core.tokens import get_current_user
+from app.schemas.user_schema import UsuarioAutenticado
+from app.core.tiempos import FASE_MAPEO, medido
+from app.core.sentencias import ActualizacionTabla, ENTERO, FECHA_HORA, texto
 from datetime import datetime
+from functools import lru_cache
 
 router = APIRouter()
 
 # --- Funciones Auxiliares ---
 
-# Lista hardcodeada de quirófanos si no hay una tabla dedicada y queremos asegurar que existan.
-# O podemos obtenerlos dinámicamente de la tabla Cirugias.
-# Por ahora, asumimos que los registros en EstadoLimpiezaQuirofanos se crean/actualizan.
-LISTA_QUIROFANOS_SISTEMA = ["Pabellón 1", "Pabellón 2", "Pabellón 3", "Pabellón Central", "Pabellón Urgencias"]
+# LISTA_QUIROFANOS_SISTEMA vive junto al registro en memoria (app/services/estado_quirofanos.py),
+# que es quien completa el listado con los quirófanos sin registro en la BD.
 
 
+@medido(FASE_MAPEO)
 def db_row_to_estado_quirofano_public(row: pyodbc.Row, columns: List[str]) -> EstadoQuirofanoPublic:
     data_raw = dict(zip(columns, row))
     # Asegurar que los campos datetime sean correctos o None
@@ -35,162 +49,406 @@ def db_row_to_estado_quirofano_public(row: pyodbc.Row, columns: List[str]) -> Es
         print(f"Error convirtiendo fila a EstadoQuirofanoPublic: {e}. Data: {data_raw}")
         raise HTTPException(status_code=500, detail=f"Error validación datos limpieza: {str(e)[:100]}")
 
+
+COLUMNAS_ESTADO_QUIROFANO = ["estado_limpieza", "ultima_vez_ocupado_hasta", "ultima_limpieza_realizada_dt", "notas_limpieza"]
+
+
+@lru_cache(maxsize=16)
+def sentencia_upsert_estados(cantidad_filas: int) -> str:
+    """
+    MERGE que crea o actualiza `cantidad_filas` quirófanos en una sola sentencia y devuelve las filas finales.
+    Cada columna viaja con un indicador (set_<columna>) que dice si venía en la solicitud: así el texto
+    de la sentencia es siempre el mismo (un solo plan en caché) y las columnas no enviadas no se tocan.
+    HOLDLOCK evita que dos upserts concurrentes del mismo quirófano inserten ambos.
+    """
+    columnas_origen = ["nombre_quirofano"]
+    for col in COLUMNAS_ESTADO_QUIROFANO:
+        columnas_origen += [col, f"set_{col}"]
+    fila_valores = "(" + ", ".join(["?"] * len(columnas_origen)) + ")"
+    asignaciones = ", ".join(
+        f"[{col}] = CASE WHEN origen.set_{col} = 1 THEN origen.{col} ELSE destino.[{col}] END"
+        for col in COLUMNAS_ESTADO_QUIROFANO
+    )
+    return f"""
+        MERGE INTO EstadoLimpiezaQuirofanos WITH (HOLDLOCK) AS destino
+        USING (VALUES {", ".join([fila_valores] * cantidad_filas)}) AS origen ({", ".join(columnas_origen)})
+        ON destino.nombre_quirofano = origen.nombre_quirofano
+        WHEN MATCHED THEN
+            UPDATE SET {asignaciones}
+        WHEN NOT MATCHED THEN
+            INSERT (nombre_quirofano, {", ".join(f"[{col}]" for col in COLUMNAS_ESTADO_QUIROFANO)})
+            VALUES (origen.nombre_quirofano, {", ".join(f"origen.{col}" for col in COLUMNAS_ESTADO_QUIROFANO)})
+        OUTPUT INSERTED.nombre_quirofano, INSERTED.estado_limpieza, INSERTED.ultima_vez_ocupado_hasta,
+               INSERTED.ultima_limpieza_realizada_dt, INSERTED.notas_limpieza;
+    """
+
+
+def parametros_upsert_estado(nombre_quirofano: str, update_data: dict) -> list:
+    # Forzar la actualización de ultima_limpieza_realizada_dt si el estado cambia a "Disponible" o "Limpio"
+    estado_limpieza = update_data.get("estado_limpieza")
+    if estado_limpieza and estado_limpieza.lower() in ["disponible", "limpio"]:
+        update_data["ultima_limpieza_realizada_dt"] = datetime.utcnow()
+
+    params = [nombre_quirofano]
+    for col in COLUMNAS_ESTADO_QUIROFANO:
+        params += [update_data.get(col), 1 if col in update_data else 0]
+    return params
+
+
 # --- Endpoints para Estado de Limpieza de Quirófanos ---
 
 @router.get("/quirofanos/estados", response_model=EstadoQuirofanoListResponse)
-def list_estados_quirofanos(db: pyodbc.Connection = Depends(get_connection)):
+def list_estados_quirofanos(request: Request):
     """
     Lista el estado de limpieza de todos los quirófanos conocidos.
-    Si un quirófano de LISTA_QUIROFANOS_SISTEMA no está en la BD, se podría añadir con estado por defecto.
+    Los quirófanos de LISTA_QUIROFANOS_SISTEMA sin registro en la BD aparecen con estado por defecto.
+    Se sirve desde el registro en memoria, sin consultar la BD, ya serializado y comprimido.
+    """
+    try:
+        return registro_quirofanos.listar_json().respuesta(request.headers.get("accept-encoding"))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al listar estados de quirófanos: {str(e)[:200]}")
+
+
+@router.get("/quirofanos/{nombre_quirofano}/estado", response_model=EstadoQuirofanoPublic)
+def get_estado_quirofano(nombre_quirofano: str):
+    try:
+        estado = registro_quirofanos.obtener(nombre_quirofano)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al obtener estado de quirófano: {str(e)[:200]}")
+    if estado is None:
+        # Si no se encuentra, devolver un estado por defecto o 404
+        if nombre_quirofano in LISTA_QUIROFANOS_SISTEMA:
+            return EstadoQuirofanoPublic(
+                nombre_quirofano=nombre_quirofano,
+                estado_limpieza="No Registrado",
+                notas_limpieza="Este quirófano no tiene un registro de estado de limpieza."
+            )
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Estado para quirófano '{nombre_quirofano}' no encontrado.")
+    return estado
+
+
+@router.put("/quirofanos/estados", response_model=EstadoQuirofanoListResponse)
+def update_estados_quirofanos(lote_in: EstadoQuirofanoLoteUpdate, db: pyodbc.Connection = Depends(get_connection)):
     """
-    query = """
-        SELECT nombre_quirofano, estado_limpieza, ultima_vez_ocupado_hasta,
-               ultima_limpieza_realizada_dt, notas_limpieza
-        FROM EstadoLimpiezaQuirofanos
-        ORDER BY nombre_quirofano
+    Crea o actualiza el estado de varios quirófanos en una sola sentencia (p. ej. reinicio de fin de día).
+    Es todo o nada: si falla, no se modifica ningún quirófano.
     """
-    # Asumo que id_quirofano_fk no es una columna directa en esta tabla simulada, sino que nombre_quirofano es la clave.
+    nombres = [item.nombre_quirofano for item in lote_in.quirofanos]
+    if len(set(nombres)) != len(nombres):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cada quirófano puede aparecer solo una vez en el lote.")
 
-    estados_quirofanos = []
-    db_quirofanos_nombres = set()
+    params = []
+    limpiados = set()  # Quirófanos cuya limpieza se registra en este lote
+    for item in lote_in.quirofanos:
+        update_data = item.dict(exclude_unset=True)
+        update_data.pop("nombre_quirofano")
+        if not update_data:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No hay datos proporcionados para actualizar '{item.nombre_quirofano}'.")
+        params += parametros_upsert_estado(item.nombre_quirofano, update_data)
+        if "ultima_limpieza_realizada_dt" in update_data:
+            limpiados.add(item.nombre_quirofano)
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(query)
+            cursor.execute(sentencia_upsert_estados(len(nombres)), params, etiqueta="limpieza.estados.upsert_lote")
             rows = cursor.fetchall()
             columns = [col[0] for col in cursor.description]
-            for row in rows:
-                eq_public = db_row_to_estado_quirofano_public(row, columns)
-                estados_quirofanos.append(eq_public)
-                db_quirofanos_nombres.add(eq_public.nombre_quirofano)
-
-            # Opcional: Añadir quirófanos de la lista hardcodeada que no estén en la BD
-            for nombre_q_sistema in LISTA_QUIROFANOS_SISTEMA:
-                if nombre_q_sistema not in db_quirofanos_nombres:
-                    # Crear un estado por defecto para quirófanos no registrados en la tabla
-                    default_estado = EstadoQuirofanoPublic(
-                        nombre_quirofano=nombre_q_sistema,
-                        estado_limpieza="Desconocido", # O "Disponible" por defecto
-                        ultima_vez_ocupado_hasta=None,
-                        ultima_limpieza_realizada_dt=None,
-                        notas_limpieza="Registro no encontrado en BD, estado por defecto."
-                    )
-                    estados_quirofanos.append(default_estado)
-
-            # Re-ordenar por si se añadieron defaults
-            estados_quirofanos.sort(key=lambda q: q.nombre_quirofano)
-
-            return EstadoQuirofanoListResponse(quirofanos=estados_quirofanos, total=len(estados_quirofanos))
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al listar estados de quirófanos: {str(e)[:200]}")
+            estados = sorted((db_row_to_estado_quirofano_public(row, columns) for row in rows), key=lambda q: q.nombre_quirofano)
+            registrar_rotaciones(cursor, [e for e in estados if e.nombre_quirofano in limpiados])
+            db.commit()
+        except pyodbc.IntegrityError as ie:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto al actualizar estados de quirófanos: {str(ie)[:100]}")
+        except pyodbc.Error as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al actualizar estados de quirófanos: {str(e)[:200]}")
 
+    for estado in estados:
+        registro_quirofanos.actualizar(estado)
+    return EstadoQuirofanoListResponse(quirofanos=estados, total=len(estados))
+
+
+@router.put("/quirofanos/{nombre_quirofano}/estado", response_model=EstadoQuirofanoPublic)
+def update_estado_quirofano(nombre_quirofano: str, estado_in: EstadoQuirofanoUpdate, db: pyodbc.Connection = Depends(get_connection)):
+    update_data = estado_in.dict(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
+
+    # UPSERT en un solo round trip: el MERGE crea el registro si el quirófano aún no lo tiene
+    # y devuelve la fila final con OUTPUT.
+    params = parametros_upsert_estado(nombre_quirofano, update_data)
 
-@router.get("/quirofanos/{nombre_quirofano}/estado", response_model=EstadoQuirofanoPublic)
-def get_estado_quirofano(nombre_quirofano: str, db: pyodbc.Connection = Depends(get_connection)):
-    query = """
-        SELECT nombre_quirofano, estado_limpieza, ultima_vez_ocupado_hasta,
-               ultima_limpieza_realizada_dt, notas_limpieza
-        FROM EstadoLimpiezaQuirofanos WHERE nombre_quirofano = ?
-    """
     with db.cursor() as cursor:
         try:
-            cursor.execute(query, nombre_quirofano)
-            row = cursor.fetchone()
-            if not row:
-                # Si no se encuentra, devolver un estado por defecto o 404
-                if nombre_quirofano in LISTA_QUIROFANOS_SISTEMA:
-                    return EstadoQuirofanoPublic(
-                        nombre_quirofano=nombre_quirofano,
-                        estado_limpieza="No Registrado",
-                        notas_limpieza="Este quirófano no tiene un registro de estado de limpieza."
-                    )
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Estado para quirófano '{nombre_quirofano}' no encontrado.")
-
+            cursor.execute(sentencia_upsert_estados(1), params, etiqueta="limpieza.estado.upsert")
+            updated_row = cursor.fetchone()
+            if not updated_row:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo crear o actualizar el registro de estado del quirófano.")
             columns = [col[0] for col in cursor.description]
-            return db_row_to_estado_quirofano_public(row, columns)
+            estado_actualizado = db_row_to_estado_quirofano_public(updated_row, columns)
+            if "ultima_limpieza_realizada_dt" in update_data:
+                registrar_rotaciones(cursor, [estado_actualizado])
+            db.commit()
+
+            registro_quirofanos.actualizar(estado_actualizado)
+            return estado_actualizado
+
+        except pyodbc.IntegrityError as ie: # Ej. si nombre_quirofano no existe en una tabla Quirofanos (FK)
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto al crear estado para quirófano: {str(ie)[:100]}")
+        except pyodbc.Error as e: # pyodbc.Error es más general para errores de BD
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al actualizar estado de quirófano: {str(e)[:200]}")
         except HTTPException:
             raise
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al obtener estado de quirófano: {str(e)[:200]}")
+        except Exception as e: # Otros errores
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado al actualizar estado: {str(e)[:200]}")
 
+# --- Endpoints para Tareas de Limpieza ---
 
-@router.put("/quirofanos/{nombre_quirofano}/estado", response_model=EstadoQuirofanoPublic)
-def update_estado_quirofano(nombre_quirofano: str, estado_in: EstadoQuirofanoUpdate, db: pyodbc.Connection = Depends(get_connection)):
-    update_data = estado_in.dict(exclude_unset=True)
-    if not update_data:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
+COLUMNAS_OUTPUT_TAREA = ", ".join(f"INSERTED.{col.strip()}" for col in COLUMNAS_TAREA.split(","))
 
-    # Forzar la actualización de ultima_limpieza_realizada_dt si el estado cambia a "Disponible" o "Limpio"
-    if estado_in.estado_limpieza and estado_in.estado_limpieza.lower() in ["disponible", "limpio"]:
-        update_data["ultima_limpieza_realizada_dt"] = datetime.utcnow()
-        # Si se marca como disponible/limpio, quizás limpiar notas_limpieza o ultima_vez_ocupado_hasta?
-        # update_data["notas_limpieza"] = update_data.get("notas_limpieza", None) # Mantener si viene, o limpiar
-        # update_data["ultima_vez_ocupado_hasta"] = update_data.get("ultima_vez_ocupado_hasta", None)
+# Tomar una tarea es un único UPDATE condicional: si dos personas intentan tomar la misma tarea
+# a la vez, solo una ve la fila con asignada_a IS NULL y la otra recibe 0 filas.
+QUERY_TOMAR_TAREA = f"""
+    UPDATE TareasLimpieza
+    SET asignada_a = ?, asignada_dt = GETUTCDATE(), estado_tarea = '{ESTADO_EN_PROGRESO}'
+    OUTPUT {COLUMNAS_OUTPUT_TAREA}
+    WHERE id_tarea_limpieza = ? AND asignada_a IS NULL AND estado_tarea = '{ESTADO_PENDIENTE}'
+"""
+ACTUALIZACION_TAREAS = ActualizacionTabla(
+    "TareasLimpieza", "id_tarea_limpieza",
+    {"asignada_a": ENTERO, "estado_tarea": texto(30), "notas_tarea": texto(500), "completada_dt": FECHA_HORA},
+    salida=[col.strip() for col in COLUMNAS_TAREA.split(",")],
+)
+# Cuántas veces /tareas/siguiente/tomar prueba con la siguiente tarea si otra persona le gana la anterior
+MAX_INTENTOS_TOMAR_SIGUIENTE = 5
 
 
-    set_clause_parts = [f"[{key}] = ?" for key in update_data.keys()] # SQL Server a veces necesita [] para nombres de columna
-    params = list(update_data.values())
-    params.append(nombre_quirofano)
-    set_clause = ", ".join(set_clause_parts)
+def tomar_tarea(cursor, db: pyodbc.Connection, id_tarea: int, id_usuario: int) -> Optional[TareaLimpieza]:
+    """Asigna la tarea al usuario si sigue libre. Devuelve la tarea tomada o None si ya no estaba disponible."""
+    cursor.execute(QUERY_TOMAR_TAREA, id_usuario, id_tarea, etiqueta="limpieza.tareas.tomar")
+    row = cursor.fetchone()
+    if not row:
+        db.rollback()
+        cola_limpieza.quitar(id_tarea)
+        return None
+    columns = [col[0] for col in cursor.description]
+    db.commit()
+    cola_limpieza.quitar(id_tarea)
+    return fila_a_tarea(row, columns)
 
-    # Intenta actualizar. Si no existe, podría crearlo (UPSERT) o fallar.
-    # Para UPSERT en SQL Server: MERGE. Para simplificar: UPDATE, y si no afecta filas, INSERT.
-    # O, más simple: verificar si existe, luego UPDATE o INSERT.
 
-    query_update = f"UPDATE EstadoLimpiezaQuirofanos SET {set_clause} WHERE nombre_quirofano = ?"
-    query_select = """
-        SELECT nombre_quirofano, estado_limpieza, ultima_vez_ocupado_hasta,
-               ultima_limpieza_realizada_dt, notas_limpieza
-        FROM EstadoLimpiezaQuirofanos WHERE nombre_quirofano = ?
-    """
+@router.post("/tareas", response_model=TareaLimpieza, status_code=status.HTTP_201_CREATED)
+def create_tarea_limpieza(tarea_in: TareaLimpiezaCreate, db: pyodbc.Connection = Depends(get_connection)):
+    ocupado_hasta = tarea_in.ocupado_hasta
+    if ocupado_hasta is None:
+        try:
+            estado = registro_quirofanos.obtener(tarea_in.nombre_quirofano)
+        except Exception:
+            estado = None  # Sin el dato la tarea solo pierde el desempate por tiempo desocupado
+        ocupado_hasta = estado.ultima_vez_ocupado_hasta if estado else None
+
     query_insert = f"""
-        INSERT INTO EstadoLimpiezaQuirofanos (nombre_quirofano, {", ".join([f'[{k}]' for k in update_data.keys()])})
-        VALUES (?, {", ".join(["?"] * len(update_data))})
+        INSERT INTO TareasLimpieza (nombre_quirofano, asignada_a, asignada_dt, estado_tarea, ocupado_hasta, notas_tarea)
+        OUTPUT {COLUMNAS_OUTPUT_TAREA}
+        VALUES (?, ?, CASE WHEN ? IS NULL THEN NULL ELSE GETUTCDATE() END, '{ESTADO_PENDIENTE}', ?, ?)
     """
-    insert_params = tuple([nombre_quirofano] + list(update_data.values()))
+    params = (tarea_in.nombre_quirofano, tarea_in.asignada_a, tarea_in.asignada_a, ocupado_hasta, tarea_in.notas_tarea)
+
+    with db.cursor() as cursor:
+        try:
+            cursor.execute(query_insert, params, etiqueta="limpieza.tareas.create")
+            created_row = cursor.fetchone()
+            if not created_row:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo crear la tarea de limpieza (la inserción no devolvió datos).")
+            columns = [col[0] for col in cursor.description]
+            db.commit()
+        except pyodbc.IntegrityError as e: # Ej. asignada_a no corresponde a un usuario
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al crear tarea de limpieza: {str(e)[:100]}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al crear tarea de limpieza: {str(e)[:200]}")
+
+    tarea = fila_a_tarea(created_row, columns)
+    cola_limpieza.agregar(tarea)
+    return tarea
+
 
+@router.get("/tareas", response_model=TareaLimpiezaListResponse)
+def list_tareas_limpieza(
+    estado_tarea: Optional[str] = None,
+    nombre_quirofano: Optional[str] = None,
+    asignada_a: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    condiciones, params = [], []
+    if estado_tarea:
+        condiciones.append("estado_tarea = ?")
+        params.append(estado_tarea)
+    if nombre_quirofano:
+        condiciones.append("nombre_quirofano = ?")
+        params.append(nombre_quirofano)
+    if asignada_a is not None:
+        condiciones.append("asignada_a = ?")
+        params.append(asignada_a)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
 
+    query_count = f"SELECT COUNT(*) FROM TareasLimpieza {where}"
+    query_select = f"""
+        SELECT {COLUMNAS_TAREA}
+        FROM TareasLimpieza {where}
+        ORDER BY solicitada_dt DESC, id_tarea_limpieza DESC
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_update, tuple(params))
-            if cursor.rowcount == 0:
-                # No se actualizó, intentar insertar (si el quirófano es conocido o se permite creación ad-hoc)
-                if nombre_quirofano in LISTA_QUIROFANOS_SISTEMA or True: # True permite crear para cualquier nombre
-                    try:
-                        # Asegurar que todos los campos de update_data son válidos para la tabla
-                        # El query_insert asume que las claves en update_data son nombres de columnas.
-                        cursor.execute(query_insert, insert_params)
-                        if cursor.rowcount == 0: # Falló la inserción también
-                            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo crear el registro de estado del quirófano.")
-                    except pyodbc.IntegrityError as ie: # Ej. si nombre_quirofano no existe en una tabla Quirofanos (FK)
-                        db.rollback()
-                        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto al crear estado para quirófano: {str(ie)[:100]}")
-                else:
-                    db.rollback()
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Quirófano '{nombre_quirofano}' no encontrado y no se permite creación ad-hoc.")
+            cursor.execute(query_count, params, etiqueta="limpieza.tareas.list.count")
+            total = cursor.fetchone()[0]
+            cursor.execute(query_select, params + [skip, limit], etiqueta="limpieza.tareas.list.page")
+            rows = cursor.fetchall()
+            columns = [col[0] for col in cursor.description]
+            return TareaLimpiezaListResponse(tareas=[fila_a_tarea(row, columns) for row in rows], total=total)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al listar tareas de limpieza: {str(e)[:200]}")
 
-            db.commit()
 
-            cursor.execute(query_select, nombre_quirofano)
-            updated_row = cursor.fetchone()
-            if not updated_row:
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al recuperar estado del quirófano después de la operación.")
+@router.get("/tareas/siguiente", response_model=TareaLimpieza)
+def get_siguiente_tarea_limpieza():
+    """
+    Próxima tarea a realizar según la cola de prioridad en memoria (sin consultar la BD):
+    primero el quirófano con la cirugía más próxima, luego el que lleva más tiempo desocupado.
+    """
+    try:
+        tarea = cola_limpieza.siguiente()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al cargar la cola de limpieza: {str(e)[:200]}")
+    if tarea is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay tareas de limpieza pendientes.")
+    return tarea
+
 
+@router.post("/tareas/siguiente/tomar", response_model=TareaLimpieza)
+def tomar_siguiente_tarea_limpieza(
+    usuario: UsuarioAutenticado = Depends(get_current_user),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    """Asigna al usuario la tarea de mayor prioridad. Si otra persona la toma antes, prueba con la siguiente."""
+    with db.cursor() as cursor:
+        try:
+            for _ in range(MAX_INTENTOS_TOMAR_SIGUIENTE):
+                siguiente = cola_limpieza.siguiente()
+                if siguiente is None:
+                    break
+                tarea = tomar_tarea(cursor, db, siguiente.id_tarea_limpieza, usuario.id_usuario)
+                if tarea is not None:
+                    return tarea
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al tomar tarea de limpieza: {str(e)[:200]}")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay tareas de limpieza pendientes.")
+
+
+@router.get("/tareas/{tarea_id}", response_model=TareaLimpieza)
+def get_tarea_limpieza(tarea_id: int, db: pyodbc.Connection = Depends(get_connection)):
+    with db.cursor() as cursor:
+        try:
+            cursor.execute(f"SELECT {COLUMNAS_TAREA} FROM TareasLimpieza WHERE id_tarea_limpieza = ?", tarea_id, etiqueta="limpieza.tareas.get")
+            row = cursor.fetchone()
+            if not row:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarea de limpieza con ID {tarea_id} no encontrada.")
             columns = [col[0] for col in cursor.description]
-            return db_row_to_estado_quirofano_public(updated_row, columns)
+            return fila_a_tarea(row, columns)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al obtener tarea de limpieza: {str(e)[:200]}")
 
-        except pyodbc.Error as e: # pyodbc.Error es más general para errores de BD
+
+@router.post("/tareas/{tarea_id}/tomar", response_model=TareaLimpieza)
+def tomar_tarea_limpieza(
+    tarea_id: int,
+    usuario: UsuarioAutenticado = Depends(get_current_user),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    with db.cursor() as cursor:
+        try:
+            tarea = tomar_tarea(cursor, db, tarea_id, usuario.id_usuario)
+            if tarea is not None:
+                return tarea
+            cursor.execute("SELECT asignada_a, estado_tarea FROM TareasLimpieza WHERE id_tarea_limpieza = ?", tarea_id, etiqueta="limpieza.tareas.tomar.estado")
+            row = cursor.fetchone()
+        except Exception as e:
             db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al actualizar estado de quirófano: {str(e)[:200]}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al tomar tarea de limpieza: {str(e)[:200]}")
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarea de limpieza con ID {tarea_id} no encontrada.")
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"La tarea ya no está disponible (estado: {row[1]}, asignada a: {row[0]}).")
+
+
+@router.put("/tareas/{tarea_id}", response_model=TareaLimpieza)
+def update_tarea_limpieza(tarea_id: int, tarea_in: TareaLimpiezaUpdate, db: pyodbc.Connection = Depends(get_connection)):
+    update_data = tarea_in.dict(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
+
+    completada = update_data.get("estado_tarea") == ESTADO_COMPLETADA
+    if completada and update_data.get("completada_dt") is None:
+        update_data["completada_dt"] = datetime.utcnow()
+
+    estado_quirofano = None
+    with db.cursor() as cursor:
+        try:
+            ACTUALIZACION_TAREAS.ejecutar(cursor, update_data, tarea_id, etiqueta="limpieza.tareas.update")
+            row = cursor.fetchone()
+            if not row:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarea de limpieza con ID {tarea_id} no encontrada para actualizar.")
+            tarea = fila_a_tarea(row, [col[0] for col in cursor.description])
+
+            # Completar la tarea deja el quirófano disponible en la misma transacción
+            if completada:
+                cursor.execute(sentencia_upsert_estados(1), parametros_upsert_estado(tarea.nombre_quirofano, {"estado_limpieza": "Disponible"}), etiqueta="limpieza.tareas.update.quirofano")
+                estado_quirofano = db_row_to_estado_quirofano_public(cursor.fetchone(), [col[0] for col in cursor.description])
+                registrar_rotaciones(cursor, [estado_quirofano])
+            db.commit()
+        except pyodbc.IntegrityError as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al actualizar tarea de limpieza: {str(e)[:100]}")
         except HTTPException:
             raise
-        except Exception as e: # Otros errores
+        except Exception as e:
             db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado al actualizar estado: {str(e)[:200]}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al actualizar tarea de limpieza: {str(e)[:200]}")
+
+    cola_limpieza.agregar(tarea)  # La vuelve a encolar si quedó pendiente y sin asignar; si no, la saca
+    if estado_quirofano is not None:
+        registro_quirofanos.actualizar(estado_quirofano)
+    return tarea
+
 
-# Endpoints para TareaLimpieza se podrían añadir aquí si es necesario.
-# Ejemplo:
-# @router.post("/tareas", response_model=TareaLimpieza, status_code=status.HTTP_201_CREATED)
-# def create_tarea_limpieza(tarea_in: TareaLimpiezaCreate, ...): ...
-# @router.get("/tareas", response_model=TareaLimpiezaListResponse): ...
-# etc.
+@router.delete("/tareas/{tarea_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_tarea_limpieza(tarea_id: int, db: pyodbc.Connection = Depends(get_connection)):
+    with db.cursor() as cursor:
+        try:
+            cursor.execute("DELETE FROM TareasLimpieza WHERE id_tarea_limpieza = ?", tarea_id, etiqueta="limpieza.tareas.delete")
+            if cursor.rowcount == 0:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarea de limpieza con ID {tarea_id} no encontrada para eliminar.")
+            db.commit()
+        except HTTPException:
+            raise
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD al eliminar tarea de limpieza: {str(e)[:200]}")
+    cola_limpieza.quitar(tarea_id)
+    return None
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from typing import Optional
+from app.core import perfil_sql, tiempos
+from app.schemas.monitoreo_schema import (
+    TiempoRuta, TiemposRutasResponse, SentenciaPerfil, ReporteSentenciasResponse,
+)
+
+router = APIRouter()
+
+
+@router.get("/tiempos", response_model=TiemposRutasResponse)
+def get_tiempos_rutas():
+    """
+    Tiempos por ruta desde que arrancó este proceso (cada worker lleva los suyos), ordenados
+    por p95. El desglose de cada request individual viene en su header Server-Timing.
+    """
+    return TiemposRutasResponse(
+        rutas=[TiempoRuta(**ruta) for ruta in tiempos.resumen_rutas()],
+        limites_histograma_ms=list(tiempos.LIMITES_MS),
+    )
+
+
+@router.get("/sql", response_model=ReporteSentenciasResponse)
+def get_reporte_sql(
+    top: int = Query(20, ge=1, le=500),
+    orden: str = Query("total", description="total, promedio, maximo, ejecuciones o filas"),
+    etiqueta: Optional[str] = Query(None, description="Prefijo de etiqueta (ej: cirugias.list)"),
+):
+    """Sentencias SQL de este proceso agregadas por etiqueta, de la más costosa a la menos costosa."""
+    if orden not in perfil_sql.ORDENES_REPORTE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Orden '{orden}' no válido. Opciones: {', '.join(perfil_sql.ORDENES_REPORTE)}.")
+    return ReporteSentenciasResponse(
+        sentencias=[SentenciaPerfil(**s) for s in perfil_sql.reporte_sentencias(top, orden, etiqueta)],
+        umbral_lenta_ms=perfil_sql.UMBRAL_LENTA_SEGUNDOS * 1000,
+    )
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional
 from app.database import get_connection
 import pyodbc
 from app.schemas.notificacion_schema import NotificacionPublic, NotificacionListResponse
+from app.services.estado_quirofanos import registro_quirofanos
 from datetime import datetime, timedelta
 import uuid # Para generar IDs únicos para notificaciones simuladas
 
@@ -24,7 +25,7 @@ def generar_notificaciones_simuladas(db: pyodbc.Connection) -> List[Notificacion
                 ORDER BY fecha_ultima_modificacion DESC
             """ # Asumimos que fecha_ultima_modificacion se actualiza al cambiar estado
             fecha_limite = datetime.utcnow() - timedelta(days=1)
-            cursor.execute(query_cirugias_canceladas, fecha_limite)
+            cursor.execute(query_cirugias_canceladas, fecha_limite, etiqueta="notificaciones.cirugias_canceladas")
             rows = cursor.fetchall()
             for row in rows:
                 notificaciones.append(NotificacionPublic(
@@ -40,29 +41,22 @@ def generar_notificaciones_simuladas(db: pyodbc.Connection) -> List[Notificacion
         print(f"Error generando notificaciones de cirugías canceladas: {e}")
 
 
-    # 2. Quirófanos que requieren limpieza urgente (estado "Limpieza Pendiente")
+    # 2. Quirófanos que requieren limpieza urgente (estado "Limpieza Pendiente"), desde el registro en memoria
     try:
-        with db.cursor() as cursor:
-            query_limpieza_pendiente = """
-                SELECT nombre_quirofano, notas_limpieza, ultima_vez_ocupado_hasta
-                FROM EstadoLimpiezaQuirofanos
-                WHERE estado_limpieza = 'Limpieza Pendiente'
-                ORDER BY ultima_vez_ocupado_hasta ASC
-            """ # Más antiguo ocupado = más urgente
-            cursor.execute(query_limpieza_pendiente)
-            rows = cursor.fetchall()
-            for row in rows:
-                 # Podríamos añadir lógica de "urgencia" si lleva mucho tiempo pendiente
-                tiempo_ocupado_str = f" (últ. ocupado: {row[2].strftime('%Y-%m-%d %H:%M') if row[2] else 'N/A'})" if row[2] else ""
-                notificaciones.append(NotificacionPublic(
-                    id_notificacion=str(uuid.uuid4()),
-                    mensaje=f"Quirófano '{row[0]}' requiere limpieza urgente.{tiempo_ocupado_str}",
-                    tipo="alerta",
-                    fecha_creacion=datetime.utcnow(),
-                    leida=False,
-                    entidad_tipo="QuirofanoLimpieza", # Tipo inventado
-                    entidad_id=row[0] # Nombre del quirófano como ID
-                ))
+        # Más antiguo ocupado = más urgente
+        for estado in registro_quirofanos.con_estado("Limpieza Pendiente"):
+             # Podríamos añadir lógica de "urgencia" si lleva mucho tiempo pendiente
+            ocupado_hasta = estado.ultima_vez_ocupado_hasta
+            tiempo_ocupado_str = f" (últ. ocupado: {ocupado_hasta.strftime('%Y-%m-%d %H:%M')})" if ocupado_hasta else ""
+            notificaciones.append(NotificacionPublic(
+                id_notificacion=str(uuid.uuid4()),
+                mensaje=f"Quirófano '{estado.nombre_quirofano}' requiere limpieza urgente.{tiempo_ocupado_str}",
+                tipo="alerta",
+                fecha_creacion=datetime.utcnow(),
+                leida=False,
+                entidad_tipo="QuirofanoLimpieza", # Tipo inventado
+                entidad_id=estado.nombre_quirofano # Nombre del quirófano como ID
+            ))
     except Exception as e:
         print(f"Error generando notificaciones de limpieza: {e}")
 
@@ -1,14 +1,53 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, BackgroundTasks, Query, Response
+from typing import List, Optional
 from app.database import get_connection
 import pyodbc
-from app.schemas.paciente_schema import PacienteCreate, PacienteUpdate, PacientePublic, PacienteList
+import shutil
+import tempfile
+import os
+from app.schemas.paciente_schema import (
+    PacienteCreate, PacienteUpdate, PacientePublic, PacienteList, ImportacionPacientesEstado,
+    PacienteResumen, PacienteBusquedaResponse,
+)
+from app.services import importacion_pacientes
+from app.services import busqueda_pacientes
+from app.services.busqueda_pacientes import indice_pacientes
+from app.core.cache import TTLCache
+from app.utils.rut import rut_compacto
+from app.core.tiempos import FASE_MAPEO, medido
+from app.core.sentencias import ActualizacionTabla, FECHA, restriccion_violada, texto
+from app.core.concurrencia import error_actualizacion, etag, version_if_match
+from app.core.proyecciones import Proyeccion, Proyecciones, respuesta_json
 from datetime import datetime
 
 router = APIRouter()
 
+# Admisión busca pacientes por RUT cientos de veces por hora; la caché es por proceso y se
+# invalida en las escrituras de este mismo proceso. El TTL acota la desactualización entre workers.
+cache_pacientes_por_rut = TTLCache(max_entradas=2048, ttl_segundos=120, nombre="pacientes_por_rut")
+
+COLUMNAS_PACIENTE = [
+    "id_paciente", "nombre", "apellido", "rut", "fecha_nacimiento", "telefono", "email",
+    "direccion", "prevision", "numero_ficha", "fecha_registro", "version",
+]
+
+# ?fields= en GET /pacientes y GET /pacientes/{id}
+PROYECCIONES_PACIENTE = Proyecciones(COLUMNAS_PACIENTE, obligatorias=["id_paciente", "version"])
+SELECT_PACIENTE = ", ".join(COLUMNAS_PACIENTE)
+
+# Devuelve también el RUT anterior (último campo de la fila) para invalidar la caché por RUT
+ACTUALIZACION_PACIENTES = ActualizacionTabla("Pacientes", "id_paciente", {
+    "nombre": texto(50), "apellido": texto(50), "rut": texto(12), "fecha_nacimiento": FECHA,
+    "telefono": texto(15), "email": texto(255), "direccion": texto(200), "prevision": texto(50),
+    "numero_ficha": texto(50),
+}, salida=COLUMNAS_PACIENTE, anteriores=["rut"], version="version")
+
+# Índice único de sql/028_pacientes_rut_normalizado.sql -> mensaje del 409
+DUPLICADOS_PACIENTE = {"UX_Pacientes_rut_normalizado": "El RUT ya está registrado para otro paciente."}
+
 # --- Funciones Auxiliares ---
 
+@medido(FASE_MAPEO)
 def db_row_to_paciente_public(row: pyodbc.Row, columns: List[str]) -> PacientePublic:
     """Convierte una fila de la base de datos a un objeto PacientePublic."""
     paciente_data_raw = dict(zip(columns, row))
@@ -36,12 +75,11 @@ def db_row_to_paciente_public(row: pyodbc.Row, columns: List[str]) -> PacientePu
 
 @router.post("/", response_model=PacientePublic, status_code=status.HTTP_201_CREATED)
 def create_paciente(paciente_in: PacienteCreate, db: pyodbc.Connection = Depends(get_connection)):
-    query_check_rut = "SELECT id_paciente FROM Pacientes WHERE rut = ?"
     # OUTPUT INSERTED.* es específico de SQL Server. Ajustar para otras BDs.
     query_insert = """
         INSERT INTO Pacientes (nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro)
         OUTPUT INSERTED.id_paciente, INSERTED.nombre, INSERTED.apellido, INSERTED.rut, INSERTED.fecha_nacimiento,
-               INSERTED.telefono, INSERTED.email, INSERTED.direccion, INSERTED.prevision, INSERTED.numero_ficha, INSERTED.fecha_registro
+               INSERTED.telefono, INSERTED.email, INSERTED.direccion, INSERTED.prevision, INSERTED.numero_ficha, INSERTED.fecha_registro, INSERTED.version
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETUTCDATE())
     """
     # GETUTCDATE() es para SQL Server. Usar CURRENT_TIMESTAMP o NOW() para otras.
@@ -54,11 +92,8 @@ def create_paciente(paciente_in: PacienteCreate, db: pyodbc.Connection = Depends
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_check_rut, paciente_in.rut)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El RUT '{paciente_in.rut}' ya está registrado para otro paciente.")
-
-            cursor.execute(query_insert, params)
+            # Un RUT duplicado lo rechaza UX_Pacientes_rut_normalizado (ver DUPLICADOS_PACIENTE)
+            cursor.execute(query_insert, params, etiqueta="pacientes.create.insert")
             created_paciente_row = cursor.fetchone()
             if not created_paciente_row:
                 db.rollback()
@@ -66,11 +101,15 @@ def create_paciente(paciente_in: PacienteCreate, db: pyodbc.Connection = Depends
 
             db.commit()
             columns = [col[0] for col in cursor.description]
-            return db_row_to_paciente_public(created_paciente_row, columns)
+            paciente = db_row_to_paciente_public(created_paciente_row, columns)
+            indice_pacientes.agregar(paciente.id_paciente, paciente.nombre, paciente.apellido)
+            return paciente
 
         except pyodbc.IntegrityError as e:
             db.rollback()
-            # Podría ser un RUT duplicado si la verificación anterior falló o hay otra constraint
+            duplicado = restriccion_violada(e, DUPLICADOS_PACIENTE)
+            if duplicado:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=duplicado)
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al crear paciente. Verifique que el RUT sea único. (Error DB: {str(e)[:100]})")
         except HTTPException:
             raise
@@ -79,11 +118,50 @@ def create_paciente(paciente_in: PacienteCreate, db: pyodbc.Connection = Depends
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al crear paciente: {str(e)[:200]}")
 
 
+@router.post("/importar", response_model=ImportacionPacientesEstado, status_code=status.HTTP_202_ACCEPTED)
+def importar_pacientes(background_tasks: BackgroundTasks, archivo: UploadFile = File(...)):
+    """
+    Recibe un CSV (o .xlsx si openpyxl está instalado) y lo importa en segundo plano.
+    Devuelve de inmediato el trabajo; el progreso se consulta en GET /pacientes/importar/{id_trabajo}.
+    """
+    nombre_archivo = archivo.filename or "importacion.csv"
+    extension = os.path.splitext(nombre_archivo)[1].lower()
+    if extension not in (".csv", ".txt", ".xlsx", ".xlsm"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Formato no soportado. Use CSV o Excel (.xlsx).")
+    if extension in (".xlsx", ".xlsm"):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="La importación desde Excel requiere el paquete 'openpyxl' en el servidor. Use CSV.")
+
+    # El archivo se copia a disco en bloques: el UploadFile se cierra al terminar el request,
+    # antes de que corra la tarea en segundo plano.
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as destino:
+        shutil.copyfileobj(archivo.file, destino, length=1024 * 1024)
+        ruta_temporal = destino.name
+
+    trabajo = importacion_pacientes.registrar_trabajo(nombre_archivo)
+    background_tasks.add_task(importacion_pacientes.ejecutar_importacion, trabajo, ruta_temporal)
+    return trabajo
+
+
+@router.get("/importar/{id_trabajo}", response_model=ImportacionPacientesEstado)
+def get_importacion_pacientes(id_trabajo: str):
+    trabajo = importacion_pacientes.obtener_trabajo(id_trabajo)
+    if not trabajo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Trabajo de importación '{id_trabajo}' no encontrado.")
+    return trabajo
+
+
 @router.get("/", response_model=PacienteList)
-def list_pacientes(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depends(get_connection)):
+def list_pacientes(
+    skip: int = 0, limit: int = 100,
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_PACIENTE.parametro),
+    db: pyodbc.Connection = Depends(get_connection),
+):
     query_count = "SELECT COUNT(*) FROM Pacientes"
-    query_select = """
-        SELECT id_paciente, nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro
+    query_select = f"""
+        SELECT {proyeccion.select if proyeccion else SELECT_PACIENTE}
         FROM Pacientes
         ORDER BY id_paciente
         OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
@@ -94,13 +172,15 @@ def list_pacientes(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depe
     total_count = 0
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_count)
+            cursor.execute(query_count, etiqueta="pacientes.list.count")
             count_row = cursor.fetchone()
             if count_row:
                 total_count = count_row[0]
 
-            cursor.execute(query_select, skip, limit)
+            cursor.execute(query_select, skip, limit, etiqueta="pacientes.list.page")
             rows = cursor.fetchall()
+            if proyeccion:
+                return respuesta_json({"pacientes": proyeccion.filas(rows), "total": total_count})
             if rows:
                 columns = [col[0] for col in cursor.description]
                 for row in rows:
@@ -112,21 +192,95 @@ def list_pacientes(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depe
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al listar pacientes: {str(e)[:200]}")
 
 
-@router.get("/{paciente_id}", response_model=PacientePublic)
-def get_paciente(paciente_id: int, db: pyodbc.Connection = Depends(get_connection)):
+@router.get("/buscar", response_model=PacienteBusquedaResponse)
+def buscar_pacientes(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto a buscar en nombre, apellido, RUT o número de ficha"),
+    limit: int = Query(20, ge=1, le=100),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    """
+    Búsqueda por prefijo y aproximada (tolerante a errores de tipeo), sin distinguir tildes ni mayúsculas.
+    Los nombres se buscan en un índice en memoria; RUT y número de ficha, por prefijo en la BD.
+    Con términos muy comunes ("m", "maria") el total es una estimación (total_aproximado).
+    """
+    with db.cursor() as cursor:
+        try:
+            resultados, total, aproximado = busqueda_pacientes.buscar(cursor, q, limit)
+        except busqueda_pacientes.IndiceNoCargado:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El índice de búsqueda se está cargando. Intente nuevamente en unos segundos.",
+                headers={"Retry-After": "5"},
+            )
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al buscar pacientes: {str(e)[:200]}")
+
+    return PacienteBusquedaResponse(
+        resultados=[
+            PacienteResumen(id_paciente=fila[0], nombre=fila[1], apellido=fila[2], rut=fila[3], numero_ficha=fila[4], puntaje=round(puntaje, 3))
+            for puntaje, fila in resultados
+        ],
+        total=total,
+        total_aproximado=aproximado,
+    )
+
+
+@router.get("/por-rut/{rut}", response_model=PacientePublic)
+def get_paciente_por_rut(rut: str, db: pyodbc.Connection = Depends(get_connection)):
+    """
+    Busca un paciente por RUT en cualquier formato (con o sin puntos/guion).
+    Usa el índice único sobre rut_normalizado y una caché en memoria.
+    """
+    clave = rut_compacto(rut)
+    if not clave:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"'{rut}' no tiene formato de RUT.")
+
+    paciente_cacheado = cache_pacientes_por_rut.get(clave)
+    if paciente_cacheado is not None:
+        return paciente_cacheado
+
     query = """
-        SELECT id_paciente, nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro
-        FROM Pacientes WHERE id_paciente = ?
+        SELECT id_paciente, nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro, version
+        FROM Pacientes WHERE rut_normalizado = ?
     """
     with db.cursor() as cursor:
         try:
-            cursor.execute(query, paciente_id)
+            cursor.execute(query, clave, etiqueta="pacientes.por_rut")
+            row = cursor.fetchone()
+            if not row:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Paciente con RUT '{rut}' no encontrado.")
+
+            columns = [col[0] for col in cursor.description]
+            paciente = db_row_to_paciente_public(row, columns)
+            cache_pacientes_por_rut.set(clave, paciente)
+            return paciente
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al buscar paciente por RUT: {str(e)[:200]}")
+
+
+@router.get("/{paciente_id}", response_model=PacientePublic)
+def get_paciente(
+    paciente_id: int, response: Response,
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_PACIENTE.parametro),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    query = f"SELECT {proyeccion.select if proyeccion else SELECT_PACIENTE} FROM Pacientes WHERE id_paciente = ?"
+    with db.cursor() as cursor:
+        try:
+            cursor.execute(query, paciente_id, etiqueta="pacientes.get")
             row = cursor.fetchone()
             if not row:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Paciente con ID {paciente_id} no encontrado.")
 
+            if proyeccion:
+                fila, = proyeccion.filas([row])
+                return respuesta_json(fila, headers={"ETag": etag(fila["version"])})
             columns = [col[0] for col in cursor.description]
-            return db_row_to_paciente_public(row, columns)
+            paciente = db_row_to_paciente_public(row, columns)
+            response.headers["ETag"] = etag(paciente.version)
+            return paciente
         except HTTPException:
             raise
         except Exception as e:
@@ -134,58 +288,37 @@ def get_paciente(paciente_id: int, db: pyodbc.Connection = Depends(get_connectio
 
 
 @router.put("/{paciente_id}", response_model=PacientePublic)
-def update_paciente(paciente_id: int, paciente_in: PacienteUpdate, db: pyodbc.Connection = Depends(get_connection)):
+def update_paciente(
+    paciente_id: int, paciente_in: PacienteUpdate, response: Response,
+    version: int = Depends(version_if_match), db: pyodbc.Connection = Depends(get_connection),
+):
     update_data = paciente_in.dict(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
 
     with db.cursor() as cursor:
-        cursor.execute("SELECT rut FROM Pacientes WHERE id_paciente = ?", paciente_id)
-        current_paciente_details = cursor.fetchone()
-        if not current_paciente_details:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Paciente con ID {paciente_id} no encontrado para actualizar.")
-
-        current_rut = current_paciente_details[0]
-
-        if 'rut' in update_data and update_data['rut'] != current_rut:
-            cursor.execute("SELECT id_paciente FROM Pacientes WHERE rut = ? AND id_paciente != ?", update_data['rut'], paciente_id)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El RUT '{update_data['rut']}' ya está en uso por otro paciente.")
-
-        set_clause_parts = []
-        params = []
-        for key, value in update_data.items():
-            set_clause_parts.append(f"[{key}] = ?")
-            params.append(value)
-
-        if not set_clause_parts:
-             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay campos válidos para actualizar.")
-
-        params.append(paciente_id)
-        set_clause = ", ".join(set_clause_parts)
-
-        query_update = f"UPDATE Pacientes SET {set_clause} WHERE id_paciente = ?"
-        query_select_updated = """
-            SELECT id_paciente, nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro
-            FROM Pacientes WHERE id_paciente = ?
-        """
-
         try:
-            cursor.execute(query_update, tuple(params))
-            db.commit()
-
-            cursor.execute(query_select_updated, paciente_id)
+            # Un solo viaje: el UPDATE devuelve la fila nueva y el RUT anterior si la versión coincide;
+            # si no, la versión actual (412) o nada (404). Un RUT duplicado lo rechaza el índice único.
+            ACTUALIZACION_PACIENTES.ejecutar(cursor, update_data, paciente_id, etiqueta="pacientes.update.update", version=version)
             updated_db_row = cursor.fetchone()
             if not updated_db_row:
-                 db.rollback() # Poco probable si el commit tuvo éxito, pero por seguridad
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error crítico: Paciente no encontrado después de supuesta actualización.")
+                error = error_actualizacion(cursor, f"Paciente con ID {paciente_id} no encontrado para actualizar.")
+                db.rollback()
+                raise error
+            db.commit()
 
-            columns = [col[0] for col in cursor.description]
-            return db_row_to_paciente_public(updated_db_row, columns)
+            *fila_actualizada, rut_anterior = updated_db_row
+            cache_pacientes_por_rut.delete(rut_compacto(rut_anterior))
+            paciente = db_row_to_paciente_public(fila_actualizada, COLUMNAS_PACIENTE)
+            response.headers["ETag"] = etag(paciente.version)
+            indice_pacientes.agregar(paciente.id_paciente, paciente.nombre, paciente.apellido)
+            return paciente
 
         except pyodbc.IntegrityError as e:
             db.rollback()
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al actualizar paciente: {str(e)[:100]}")
+            duplicado = restriccion_violada(e, DUPLICADOS_PACIENTE)
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=duplicado or f"Conflicto de datos al actualizar paciente: {str(e)[:100]}")
         except HTTPException:
             raise
         except Exception as e:
@@ -195,22 +328,32 @@ def update_paciente(paciente_id: int, paciente_in: PacienteUpdate, db: pyodbc.Co
 
 @router.delete("/{paciente_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_paciente(paciente_id: int, db: pyodbc.Connection = Depends(get_connection)):
-    query_check = "SELECT id_paciente FROM Pacientes WHERE id_paciente = ?"
-    query_delete = "DELETE FROM Pacientes WHERE id_paciente = ?"
+    # OUTPUT DELETED.rut: sin fila, el paciente no existe; con ella se invalida su entrada de la caché.
+    # Va con INTO a una variable de tabla porque Pacientes tiene un trigger AFTER DELETE (sql/029) y
+    # SQL Server no acepta OUTPUT sin INTO en ese caso (error 334). La tabla es más ancha que un RUT
+    # válido para no fallar con filas antiguas mal formateadas.
+    query_delete = """
+        SET NOCOUNT ON;
+        DECLARE @eliminados TABLE (rut NVARCHAR(50));
+        DELETE FROM Pacientes OUTPUT DELETED.rut INTO @eliminados WHERE id_paciente = ?;
+        SELECT rut FROM @eliminados;
+    """
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_check, paciente_id)
-            if not cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Paciente con ID {paciente_id} no encontrado para eliminar.")
-
-            cursor.execute(query_delete, paciente_id)
-            if cursor.rowcount == 0:
+            cursor.execute(query_delete, paciente_id, etiqueta="pacientes.delete.delete")
+            eliminado = cursor.fetchone()
+            if not eliminado:
                 db.rollback()
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No se eliminó el paciente (inesperado).")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Paciente con ID {paciente_id} no encontrado para eliminar.")
 
             db.commit()
+            cache_pacientes_por_rut.delete(rut_compacto(eliminado[0]))
+            indice_pacientes.eliminar(paciente_id)
             return None
+        except pyodbc.IntegrityError as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El paciente tiene registros asociados y no se puede eliminar: {str(e)[:100]}")
         except HTTPException:
             raise
         except Exception as e:
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 from app.database import get_connection
 import pyodbc
-from app.schemas.reporte_schema import ReporteGeneralDataPublic, ConteoPorEstado
+from app.schemas.reporte_schema import (
+    ReporteGeneralDataPublic, ConteoPorEstado, ReporteRotacionPublic, PrediccionRotacion,
+)
+from app.services.rotacion_quirofanos import calcular_estadisticas, leer_rotaciones, predictor_rotacion
 
 router = APIRouter()
 
@@ -18,13 +22,13 @@ def get_reporte_general(db: pyodbc.Connection = Depends(get_connection)):
     with db.cursor() as cursor:
         try:
             # Conteo total de pacientes
-            cursor.execute("SELECT COUNT(*) FROM Pacientes")
+            cursor.execute("SELECT COUNT(*) FROM Pacientes", etiqueta="reportes.general.pacientes")
             row = cursor.fetchone()
             if row:
                 total_pacientes = row[0]
 
             # Conteo total de usuarios (personal)
-            cursor.execute("SELECT COUNT(*) FROM Usuarios")
+            cursor.execute("SELECT COUNT(*) FROM Usuarios", etiqueta="reportes.general.usuarios")
             row = cursor.fetchone()
             if row:
                 total_usuarios = row[0]
@@ -35,7 +39,7 @@ def get_reporte_general(db: pyodbc.Connection = Depends(get_connection)):
                 FROM Cirugias
                 GROUP BY estado_cirugia
                 ORDER BY estado_cirugia
-            """)
+            """, etiqueta="reportes.general.cirugias_por_estado")
             rows = cursor.fetchall()
             if rows:
                 for row_estado in rows:
@@ -51,6 +55,53 @@ def get_reporte_general(db: pyodbc.Connection = Depends(get_connection)):
             # En un caso real, se podría querer loguear el error 'e'
             raise HTTPException(status_code=500, detail=f"Error de base de datos al generar el reporte general: {str(e)[:200]}")
 
+@router.get("/turnover", response_model=ReporteRotacionPublic)
+def get_reporte_turnover(
+    desde: Optional[date] = Query(None, description="Por defecto, 90 días antes de 'hasta'"),
+    hasta: Optional[date] = Query(None, description="Inclusive. Por defecto, hoy"),
+    nombre_quirofano: Optional[str] = None,
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    """
+    Tiempo de rotación (desde que se desocupa el quirófano hasta que queda limpio): mediana y p90
+    en minutos por quirófano y por quirófano, día de la semana y hora.
+    """
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=90)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior o igual a 'hasta'.")
+
+    with db.cursor() as cursor:
+        try:
+            filas = leer_rotaciones(cursor, datetime.combine(desde, datetime.min.time()),
+                                    datetime.combine(hasta + timedelta(days=1), datetime.min.time()), nombre_quirofano)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error de base de datos al generar el reporte de rotación: {str(e)[:200]}")
+
+    estadisticas = calcular_estadisticas(filas)
+    por_quirofano = sorted(
+        (e for (quirofano, dia, hora), e in estadisticas.items() if quirofano is not None and dia is None and hora is None),
+        key=lambda e: e.nombre_quirofano,
+    )
+    por_franja = sorted(
+        (e for (quirofano, dia, hora), e in estadisticas.items() if quirofano is not None and dia is not None),
+        key=lambda e: (e.nombre_quirofano, e.dia_semana, e.hora),
+    )
+    return ReporteRotacionPublic(
+        desde=desde, hasta=hasta, general=estadisticas.get((None, None, None)),
+        por_quirofano=por_quirofano, por_franja=por_franja,
+    )
+
+
+@router.get("/turnover/prediccion", response_model=PrediccionRotacion)
+def get_prediccion_turnover(
+    nombre_quirofano: str,
+    momento: Optional[datetime] = Query(None, description="Cuándo se desocupa el quirófano (UTC). Por defecto, ahora"),
+):
+    """Rotación esperada y holgura sugerida para agendar la siguiente cirugía en el quirófano."""
+    return predictor_rotacion.predecir(nombre_quirofano, momento or datetime.utcnow())
+
+
 # Se podrían añadir más endpoints de reportes específicos aquí
 # Ejemplo:
 # @router.get("/ocupacion-quirofanos")
@@ -1,14 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List
-from app.database import get_connection
+from fastapi import APIRouter, HTTPException, Depends, status, Response
+from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from app.database import conexion_pool, get_connection
 import pyodbc
 from app.schemas.user_schema import UserCreate, UserUpdate, UserPublic, UserList
+from app.core.seguridad import generar_hash_contrasena_async
+from app.core import permisos
+from app.core.tiempos import FASE_MAPEO, medido
+from app.core.sentencias import ActualizacionTabla, BIT, restriccion_violada, texto
+from app.core.concurrencia import error_actualizacion, etag, version_if_match
+from app.core.proyecciones import Proyeccion, Proyecciones, respuesta_json
 from datetime import datetime
 
 router = APIRouter()
 
+COLUMNAS_USUARIO = [
+    "id_usuario", "nombre", "apellido", "rut", "email", "telefono", "rol", "especialidad",
+    "activo", "fecha_creacion", "ultimo_acceso", "version",
+]
+
+# ?fields= en GET /usuarios y GET /usuarios/{id}; activo llega como BIT y se entrega como bool
+PROYECCIONES_USUARIO = Proyecciones(COLUMNAS_USUARIO, obligatorias=["id_usuario", "version"], conversiones={"activo": bool})
+SELECT_USUARIO = ", ".join(COLUMNAS_USUARIO)
+
+# La contraseña no se cambia por PUT /usuarios/{id}
+ACTUALIZACION_USUARIOS = ActualizacionTabla("Usuarios", "id_usuario", {
+    "nombre": texto(50), "apellido": texto(50), "rut": texto(12), "email": texto(255),
+    "telefono": texto(15), "rol": texto(50), "especialidad": texto(100), "activo": BIT,
+}, salida=COLUMNAS_USUARIO, version="version")
+
+# Índices únicos de Usuarios (sql/044_usuarios_unicos.sql) -> mensaje del 409
+DUPLICADOS_USUARIO = {
+    "UX_Usuarios_rut": "El RUT ya está registrado para otro usuario.",
+    "UX_Usuarios_email": "El email ya está registrado para otro usuario.",
+}
+
 # --- Funciones Auxiliares ---
 
+@medido(FASE_MAPEO)
 def db_row_to_user_public(row: pyodbc.Row, columns: List[str]) -> UserPublic:
     """Convierte una fila de la base de datos a un objeto UserPublic."""
     user_data_raw = dict(zip(columns, row))
@@ -31,61 +60,75 @@ def db_row_to_user_public(row: pyodbc.Row, columns: List[str]) -> UserPublic:
 
 # --- Endpoints CRUD para Usuarios ---
 
-@router.post("/", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
-def create_usuario(usuario_in: UserCreate, db: pyodbc.Connection = Depends(get_connection)):
-    placeholder_hash = "placeholder_for_" + usuario_in.contrasena
-
-    query_check_rut = "SELECT id_usuario FROM Usuarios WHERE rut = ?"
-    query_check_email = "SELECT id_usuario FROM Usuarios WHERE email = ?"
+def insertar_usuario(params: tuple) -> UserPublic:
+    """INSERT del usuario con una conexión del pool. Corre en el threadpool, ya con el hash calculado."""
     query_insert = """
         INSERT INTO Usuarios (nombre, apellido, rut, email, telefono, rol, especialidad, contrasena_hash, activo, fecha_creacion, ultimo_acceso)
-        OUTPUT INSERTED.id_usuario, INSERTED.nombre, INSERTED.apellido, INSERTED.rut, INSERTED.email, INSERTED.telefono, INSERTED.rol, INSERTED.especialidad, INSERTED.activo, INSERTED.fecha_creacion, INSERTED.ultimo_acceso
+        OUTPUT INSERTED.id_usuario, INSERTED.nombre, INSERTED.apellido, INSERTED.rut, INSERTED.email, INSERTED.telefono, INSERTED.rol, INSERTED.especialidad, INSERTED.activo, INSERTED.fecha_creacion, INSERTED.ultimo_acceso, INSERTED.version
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETUTCDATE(), NULL)
     """
 
+    with conexion_pool() as db:
+        with db.cursor() as cursor:
+            try:
+                # RUT y email duplicados los rechazan los índices únicos (ver DUPLICADOS_USUARIO)
+                cursor.execute(query_insert, params, etiqueta="usuarios.create.insert")
+                created_user_row = cursor.fetchone()
+                if not created_user_row:
+                    db.rollback()
+                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo crear el usuario (la inserción no devolvió datos).")
+
+                db.commit()
+                columns = [col[0] for col in cursor.description]
+                return db_row_to_user_public(created_user_row, columns)
+
+            except pyodbc.IntegrityError as e:
+                db.rollback()
+                duplicado = restriccion_violada(e, DUPLICADOS_USUARIO)
+                if duplicado:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=duplicado)
+                detail_msg = f"Conflicto de datos al crear usuario. Verifique que el RUT y Email sean únicos."
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail_msg + f" (Error DB: {str(e)[:100]})")
+            except HTTPException:
+                raise
+            except Exception as e:
+                db.rollback()
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al crear usuario: {str(e)[:200]}")
+
+
+@router.post("/", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
+async def create_usuario(usuario_in: UserCreate):
+    """
+    Igual que el login: el hash (scrypt) corre en el pool de procesos sin ocupar un hilo ni una
+    conexión mientras tanto; la conexión se toma recién para el INSERT.
+    """
+    contrasena_hash = await generar_hash_contrasena_async(usuario_in.contrasena)
+
     params = (
         usuario_in.nombre, usuario_in.apellido, usuario_in.rut, usuario_in.email,
         usuario_in.telefono, usuario_in.rol, usuario_in.especialidad,
-        placeholder_hash,
+        contrasena_hash,
         True
     )
-
-    with db.cursor() as cursor:
-        try:
-            cursor.execute(query_check_rut, usuario_in.rut)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El RUT '{usuario_in.rut}' ya está registrado.")
-
-            cursor.execute(query_check_email, usuario_in.email)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El email '{usuario_in.email}' ya está registrado.")
-
-            cursor.execute(query_insert, params)
-            created_user_row = cursor.fetchone()
-            if not created_user_row:
-                db.rollback()
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo crear el usuario (la inserción no devolvió datos).")
-
-            db.commit()
-            columns = [col[0] for col in cursor.description]
-            return db_row_to_user_public(created_user_row, columns)
-
-        except pyodbc.IntegrityError as e:
-            db.rollback()
-            detail_msg = f"Conflicto de datos al crear usuario. Verifique que el RUT y Email sean únicos."
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail_msg + f" (Error DB: {str(e)[:100]})")
-        except HTTPException:
-            raise
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de base de datos al crear usuario: {str(e)[:200]}")
+    try:
+        return await run_in_threadpool(insertar_usuario, params)
+    except TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio está ocupado. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": "1"},
+        )
 
 
 @router.get("/", response_model=UserList)
-def list_usuarios(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depends(get_connection)):
+def list_usuarios(
+    skip: int = 0, limit: int = 100,
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_USUARIO.parametro),
+    db: pyodbc.Connection = Depends(get_connection),
+):
     query_count = "SELECT COUNT(*) FROM Usuarios"
-    query_select = """
-        SELECT id_usuario, nombre, apellido, rut, email, telefono, rol, especialidad, activo, fecha_creacion, ultimo_acceso
+    query_select = f"""
+        SELECT {proyeccion.select if proyeccion else SELECT_USUARIO}
         FROM Usuarios
         ORDER BY id_usuario
         OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
@@ -95,13 +138,15 @@ def list_usuarios(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depen
     total_count = 0
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_count)
+            cursor.execute(query_count, etiqueta="usuarios.list.count")
             count_row = cursor.fetchone()
             if count_row:
                 total_count = count_row[0]
 
-            cursor.execute(query_select, skip, limit)
+            cursor.execute(query_select, skip, limit, etiqueta="usuarios.list.page")
             rows = cursor.fetchall()
+            if proyeccion:
+                return respuesta_json({"usuarios": proyeccion.filas(rows), "total": total_count})
             if rows:
                 columns = [col[0] for col in cursor.description]
                 for row in rows:
@@ -114,20 +159,26 @@ def list_usuarios(skip: int = 0, limit: int = 100, db: pyodbc.Connection = Depen
 
 
 @router.get("/{usuario_id}", response_model=UserPublic)
-def get_usuario(usuario_id: int, db: pyodbc.Connection = Depends(get_connection)):
-    query = """
-        SELECT id_usuario, nombre, apellido, rut, email, telefono, rol, especialidad, activo, fecha_creacion, ultimo_acceso
-        FROM Usuarios WHERE id_usuario = ?
-    """
+def get_usuario(
+    usuario_id: int, response: Response,
+    proyeccion: Optional[Proyeccion] = Depends(PROYECCIONES_USUARIO.parametro),
+    db: pyodbc.Connection = Depends(get_connection),
+):
+    query = f"SELECT {proyeccion.select if proyeccion else SELECT_USUARIO} FROM Usuarios WHERE id_usuario = ?"
     with db.cursor() as cursor:
         try:
-            cursor.execute(query, usuario_id)
+            cursor.execute(query, usuario_id, etiqueta="usuarios.get")
             row = cursor.fetchone()
             if not row:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Usuario con ID {usuario_id} no encontrado.")
 
+            if proyeccion:
+                fila, = proyeccion.filas([row])
+                return respuesta_json(fila, headers={"ETag": etag(fila["version"])})
             columns = [col[0] for col in cursor.description]
-            return db_row_to_user_public(row, columns)
+            usuario = db_row_to_user_public(row, columns)
+            response.headers["ETag"] = etag(usuario.version)
+            return usuario
         except HTTPException:
             raise
         except Exception as e:
@@ -135,65 +186,36 @@ def get_usuario(usuario_id: int, db: pyodbc.Connection = Depends(get_connection)
 
 
 @router.put("/{usuario_id}", response_model=UserPublic)
-def update_usuario(usuario_id: int, usuario_in: UserUpdate, db: pyodbc.Connection = Depends(get_connection)):
+def update_usuario(
+    usuario_id: int, usuario_in: UserUpdate, response: Response,
+    version: int = Depends(version_if_match), db: pyodbc.Connection = Depends(get_connection),
+):
     update_data = usuario_in.dict(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay datos proporcionados para actualizar.")
 
     with db.cursor() as cursor:
-        cursor.execute("SELECT rut, email FROM Usuarios WHERE id_usuario = ?", usuario_id)
-        current_user_details = cursor.fetchone()
-        if not current_user_details:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Usuario con ID {usuario_id} no encontrado para actualizar.")
-
-        current_rut, current_email = current_user_details
-
-        if 'rut' in update_data and update_data['rut'] != current_rut:
-            cursor.execute("SELECT id_usuario FROM Usuarios WHERE rut = ? AND id_usuario != ?", update_data['rut'], usuario_id)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El RUT '{update_data['rut']}' ya está en uso por otro usuario.")
-
-        if 'email' in update_data and update_data['email'] != current_email:
-            cursor.execute("SELECT id_usuario FROM Usuarios WHERE email = ? AND id_usuario != ?", update_data['email'], usuario_id)
-            if cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El email '{update_data['email']}' ya está en uso por otro usuario.")
-
-        set_clause_parts = []
-        params = []
-        for key, value in update_data.items():
-            set_clause_parts.append(f"[{key}] = ?")
-            params.append(value)
-
-        if not set_clause_parts:
-             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay campos válidos para actualizar.")
-
-        params.append(usuario_id)
-        set_clause = ", ".join(set_clause_parts)
-
-        query_update = f"UPDATE Usuarios SET {set_clause} WHERE id_usuario = ?"
-        query_select_updated = """
-            SELECT id_usuario, nombre, apellido, rut, email, telefono, rol, especialidad, activo, fecha_creacion, ultimo_acceso
-            FROM Usuarios WHERE id_usuario = ?
-        """
-
         try:
-            cursor.execute(query_update, tuple(params))
-            # No es necesario verificar rowcount == 0 como error si la verificación de existencia ya pasó.
-            # Si no hay cambios efectivos, rowcount puede ser 0 en algunas BDs, pero no es un error.
-            db.commit()
-
-            cursor.execute(query_select_updated, usuario_id)
+            # Un solo viaje: el UPDATE devuelve la fila nueva (OUTPUT INSERTED) si la versión coincide;
+            # si no, la versión actual (412) o nada (404). RUT y email duplicados los rechazan los índices únicos.
+            ACTUALIZACION_USUARIOS.ejecutar(cursor, update_data, usuario_id, etiqueta="usuarios.update.update", version=version)
             updated_db_row = cursor.fetchone()
             if not updated_db_row:
-                 db.rollback()
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error crítico: Usuario no encontrado después de supuesta actualización.")
+                error = error_actualizacion(cursor, f"Usuario con ID {usuario_id} no encontrado para actualizar.")
+                db.rollback()
+                raise error
+            db.commit()
 
-            columns = [col[0] for col in cursor.description]
-            return db_row_to_user_public(updated_db_row, columns)
+            usuario_actualizado = db_row_to_user_public(updated_db_row, COLUMNAS_USUARIO)
+            response.headers["ETag"] = etag(usuario_actualizado.version)
+            # El cambio de rol o desactivación aplica de inmediato a los tokens ya emitidos
+            permisos.registrar_usuario(usuario_actualizado.id_usuario, usuario_actualizado.rol, usuario_actualizado.activo)
+            return usuario_actualizado
 
         except pyodbc.IntegrityError as e:
             db.rollback()
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Conflicto de datos al actualizar usuario: {str(e)[:100]}")
+            duplicado = restriccion_violada(e, DUPLICADOS_USUARIO)
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=duplicado or f"Conflicto de datos al actualizar usuario: {str(e)[:100]}")
         except HTTPException:
             raise
         except Exception as e:
@@ -203,22 +225,21 @@ def update_usuario(usuario_id: int, usuario_in: UserUpdate, db: pyodbc.Connectio
 
 @router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_usuario(usuario_id: int, db: pyodbc.Connection = Depends(get_connection)):
-    query_check = "SELECT id_usuario FROM Usuarios WHERE id_usuario = ?"
     query_delete = "DELETE FROM Usuarios WHERE id_usuario = ?"
 
     with db.cursor() as cursor:
         try:
-            cursor.execute(query_check, usuario_id)
-            if not cursor.fetchone():
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Usuario con ID {usuario_id} no encontrado para eliminar.")
-
-            cursor.execute(query_delete, usuario_id)
+            cursor.execute(query_delete, usuario_id, etiqueta="usuarios.delete.delete")
             if cursor.rowcount == 0:
                 db.rollback()
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No se eliminó el usuario (inesperado, podría haber sido eliminado por otro proceso).")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Usuario con ID {usuario_id} no encontrado para eliminar.")
 
             db.commit()
+            permisos.eliminar_usuario(usuario_id)
             return None
+        except pyodbc.IntegrityError as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El usuario tiene registros asociados y no se puede eliminar: {str(e)[:100]}")
         except HTTPException:
             raise
         except Exception as e:
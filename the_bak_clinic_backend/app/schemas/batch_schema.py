@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Any, List
+
+
+class SolicitudLote(BaseModel):
+    id: str = Field(..., min_length=1, max_length=50, description="Identificador para ubicar la respuesta (ej: kpis)")
+    url: str = Field(..., min_length=1, max_length=2000, description="Ruta GET con su query string (ej: /reportes/kpis?desde=2026-10-01)")
+
+
+class LoteRequest(BaseModel):
+    solicitudes: List[SolicitudLote] = Field(..., min_length=1, max_length=10)
+
+
+class RespuestaLote(BaseModel):
+    id: str
+    estado: int = Field(..., description="Código HTTP de la sub-solicitud")
+    cuerpo: Any = Field(None, description="Cuerpo JSON que habría devuelto la ruta por separado")
+
+
+class LoteResponse(BaseModel):
+    respuestas: List[RespuestaLote] = Field(..., description="En el mismo orden de las solicitudes")
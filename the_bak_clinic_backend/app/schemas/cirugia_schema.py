@@ -17,6 +17,7 @@ class CirugiaBase(BaseModel):
     duracion_estimada_minutos: Optional[int] = Field(None, gt=0, description="Duración estimada de la cirugía en minutos")
     # fecha_hora_fin_programada se podría calcular o ser un campo separado si es necesario registrarla explícitamente
     # Si se calcula: fecha_hora_inicio_programada + duracion_estimada_minutos
+    fecha_hora_fin_programada: Optional[datetime] = Field(None, description="Fecha y hora de término programada (se calcula con la duración si no se informa)")
 
     tipo_cirugia: str = Field(..., max_length=255, description="Tipo o nombre del procedimiento quirúrgico")
 
@@ -56,6 +57,7 @@ class CirugiaInDBBase(CirugiaBase):
     id_cirugia: int = Field(..., description="ID único de la cirugía, generado por la BD")
     fecha_creacion_registro: datetime # Se asignará en el router al crear
     fecha_ultima_modificacion: Optional[datetime] = None # Se asignará en el router al actualizar
+    version: Optional[int] = Field(None, description="Versión de la fila; se envía en If-Match al actualizar")
 
 class CirugiaPublic(CirugiaInDBBase):
     # Aquí se podrían añadir los objetos completos de Paciente y Medico si se hace un JOIN en la consulta
@@ -71,3 +73,20 @@ class CirugiaPublic(CirugiaInDBBase):
 class CirugiaListResponse(BaseModel):
     cirugias: List[CirugiaPublic]
     total: int
+
+# --- Carga masiva de cirugías ---
+
+class CirugiaLoteCreate(BaseModel):
+    cirugias: List[CirugiaCreate] = Field(..., min_length=1, max_length=2000, description="Cirugías a agendar en una sola operación")
+
+class CirugiaLoteResultado(BaseModel):
+    indice: int = Field(..., description="Posición de la cirugía dentro del lote recibido")
+    creada: bool
+    cirugia: Optional[CirugiaPublic] = None
+    error: Optional[str] = None
+    advertencia: Optional[str] = Field(None, description="Ej. poca holgura para la rotación del quirófano; no impide agendar")
+
+class CirugiaLoteResponse(BaseModel):
+    resultados: List[CirugiaLoteResultado]
+    total_creadas: int
+    total_rechazadas: int
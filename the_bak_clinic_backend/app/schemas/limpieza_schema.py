@@ -38,15 +38,27 @@ class EstadoQuirofanoListResponse(BaseModel):
     quirofanos: List[EstadoQuirofanoPublic]
     total: int
 
+class EstadoQuirofanoLoteItem(EstadoQuirofanoUpdate):
+    nombre_quirofano: str
+
+class EstadoQuirofanoLoteUpdate(BaseModel):
+    # Ej. el reinicio de fin de día de todos los pabellones en una sola sentencia
+    quirofanos: List[EstadoQuirofanoLoteItem] = Field(..., min_length=1, max_length=200)
+
 # Adicionalmente, un schema para una Tarea de Limpieza específica
 class TareaLimpieza(BaseModel):
     id_tarea_limpieza: int
     nombre_quirofano: str # O id_quirofano
+    id_cirugia: Optional[int] = None # Cirugía cuya finalización generó la tarea
     asignada_a: Optional[int] # ID del usuario de limpieza
     solicitada_dt: datetime
+    asignada_dt: Optional[datetime] = None
     completada_dt: Optional[datetime] = None
     estado_tarea: str # Ej: Pendiente, En Progreso, Completada, Verificada
+    ocupado_hasta: Optional[datetime] = None
     notas_tarea: Optional[str] = None
+    # Calculado por la cola: inicio de la próxima cirugía en el quirófano (define la prioridad)
+    proxima_cirugia_dt: Optional[datetime] = None
 
     class Config:
         orm_mode = True
@@ -55,6 +67,7 @@ class TareaLimpiezaCreate(BaseModel):
     nombre_quirofano: str
     asignada_a: Optional[int] = None # Opcional al crear
     notas_tarea: Optional[str] = None
+    ocupado_hasta: Optional[datetime] = None # Si no se envía, se toma del estado del quirófano
     # estado_tarea y solicitada_dt se pueden poner por defecto en el backend
 
 class TareaLimpiezaUpdate(BaseModel):
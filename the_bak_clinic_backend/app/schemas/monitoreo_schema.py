@@ -0,0 +1,35 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List
+
+
+class TiempoRuta(BaseModel):
+    metodo: str
+    ruta: str = Field(..., description="Plantilla de la ruta (ej: /cirugias/{cirugia_id})")
+    solicitudes: int
+    promedio_ms: float
+    p50_ms: float = Field(..., description="Estimado desde el histograma (límite superior del bucket)")
+    p95_ms: float
+    p99_ms: float
+    maximo_ms: float
+    promedio_fases_ms: Dict[str, float] = Field(..., description="Promedio por fase: db_conexion, db_consulta, mapeo y app (resto)")
+
+
+class TiemposRutasResponse(BaseModel):
+    rutas: List[TiempoRuta]
+    limites_histograma_ms: List[float]
+
+
+class SentenciaPerfil(BaseModel):
+    etiqueta: str = Field(..., description="Etiqueta de la sentencia (ej: cirugias.list.count)")
+    ejecuciones: int
+    total_ms: float
+    promedio_ms: float
+    maximo_ms: float
+    filas: int = Field(..., description="Filas leídas o afectadas en total")
+    errores: int
+    lentas: int = Field(..., description="Ejecuciones sobre el umbral de sentencia lenta")
+
+
+class ReporteSentenciasResponse(BaseModel):
+    sentencias: List[SentenciaPerfil]
+    umbral_lenta_ms: float
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional
 from datetime import datetime, date
+from app.utils.rut import validar_rut
 
 class PacienteBase(BaseModel):
     nombre: str = Field(..., min_length=1, max_length=50, description="Nombre del paciente")
@@ -21,8 +22,13 @@ class PacienteBase(BaseModel):
         # Por ahora, FastAPI y Pydantic deberían manejar bien la conversión de 'date' strings.
 
 class PacienteCreate(PacienteBase):
-    # Campos adicionales específicos para la creación, si los hubiera
-    pass
+    # El dígito verificador se revisa solo al escribir: las lecturas (PacientePublic) aceptan lo que
+    # ya está guardado, incluidas filas antiguas con un RUT inválido.
+    @field_validator("rut")
+    @classmethod
+    def rut_canonico(cls, v: str) -> str:
+        # Se guarda siempre como 'XXXXXXXX-D' para que un mismo paciente no quede en dos formatos
+        return validar_rut(v)
 
 class PacienteUpdate(BaseModel):
     nombre: Optional[str] = Field(None, min_length=1, max_length=50)
@@ -34,11 +40,17 @@ class PacienteUpdate(BaseModel):
     direccion: Optional[str] = Field(None, max_length=200)
     prevision: Optional[str] = Field(None, max_length=50)
     numero_ficha: Optional[str] = Field(None, max_length=50)
+
+    @field_validator("rut")
+    @classmethod
+    def rut_canonico(cls, v: Optional[str]) -> Optional[str]:
+        return validar_rut(v) if v is not None else v
     # Considerar si se pueden actualizar campos como 'activo' si existiera
 
 class PacienteInDBBase(PacienteBase):
     id_paciente: int = Field(..., description="ID único del paciente") # Asumiendo que es un entero en la BD
     fecha_registro: datetime = Field(default_factory=datetime.utcnow, description="Fecha de registro del paciente en el sistema")
+    version: Optional[int] = Field(None, description="Versión de la fila; se envía en If-Match al actualizar")
     # Podría haber un campo 'activo' también
 
 class PacientePublic(PacienteInDBBase):
@@ -49,3 +61,38 @@ class PacientePublic(PacienteInDBBase):
 class PacienteList(BaseModel):
     pacientes: list[PacientePublic]
     total: int
+
+# --- Importación masiva de pacientes ---
+
+class ImportacionErrorFila(BaseModel):
+    fila: int = Field(..., description="Número de fila en el archivo (1 = primera fila de datos)")
+    rut: Optional[str] = None
+    error: str
+
+class ImportacionPacientesEstado(BaseModel):
+    id_trabajo: str
+    nombre_archivo: Optional[str] = None
+    estado: str = Field("En Cola", description="En Cola, Procesando, Completada, Fallida")
+    filas_procesadas: int = 0
+    insertados: int = 0
+    actualizados: int = 0
+    rechazados: int = 0
+    errores: list[ImportacionErrorFila] = Field(default_factory=list, description="Primeros errores encontrados (lista acotada)")
+    detalle: Optional[str] = None
+    iniciada: Optional[datetime] = None
+    finalizada: Optional[datetime] = None
+
+# --- Búsqueda de pacientes ---
+
+class PacienteResumen(BaseModel):
+    id_paciente: int
+    nombre: str
+    apellido: str
+    rut: str
+    numero_ficha: Optional[str] = None
+    puntaje: float = Field(..., description="Relevancia del resultado (mayor es mejor)")
+
+class PacienteBusquedaResponse(BaseModel):
+    resultados: list[PacienteResumen]
+    total: int = Field(..., description="Total de pacientes que calzan con la búsqueda")
+    total_aproximado: bool = Field(False, description="El total es una estimación (términos muy comunes, como una sola letra)")
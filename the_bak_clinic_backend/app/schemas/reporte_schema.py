@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
+from datetime import date
 
 class ConteoPorEstado(BaseModel):
     estado: str
@@ -15,3 +16,25 @@ class ReporteGeneralDataPublic(BaseModel):
 
     class Config:
         orm_mode = True
+
+class EstadisticaRotacion(BaseModel):
+    nombre_quirofano: Optional[str] = Field(None, description="None en la fila general de todos los quirófanos")
+    dia_semana: Optional[int] = Field(None, description="0 = lunes ... 6 = domingo (hora local de la clínica)")
+    hora: Optional[int] = Field(None, description="Hora local (0-23) en que se desocupó el quirófano")
+    cantidad: int
+    mediana_minutos: float
+    p90_minutos: float
+
+class ReporteRotacionPublic(BaseModel):
+    desde: date
+    hasta: date
+    general: Optional[EstadisticaRotacion] = None
+    por_quirofano: List[EstadisticaRotacion] = Field(..., description="Rotación (desocupado -> limpio) por quirófano")
+    por_franja: List[EstadisticaRotacion] = Field(..., description="Por quirófano, día de la semana y hora")
+
+class PrediccionRotacion(BaseModel):
+    nombre_quirofano: str
+    mediana_minutos: float = Field(..., description="Rotación esperada")
+    p90_minutos: float = Field(..., description="Holgura sugerida entre cirugías (9 de cada 10 rotaciones terminan antes)")
+    muestras: int
+    nivel: str = Field(..., description="Datos usados: quirofano_dia_hora, quirofano_hora, quirofano, general o por_defecto")
@@ -39,6 +39,7 @@ class UserInDBBase(UserBase):
     activo: bool = Field(True, description="Estado de actividad del usuario")
     fecha_creacion: datetime = Field(default_factory=datetime.utcnow, description="Fecha de creación del usuario")
     ultimo_acceso: Optional[datetime] = Field(None, description="Fecha del último acceso del usuario")
+    version: Optional[int] = Field(None, description="Versión de la fila; se envía en If-Match al actualizar")
 
 # Schema para la respuesta pública (lo que se devuelve al cliente)
 # No incluye la contraseña.
@@ -53,3 +54,11 @@ class UserInDB(UserInDBBase):
 class UserList(BaseModel):
     usuarios: list[UserPublic]
     total: int
+
+# Usuario resuelto desde un token de acceso (sin consultar la BD)
+class UsuarioAutenticado(BaseModel):
+    id_usuario: int
+    email: str
+    rol: str
+    jti: str = Field(..., description="Identificador único del token, usado para revocarlo")
+    exp: float = Field(..., description="Expiración del token (epoch en segundos)")
@@ -0,0 +1,516 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.database import conexion_pool
+
+# Búsqueda de pacientes (GET /pacientes/buscar).
+#
+# - Nombres y apellidos: índice en memoria por worker. Guarda ids y no textos: vocabulario de
+#   términos (ordenado, para prefijos), ids de paciente por término en arrays compactos, trigramas
+#   por término para la búsqueda aproximada y, por paciente, los ids de sus términos en ranuras fijas.
+#   El nombre que se muestra se lee de la BD solo para los resultados.
+# - RUT y número de ficha (términos con dígitos): prefijo en la BD sobre rut_normalizado y
+#   ficha_normalizada, que tienen índice (sql/028 y sql/029).
+#
+# El índice se carga completo una vez al arrancar el worker (app/core/preparacion.py). Después solo se
+# traen las filas cambiadas: la columna `cambio` (ROWVERSION) de Pacientes y los borrados que registra
+# el trigger de sql/029 hacen de marca de agua. Las escrituras de este worker se aplican al momento.
+
+# Cada cuánto se traen de la BD los cambios hechos por otros workers (y por la importación)
+SEGUNDOS_ENTRE_SINCRONIZACIONES = 10
+# El trigger de sql/029 borra los registros de eliminados de más de un día: si un worker pasó más de
+# la mitad sin sincronizar (p. ej. la BD estuvo caída), vuelve a cargar todo en vez de arriesgarse a
+# perder borrados
+SEGUNDOS_MAXIMOS_SIN_SINCRONIZAR = 12 * 3600
+# Términos de nombre + apellido que se indexan por paciente
+TERMINOS_POR_PACIENTE = 8
+# Pacientes que se recorren como máximo por término de la consulta. Con términos más comunes ("m",
+# "maria") se busca solo entre los ids bajos, donde caben unos MAX_POSTINGS_POR_TERMINO del término
+# más selectivo, y el total se estima en proporción a ese rango
+MAX_POSTINGS_POR_TERMINO = 10_000
+# Coincidencias por RUT o ficha que se traen de la BD por término
+MAX_COINCIDENCIAS_BD = 1_000
+# Similitud mínima (Jaccard de trigramas) para aceptar un término como coincidencia aproximada
+SIMILITUD_MINIMA = 0.35
+
+PUNTAJE_EXACTO = 3.0
+PUNTAJE_PREFIJO = 2.0
+PUNTAJE_APROXIMADO = 1.5
+
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+# Mayor que cualquier carácter de un término: fin del rango de un prefijo en el vocabulario
+_FIN_PREFIJO = "{"
+
+
+def plegar(texto: Optional[str]) -> str:
+    """Minúsculas y sin tildes ('Núñez' -> 'nunez'); puntos y guiones se eliminan para que los RUT queden compactos."""
+    if not texto:
+        return ""
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return sin_tildes.lower().replace(".", "").replace("-", "")
+
+
+def terminos(texto: Optional[str]) -> List[str]:
+    return [t for t in _SEPARADORES.split(plegar(texto)) if t]
+
+
+def trigramas(termino: str) -> Set[str]:
+    relleno = f"  {termino} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _con_trigramas(termino: str) -> bool:
+    return termino.isalpha() and len(termino) >= 3
+
+
+class IndiceNoCargado(Exception):
+    """La consulta necesita el índice de nombres y el worker todavía no termina de cargarlo."""
+
+
+class _Indice:
+    """Estructuras del índice de nombres. Sin locks: IndicePacientes las protege."""
+
+    def __init__(self):
+        self.ids_termino: Dict[str, int] = {}
+        self.terminos: List[str] = []  # id de término -> término
+        self.vocabulario: List[str] = []  # términos con al menos un paciente, ordenados
+        self.ids_vocabulario = array("I")  # id de cada término del vocabulario, en el mismo orden
+        self.postings: Dict[int, array] = {}  # id de término -> ids de paciente, ordenados
+        self.trigramas: Dict[str, array] = {}  # trigrama -> ids de término
+        # TERMINOS_POR_PACIENTE ranuras por id de paciente con (id de término + 1); 0 = libre.
+        # Los id_paciente son IDENTITY (densos), así que el array mide ~ el mayor id.
+        self.ranuras = array("I")
+
+    def id_termino(self, termino: str) -> int:
+        id_termino = self.ids_termino.get(termino)
+        if id_termino is None:
+            id_termino = self.ids_termino[termino] = len(self.terminos)
+            self.terminos.append(termino)
+        return id_termino
+
+    def ids_terminos(self, nombre: Optional[str], apellido: Optional[str]) -> Tuple[int, ...]:
+        unicos = dict.fromkeys(terminos(nombre) + terminos(apellido))
+        return tuple(self.id_termino(t) for t in islice(unicos, TERMINOS_POR_PACIENTE))
+
+    def terminos_paciente(self, id_paciente: int) -> Tuple[int, ...]:
+        inicio = id_paciente * TERMINOS_POR_PACIENTE
+        return tuple(t - 1 for t in self.ranuras[inicio:inicio + TERMINOS_POR_PACIENTE] if t)
+
+    @staticmethod
+    def ranuras_de(ids_terminos: Tuple[int, ...]) -> array:
+        return array("I", [t + 1 for t in ids_terminos] + [0] * (TERMINOS_POR_PACIENTE - len(ids_terminos)))
+
+    def poner(self, id_paciente: int, nuevos: Tuple[int, ...]) -> None:
+        """Deja al paciente con los términos `nuevos` (vacío = quitarlo)."""
+        anteriores = self.terminos_paciente(id_paciente)
+        if anteriores == nuevos:
+            return
+        for id_termino in anteriores:
+            if id_termino not in nuevos:
+                self._quitar(id_termino, id_paciente)
+        for id_termino in nuevos:
+            if id_termino not in anteriores:
+                ids = self.postings.get(id_termino)
+                if ids is None:
+                    self.postings[id_termino] = array("I", (id_paciente,))
+                    self._activar(id_termino)
+                else:
+                    # Búsqueda binaria + memmove; un paciente nuevo (id mayor) queda al final
+                    bisect.insort(ids, id_paciente)
+        inicio = id_paciente * TERMINOS_POR_PACIENTE
+        faltan = inicio + TERMINOS_POR_PACIENTE - len(self.ranuras)
+        if faltan > 0:
+            self.ranuras.frombytes(bytes(faltan * self.ranuras.itemsize))
+        self.ranuras[inicio:inicio + TERMINOS_POR_PACIENTE] = self.ranuras_de(nuevos)
+
+    def cargar(self, id_paciente: int, ids_terminos: Tuple[int, ...], ranuras: array) -> None:
+        """Carga en bloque, con ids crecientes; vocabulario y trigramas se arman en terminar_carga."""
+        inicio = id_paciente * TERMINOS_POR_PACIENTE
+        if inicio < len(self.ranuras):
+            self.poner(id_paciente, ids_terminos)
+            return
+        postings = self.postings
+        for id_termino in ids_terminos:
+            ids = postings.get(id_termino)
+            if ids is None:
+                postings[id_termino] = array("I", (id_paciente,))
+            else:
+                ids.append(id_paciente)
+        if inicio > len(self.ranuras):
+            self.ranuras.frombytes(bytes((inicio - len(self.ranuras)) * self.ranuras.itemsize))
+        self.ranuras.extend(ranuras)
+
+    def _activar(self, id_termino: int) -> None:
+        termino = self.terminos[id_termino]
+        posicion = bisect.bisect_left(self.vocabulario, termino)
+        self.vocabulario.insert(posicion, termino)
+        self.ids_vocabulario.insert(posicion, id_termino)
+        if _con_trigramas(termino):
+            for trigrama in trigramas(termino):
+                self.trigramas.setdefault(trigrama, array("I")).append(id_termino)
+
+    def _quitar(self, id_termino: int, id_paciente: int) -> None:
+        ids = self.postings.get(id_termino)
+        if ids is None:
+            return
+        posicion = bisect.bisect_left(ids, id_paciente)
+        if posicion < len(ids) and ids[posicion] == id_paciente:
+            del ids[posicion]
+        if ids:
+            return
+        del self.postings[id_termino]
+        termino = self.terminos[id_termino]
+        posicion = bisect.bisect_left(self.vocabulario, termino)
+        if posicion < len(self.vocabulario) and self.vocabulario[posicion] == termino:
+            self.vocabulario.pop(posicion)
+            del self.ids_vocabulario[posicion]
+        if _con_trigramas(termino):
+            for trigrama in trigramas(termino):
+                terminos_trigrama = self.trigramas.get(trigrama)
+                if terminos_trigrama is not None and id_termino in terminos_trigrama:
+                    terminos_trigrama.remove(id_termino)
+                    if not terminos_trigrama:
+                        del self.trigramas[trigrama]
+
+    def terminar_carga(self) -> None:
+        """Ordena el vocabulario y arma los trigramas una sola vez tras una carga en bloque."""
+        self.vocabulario = sorted(self.terminos[t] for t in self.postings)
+        self.ids_vocabulario = array("I", map(self.ids_termino.__getitem__, self.vocabulario))
+        self.trigramas = {}
+        for id_termino in self.postings:
+            termino = self.terminos[id_termino]
+            if _con_trigramas(termino):
+                for trigrama in trigramas(termino):
+                    self.trigramas.setdefault(trigrama, array("I")).append(id_termino)
+
+    def coincidencias(self, termino_consulta: str) -> Dict[int, float]:
+        """Términos del vocabulario que calzan con un término de la consulta y su puntaje, de mayor a menor."""
+        encontrados: Dict[int, float] = {}
+        inicio = bisect.bisect_left(self.vocabulario, termino_consulta)
+        fin = bisect.bisect_left(self.vocabulario, termino_consulta + _FIN_PREFIJO, inicio)
+        if inicio < fin and self.vocabulario[inicio] == termino_consulta:
+            encontrados[self.ids_vocabulario[inicio]] = PUNTAJE_EXACTO
+            inicio += 1
+        # Un prefijo corto ("m") calza con miles de términos: el slice y dict.fromkeys corren en C
+        encontrados.update(dict.fromkeys(self.ids_vocabulario[inicio:fin], PUNTAJE_PREFIJO))
+
+        if _con_trigramas(termino_consulta):
+            trigramas_consulta = trigramas(termino_consulta)
+            compartidos: Counter = Counter()
+            for trigrama in trigramas_consulta:
+                compartidos.update(self.trigramas.get(trigrama, ()))
+            # Con len(trigramas(t)) == len(t) + 1 y términos de 3+ letras, la similitud mínima exige
+            # compartir al menos `minimo` trigramas: descarta casi todo sin calcularla
+            minimo = math.ceil(SIMILITUD_MINIMA * (len(trigramas_consulta) + 4) / (1 + SIMILITUD_MINIMA))
+            aproximados = []
+            for id_termino, cantidad in compartidos.items():
+                if cantidad < minimo or id_termino in encontrados:
+                    continue
+                similitud = cantidad / (len(trigramas_consulta) + len(self.terminos[id_termino]) + 1 - cantidad)
+                if similitud >= SIMILITUD_MINIMA:
+                    aproximados.append((PUNTAJE_APROXIMADO * similitud, id_termino))
+            for puntaje, id_termino in sorted(aproximados, reverse=True):
+                encontrados[id_termino] = puntaje
+        return encontrados
+
+    def total_pacientes(self, coincidencias: Dict[int, float]) -> int:
+        """Ids de paciente de esos términos (un paciente con dos de ellos cuenta dos veces)."""
+        return sum(map(len, map(self.postings.__getitem__, coincidencias)))
+
+    def pacientes(self, coincidencias: Dict[int, float], corte: Optional[int] = None) -> Tuple[Dict[int, float], int]:
+        """
+        Pacientes con alguno de los términos (con `corte`, solo ids hasta ese) y su mejor puntaje,
+        más cuántos ids se recorrieron.
+        """
+        puntajes: Dict[int, float] = {}
+        recorridos = 0
+        postings = self.postings
+        # De menor a mayor puntaje, así a cada paciente le queda el mayor (dict.fromkeys corre en C).
+        # Un prefijo de una letra recorre miles de términos: el cuerpo del ciclo es lo mínimo posible
+        for id_termino, puntaje in reversed(coincidencias.items()):
+            lista = postings[id_termino]
+            if corte is not None and lista[-1] > corte:
+                if lista[0] > corte:
+                    continue
+                lista = lista[:bisect.bisect_right(lista, corte)]
+            recorridos += len(lista)
+            puntajes.update(dict.fromkeys(lista, puntaje))
+        return puntajes, recorridos
+
+
+class IndicePacientes:
+    """
+    Índice de nombres sincronizado con la BD por marca de agua (ver el comentario del módulo).
+    `_lock` protege las estructuras y se toma por poco tiempo: las consultas recorren a lo más
+    MAX_POSTINGS_POR_TERMINO ids por término y la sincronización aplica los cambios en bloques.
+    La carga completa se arma aparte y reemplaza al índice de una vez.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Una sola carga o sincronización a la vez
+        self._lock_sincronizacion = threading.Lock()
+        self._indice = _Indice()
+        self._marca: Optional[bytes] = None  # ROWVERSION hasta donde se leyó
+        self.cargado_en: Optional[float] = None  # time.monotonic() de la última sincronización
+        self._sincronizando = False
+
+    # --- Escrituras de este worker ---
+
+    def agregar(self, id_paciente: int, nombre: str, apellido: str) -> None:
+        """Agrega o reemplaza un paciente. Se llama desde las escrituras del router."""
+        with self._lock:
+            indice = self._indice
+            indice.poner(id_paciente, indice.ids_terminos(nombre, apellido))
+
+    def eliminar(self, id_paciente: int) -> None:
+        with self._lock:
+            self._indice.poner(id_paciente, ())
+
+    # --- Sincronización con la BD ---
+
+    def invalidar(self) -> None:
+        """Trae los cambios ahora, en segundo plano (p. ej. tras una importación masiva)."""
+        self._programar_sincronizacion()
+
+    def asegurar_cargado(self) -> None:
+        """Carga o sincroniza el índice en este hilo (precalentamiento). Lanza la excepción si la BD falla."""
+        with self._lock_sincronizacion:
+            self._sincronizar()
+
+    def sincronizar_si_corresponde(self) -> None:
+        """Desde los requests: si pasó el intervalo, sincroniza en un hilo aparte. Nunca bloquea."""
+        if self.cargado_en is None or time.monotonic() - self.cargado_en > SEGUNDOS_ENTRE_SINCRONIZACIONES:
+            self._programar_sincronizacion()
+
+    def _programar_sincronizacion(self) -> None:
+        with self._lock:
+            if self._sincronizando:
+                return
+            self._sincronizando = True
+        threading.Thread(target=self._sincronizar_en_segundo_plano, daemon=True).start()
+
+    def _sincronizar_en_segundo_plano(self) -> None:
+        try:
+            with self._lock_sincronizacion:
+                self._sincronizar()
+        except Exception as e:
+            print(f"Error sincronizando índice de búsqueda de pacientes: {e}")
+        finally:
+            self._sincronizando = False
+
+    def _sincronizar(self) -> None:
+        with conexion_pool() as conn:
+            with conn.cursor() as cursor:
+                sin_sincronizar = self.cargado_en is None or time.monotonic() - self.cargado_en > SEGUNDOS_MAXIMOS_SIN_SINCRONIZAR
+                if self._marca is None or sin_sincronizar:
+                    self._cargar_todo(cursor)
+                # Tras la carga completa, también: recoge lo escrito mientras se cargaba
+                self._aplicar_cambios(cursor)
+        self.cargado_en = time.monotonic()
+
+    @staticmethod
+    def _marca_actual(cursor) -> bytes:
+        # Las filas con ROWVERSION menor que MIN_ACTIVE_ROWVERSION() ya están confirmadas: leer hasta
+        # ahí garantiza que una transacción en curso no quede atrás de la marca
+        cursor.execute("SELECT MIN_ACTIVE_ROWVERSION()", etiqueta="pacientes.busqueda.marca")
+        return bytes(cursor.fetchone()[0])
+
+    def _cargar_todo(self, cursor) -> None:
+        inicio = time.perf_counter()
+        marca = self._marca_actual(cursor)
+        nuevo = _Indice()
+        # Los nombres se repiten mucho: cada texto distinto se separa en términos una sola vez
+        por_texto: Dict[Tuple[str, str], Tuple[Tuple[int, ...], array]] = {}
+        # En orden de id: las listas de cada término quedan ordenadas sin reordenarlas
+        cursor.execute("SELECT id_paciente, nombre, apellido FROM Pacientes ORDER BY id_paciente", etiqueta="pacientes.busqueda.carga")
+        cantidad = 0
+        while True:
+            bloque = cursor.fetchmany(5000)
+            if not bloque:
+                break
+            for id_paciente, nombre, apellido in bloque:
+                clave = (nombre, apellido)
+                ids = por_texto.get(clave)
+                if ids is None:
+                    if len(por_texto) >= 200_000:
+                        por_texto.clear()
+                    ids_terminos = nuevo.ids_terminos(nombre, apellido)
+                    ids = por_texto[clave] = (ids_terminos, nuevo.ranuras_de(ids_terminos))
+                nuevo.cargar(id_paciente, *ids)
+            cantidad += len(bloque)
+        nuevo.terminar_carga()
+        with self._lock:
+            self._indice = nuevo
+            self._marca = marca
+        print(f"Índice de búsqueda de pacientes: {cantidad} pacientes cargados en {time.perf_counter() - inicio:.1f} s")
+
+    def _aplicar_cambios(self, cursor) -> None:
+        desde = self._marca
+        hasta = self._marca_actual(cursor)
+        if hasta <= desde:
+            return
+        cursor.execute(
+            "SELECT id_paciente, nombre, apellido FROM Pacientes WHERE cambio >= ? AND cambio < ?",
+            desde, hasta, etiqueta="pacientes.busqueda.cambios",
+        )
+        while True:
+            bloque = cursor.fetchmany(5000)
+            if not bloque:
+                break
+            # En bloques: las búsquedas no esperan a que termine una importación grande
+            with self._lock:
+                indice = self._indice
+                for id_paciente, nombre, apellido in bloque:
+                    indice.poner(id_paciente, indice.ids_terminos(nombre, apellido))
+        cursor.execute(
+            "SELECT id_paciente FROM PacientesEliminados WHERE cambio >= ? AND cambio < ?",
+            desde, hasta, etiqueta="pacientes.busqueda.eliminados",
+        )
+        eliminados = [fila[0] for fila in cursor.fetchall()]
+        with self._lock:
+            for id_paciente in eliminados:
+                self._indice.poner(id_paciente, ())
+            self._marca = hasta
+
+    # --- Consulta ---
+
+    def buscar_nombres(
+        self, terminos_consulta: List[str], limite: int, candidatos: Optional[Dict[int, float]] = None,
+    ) -> Tuple[List[Tuple[float, int]], int, bool]:
+        """
+        Pacientes cuyos términos calzan (exacto, por prefijo o aproximado) con todos los términos de
+        la consulta; `candidatos` restringe a esos ids y suma su puntaje (coincidencias por RUT/ficha).
+        Devuelve ([(puntaje, id)] de mayor a menor, total, si el total es estimado).
+        """
+        if self.cargado_en is None and self._marca is None:
+            raise IndiceNoCargado()
+        with self._lock:
+            indice = self._indice
+            por_termino = []
+            for termino in terminos_consulta:
+                coincidencias = indice.coincidencias(termino)
+                if not coincidencias:
+                    return [], 0, False
+                por_termino.append((coincidencias, indice.total_pacientes(coincidencias)))
+            # El término con menos pacientes primero: la intersección se achica antes
+            por_termino.sort(key=itemgetter(1))
+
+            puntajes: Optional[Dict[int, float]] = dict(candidatos) if candidatos is not None else None
+            corte = None
+            proporcion = 1.0
+            if puntajes is None and por_termino[0][1] > MAX_POSTINGS_POR_TERMINO:
+                # Con ids repartidos parejo, hasta `corte` hay ~MAX_POSTINGS_POR_TERMINO del primer término;
+                # la proporción real de ese término bajo el corte da la escala del total
+                corte = len(indice.ranuras) // TERMINOS_POR_PACIENTE * MAX_POSTINGS_POR_TERMINO // por_termino[0][1]
+                puntajes, recorridos = indice.pacientes(por_termino[0][0], corte)
+                if recorridos:
+                    proporcion = recorridos / por_termino[0][1]
+                    por_termino = por_termino[1:]
+                else:
+                    puntajes, corte = None, None
+            for coincidencias, estimado in por_termino:
+                if puntajes is not None and len(puntajes) * TERMINOS_POR_PACIENTE < estimado * proporcion:
+                    # Pocos candidatos: se revisan sus términos en vez de recorrer los del término
+                    filtrados = {}
+                    for id_paciente, puntaje in puntajes.items():
+                        mejor = max((coincidencias.get(t, 0.0) for t in indice.terminos_paciente(id_paciente)), default=0.0)
+                        if mejor:
+                            filtrados[id_paciente] = puntaje + mejor
+                    puntajes = filtrados
+                else:
+                    del_termino, _ = indice.pacientes(coincidencias, corte)
+                    if puntajes is None:
+                        puntajes = del_termino
+                    else:
+                        puntajes = {i: puntajes[i] + del_termino[i] for i in puntajes.keys() & del_termino.keys()}
+                if not puntajes:
+                    # Con corte, puede haber coincidencias entre los ids que no se recorrieron
+                    return [], 0, corte is not None
+
+        mejores = heapq.nlargest(limite, puntajes.items(), key=itemgetter(1))
+        return [(puntaje, id_paciente) for id_paciente, puntaje in mejores], round(len(puntajes) / proporcion), corte is not None
+
+
+indice_pacientes = IndicePacientes()
+
+
+def _candidatos_rut_ficha(cursor, termino: str) -> Tuple[Dict[int, float], bool]:
+    """Pacientes cuyo RUT o número de ficha empieza con el término (índices de sql/028 y sql/029)."""
+    clave = termino.upper()
+    cursor.execute(
+        """
+        SELECT id_paciente, exacto FROM (
+            SELECT TOP (?) id_paciente, CASE WHEN rut_normalizado = ? THEN 1 ELSE 0 END AS exacto
+            FROM Pacientes WHERE rut_normalizado LIKE ?
+        ) AS por_rut
+        UNION ALL
+        SELECT id_paciente, exacto FROM (
+            SELECT TOP (?) id_paciente, CASE WHEN ficha_normalizada = ? THEN 1 ELSE 0 END AS exacto
+            FROM Pacientes WHERE ficha_normalizada LIKE ?
+        ) AS por_ficha
+        """,
+        MAX_COINCIDENCIAS_BD, clave, clave + "%", MAX_COINCIDENCIAS_BD, clave, clave + "%",
+        etiqueta="pacientes.busqueda.rut_ficha",
+    )
+    filas = cursor.fetchall()
+    candidatos: Dict[int, float] = {}
+    for id_paciente, exacto in filas:
+        puntaje = PUNTAJE_EXACTO if exacto else PUNTAJE_PREFIJO
+        if puntaje > candidatos.get(id_paciente, 0.0):
+            candidatos[id_paciente] = puntaje
+    # Los términos solo tienen [0-9a-z]: no hay comodines de LIKE que escapar
+    return candidatos, len(filas) >= MAX_COINCIDENCIAS_BD
+
+
+def buscar(cursor, consulta: str, limite: int) -> Tuple[List[Tuple[float, tuple]], int, bool]:
+    """
+    Devuelve ([(puntaje, (id, nombre, apellido, rut, numero_ficha))], total, total_aproximado).
+    Cada término de la consulta debe calzar con algún término del paciente; el puntaje es la suma.
+    Lanza IndiceNoCargado si hay términos de nombre y el índice aún no se carga.
+    """
+    terminos_consulta = list(dict.fromkeys(terminos(consulta)))
+    if not terminos_consulta:
+        return [], 0, False
+    indice_pacientes.sincronizar_si_corresponde()
+
+    candidatos: Optional[Dict[int, float]] = None
+    aproximado = False
+    for termino in (t for t in terminos_consulta if not t.isalpha()):
+        encontrados, truncado = _candidatos_rut_ficha(cursor, termino)
+        aproximado = aproximado or truncado
+        if candidatos is None:
+            candidatos = encontrados
+        else:
+            candidatos = {i: candidatos[i] + p for i, p in encontrados.items() if i in candidatos}
+        if not candidatos:
+            return [], 0, False
+
+    nombres = [t for t in terminos_consulta if t.isalpha()]
+    if nombres:
+        mejores, total, estimado = indice_pacientes.buscar_nombres(nombres, limite, candidatos)
+        aproximado = aproximado or estimado
+    else:
+        mejores = sorted(((p, i) for i, p in candidatos.items()), key=lambda par: (-par[0], par[1]))[:limite]
+        total = len(candidatos)
+    if not mejores:
+        return [], total, aproximado
+
+    ids = [i for _, i in mejores]
+    cursor.execute(
+        f"SELECT id_paciente, nombre, apellido, rut, numero_ficha FROM Pacientes WHERE id_paciente IN ({', '.join('?' * len(ids))})",
+        *ids, etiqueta="pacientes.busqueda.resultados",
+    )
+    filas = {fila[0]: tuple(fila) for fila in cursor.fetchall()}
+    # Un paciente borrado en otro worker puede seguir en el índice hasta la próxima sincronización
+    return [(puntaje, filas[i]) for puntaje, i in mejores if i in filas], total, aproximado
@@ -0,0 +1,233 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.tiempos import FASE_MAPEO, medido
+from app.database import abrir_conexion
+from app.schemas.limpieza_schema import TareaLimpieza
+
+# Cada cuánto se reconstruye la cola desde la BD (tareas creadas/tomadas en otros workers y
+# cirugías reprogramadas o canceladas que cambian la prioridad)
+SEGUNDOS_ENTRE_RECARGAS = 60
+
+ESTADO_PENDIENTE = "Pendiente"
+ESTADO_EN_PROGRESO = "En Progreso"
+ESTADO_COMPLETADA = "Completada"
+# Estados de cirugía que todavía van a ocupar el quirófano
+ESTADOS_CIRUGIA_AGENDADA = ("Programada", "Confirmada")
+
+COLUMNAS_TAREA = """id_tarea_limpieza, nombre_quirofano, id_cirugia, asignada_a, estado_tarea, ocupado_hasta,
+                   solicitada_dt, asignada_dt, completada_dt, notas_tarea"""
+
+QUERY_TAREAS_EN_COLA = f"""
+    SELECT {COLUMNAS_TAREA}
+    FROM TareasLimpieza
+    WHERE estado_tarea = '{ESTADO_PENDIENTE}' AND asignada_a IS NULL
+"""
+QUERY_PROXIMAS_CIRUGIAS = f"""
+    SELECT nombre_quirofano, MIN(fecha_hora_inicio_programada)
+    FROM Cirugias
+    WHERE fecha_hora_inicio_programada >= ?
+      AND estado_cirugia IN ({", ".join(f"'{e}'" for e in ESTADOS_CIRUGIA_AGENDADA)})
+      AND nombre_quirofano IS NOT NULL
+    GROUP BY nombre_quirofano
+"""
+# Encola la limpieza de una cirugía recién finalizada. Idempotente: si la cirugía ya tiene tarea
+# (índice único UX_TareasLimpieza_id_cirugia) no inserta nada.
+QUERY_ENCOLAR_POR_CIRUGIA = f"""
+    INSERT INTO TareasLimpieza (nombre_quirofano, id_cirugia, estado_tarea, ocupado_hasta, notas_tarea)
+    OUTPUT {", ".join(f"INSERTED.{c.strip()}" for c in COLUMNAS_TAREA.split(","))}
+    SELECT c.nombre_quirofano, c.id_cirugia, '{ESTADO_PENDIENTE}', ?,
+           CONCAT('Limpieza post cirugía ', c.id_cirugia, ' (', c.tipo_cirugia, ')')
+    FROM Cirugias c
+    WHERE c.id_cirugia = ? AND c.nombre_quirofano IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM TareasLimpieza t WHERE t.id_cirugia = c.id_cirugia)
+"""
+
+_SIN_CIRUGIA = datetime.max
+_SIN_OCUPACION = datetime.min
+
+
+@medido(FASE_MAPEO)
+def fila_a_tarea(fila, columnas: List[str]) -> TareaLimpieza:
+    return TareaLimpieza(**dict(zip(columnas, fila)))
+
+
+class ColaTareasLimpieza:
+    """
+    Cola de prioridad (heap) de tareas pendientes y sin asignar.
+
+    Prioridad: primero el quirófano cuya próxima cirugía empieza antes; a igualdad, el que quedó
+    desocupado hace más tiempo (ocupado_hasta); luego el orden de llegada. Cuando cambia la próxima
+    cirugía de un quirófano se re-encolan sus tareas con una versión nueva y las entradas viejas se
+    descartan al llegar a la cima (borrado perezoso), así cada operación es O(log n).
+
+    La BD es la fuente de verdad: tomar una tarea es un UPDATE condicional en el router, y la cola
+    solo decide qué tarea intentar tomar.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._heap: List[Tuple[datetime, datetime, int, int]] = []
+        self._tareas: Dict[int, TareaLimpieza] = {}
+        self._versiones: Dict[int, int] = {}
+        self._por_quirofano: Dict[str, Set[int]] = {}
+        self._proximas_cirugias: Dict[str, datetime] = {}
+        # Cambios locales con su momento, para no perderlos si una recarga leyó la BD antes
+        self._cambios: Dict[int, Tuple[float, Optional[TareaLimpieza]]] = {}
+        self.cargado_en: Optional[float] = None
+        self._recargando = False
+
+    # --- Carga ---
+
+    def cargar_desde_bd(self) -> None:
+        inicio = time.monotonic()
+        conn = abrir_conexion()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(QUERY_TAREAS_EN_COLA)
+                columnas = [col[0] for col in cursor.description]
+                tareas = [fila_a_tarea(fila, columnas) for fila in cursor.fetchall()]
+                cursor.execute(QUERY_PROXIMAS_CIRUGIAS, datetime.utcnow())
+                proximas = {fila[0]: fila[1] for fila in cursor.fetchall()}
+        finally:
+            conn.close()
+        self.cargar(tareas, proximas, leido_en=inicio)
+
+    def cargar(self, tareas: List[TareaLimpieza], proximas_cirugias: Dict[str, datetime], leido_en: Optional[float] = None) -> None:
+        with self._lock:
+            en_cola = {tarea.id_tarea_limpieza: tarea for tarea in tareas}
+            if leido_en is not None:
+                for id_tarea, (momento, tarea) in self._cambios.items():
+                    if momento >= leido_en:
+                        if tarea is None:
+                            en_cola.pop(id_tarea, None)
+                        else:
+                            en_cola[id_tarea] = tarea
+            self._cambios = {}
+            self._proximas_cirugias = dict(proximas_cirugias)
+            self._tareas = {}
+            self._versiones = {}
+            self._por_quirofano = {}
+            self._heap = [self._registrar(tarea) for tarea in en_cola.values()]
+            heapq.heapify(self._heap)
+            self.cargado_en = time.monotonic()
+
+    def asegurar_cargado(self) -> None:
+        """Igual que el índice de pacientes: carga bloqueante la primera vez, luego recargas en segundo plano."""
+        if self.cargado_en is None:
+            with self._lock:
+                if self.cargado_en is None:
+                    self.cargar_desde_bd()
+            return
+        if time.monotonic() - self.cargado_en > SEGUNDOS_ENTRE_RECARGAS and not self._recargando:
+            self._recargando = True
+            threading.Thread(target=self._recargar_en_segundo_plano, daemon=True).start()
+
+    def _recargar_en_segundo_plano(self) -> None:
+        try:
+            self.cargar_desde_bd()
+        except Exception as e:
+            print(f"Error recargando cola de tareas de limpieza: {e}")
+        finally:
+            self._recargando = False
+
+    # --- Mantenimiento ---
+
+    def _clave(self, tarea: TareaLimpieza) -> Tuple[datetime, datetime, int]:
+        proxima = self._proximas_cirugias.get(tarea.nombre_quirofano, _SIN_CIRUGIA)
+        return proxima, tarea.ocupado_hasta or _SIN_OCUPACION, tarea.id_tarea_limpieza
+
+    def _registrar(self, tarea: TareaLimpieza) -> Tuple[datetime, datetime, int, int]:
+        """Registra la tarea con una versión nueva y devuelve su entrada para el heap."""
+        id_tarea = tarea.id_tarea_limpieza
+        version = self._versiones.get(id_tarea, 0) + 1
+        self._versiones[id_tarea] = version
+        self._tareas[id_tarea] = tarea
+        self._por_quirofano.setdefault(tarea.nombre_quirofano, set()).add(id_tarea)
+        proxima, ocupado_hasta, _ = self._clave(tarea)
+        return proxima, ocupado_hasta, id_tarea, version
+
+    def _empujar(self, tarea: TareaLimpieza) -> None:
+        heapq.heappush(self._heap, self._registrar(tarea))
+        # Las entradas obsoletas se acumulan con los cambios de prioridad; se compacta de vez en cuando
+        if len(self._heap) > 2 * len(self._tareas) + 64:
+            self._heap = [e for e in self._heap if self._vigente(e)]
+            heapq.heapify(self._heap)
+
+    def _vigente(self, entrada: Tuple[datetime, datetime, int, int]) -> bool:
+        return self._versiones.get(entrada[2]) == entrada[3] and entrada[2] in self._tareas
+
+    def agregar(self, tarea: TareaLimpieza) -> None:
+        """Encola una tarea ya guardada en la BD. Las que no están pendientes o ya tienen responsable se ignoran."""
+        if tarea.estado_tarea != ESTADO_PENDIENTE or tarea.asignada_a is not None:
+            self.quitar(tarea.id_tarea_limpieza)
+            return
+        with self._lock:
+            self._cambios[tarea.id_tarea_limpieza] = (time.monotonic(), tarea)
+            if self.cargado_en is not None:
+                self._empujar(tarea)
+
+    def quitar(self, id_tarea: int) -> None:
+        """Saca una tarea de la cola (tomada, completada o eliminada). Su entrada en el heap queda obsoleta."""
+        with self._lock:
+            self._cambios[id_tarea] = (time.monotonic(), None)
+            tarea = self._tareas.pop(id_tarea, None)
+            if tarea is not None:
+                ids = self._por_quirofano.get(tarea.nombre_quirofano)
+                if ids is not None:
+                    ids.discard(id_tarea)
+
+    def registrar_cirugia(self, nombre_quirofano: Optional[str], inicio: Optional[datetime], estado_cirugia: Optional[str]) -> None:
+        """
+        Informa una cirugía creada o reprogramada. Si adelanta la próxima cirugía del quirófano, sus
+        tareas suben de prioridad de inmediato; los demás cambios (cancelaciones, postergaciones)
+        se recogen en la siguiente recarga.
+        """
+        if not nombre_quirofano or inicio is None or estado_cirugia not in ESTADOS_CIRUGIA_AGENDADA:
+            return
+        if inicio < datetime.utcnow():
+            return
+        with self._lock:
+            actual = self._proximas_cirugias.get(nombre_quirofano)
+            if actual is not None and actual <= inicio:
+                return
+            self._proximas_cirugias[nombre_quirofano] = inicio
+            for id_tarea in list(self._por_quirofano.get(nombre_quirofano, ())):
+                self._empujar(self._tareas[id_tarea])
+
+    # --- Consulta ---
+
+    def siguiente(self) -> Optional[TareaLimpieza]:
+        """La tarea de mayor prioridad, sin sacarla de la cola. O(log n) amortizado."""
+        self.asegurar_cargado()
+        with self._lock:
+            while self._heap and not self._vigente(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return self._con_prioridad(self._tareas[self._heap[0][2]])
+
+    def _con_prioridad(self, tarea: TareaLimpieza) -> TareaLimpieza:
+        return tarea.copy(update={"proxima_cirugia_dt": self._proximas_cirugias.get(tarea.nombre_quirofano)})
+
+    def __len__(self) -> int:
+        return len(self._tareas)
+
+
+def encolar_tarea_por_cirugia(cursor, id_cirugia: int, ocupado_hasta: datetime) -> Optional[TareaLimpieza]:
+    """
+    Inserta la tarea de limpieza de una cirugía finalizada usando el cursor (y la transacción) de quien llama.
+    Devuelve la tarea creada, o None si la cirugía ya tenía una o no tiene quirófano.
+    Tras el commit, quien llama debe pasarla a cola_limpieza.agregar().
+    """
+    cursor.execute(QUERY_ENCOLAR_POR_CIRUGIA, ocupado_hasta, id_cirugia)
+    fila = cursor.fetchone()
+    if not fila:
+        return None
+    return fila_a_tarea(fila, [col[0] for col in cursor.description])
+
+
+cola_limpieza = ColaTareasLimpieza()
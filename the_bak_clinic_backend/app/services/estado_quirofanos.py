@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.compresion import CuerpoPrecomprimido
+from app.database import abrir_conexion
+from app.schemas.limpieza_schema import EstadoQuirofanoListResponse, EstadoQuirofanoPublic
+
+# Quirófanos que el panel de limpieza siempre muestra, aunque aún no tengan fila en EstadoLimpiezaQuirofanos
+LISTA_QUIROFANOS_SISTEMA = ["Pabellón 1", "Pabellón 2", "Pabellón 3", "Pabellón Central", "Pabellón Urgencias"]
+
+# Cada cuánto se relee la tabla para recoger cambios hechos por otros workers o directo en la BD
+SEGUNDOS_RECONCILIACION = float(os.getenv("ESTADOS_QUIROFANOS_SEGUNDOS_RECONCILIACION", "30"))
+
+QUERY_ESTADOS = """
+    SELECT nombre_quirofano, estado_limpieza, ultima_vez_ocupado_hasta,
+           ultima_limpieza_realizada_dt, notas_limpieza
+    FROM EstadoLimpiezaQuirofanos
+"""
+
+
+class RegistroEstadosQuirofanos:
+    """
+    Estado de limpieza de los quirófanos en memoria. La tabla tiene pocas filas, así que se
+    mantiene completa en el proceso:
+    - Se carga al iniciar la API y las lecturas no tocan la BD.
+    - Las escrituras de la API la actualizan después del commit (write-through).
+    - Un hilo la reconcilia con la BD cada SEGUNDOS_RECONCILIACION.
+    El listado se arma una vez por cambio, no en cada request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estados: Dict[str, EstadoQuirofanoPublic] = {}
+        self._listado: Optional[EstadoQuirofanoListResponse] = None
+        # El listado serializado (y comprimido a pedido) junto al listado del que salió
+        self._cuerpo_listado: Optional[Tuple[EstadoQuirofanoListResponse, CuerpoPrecomprimido]] = None
+        # Momento de la última escritura local por quirófano, para que una recarga leída antes
+        # de esa escritura no la pise con datos viejos
+        self._escrito_en: Dict[str, float] = {}
+        self.cargado_en: Optional[float] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # --- Carga y reconciliación ---
+
+    def cargar_desde_bd(self) -> None:
+        inicio = time.monotonic()
+        conn = abrir_conexion()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(QUERY_ESTADOS)
+                columnas = [col[0] for col in cursor.description]
+                filas = cursor.fetchall()
+        finally:
+            conn.close()
+
+        estados = []
+        for fila in filas:
+            try:
+                estados.append(EstadoQuirofanoPublic(**dict(zip(columnas, fila))))
+            except Exception as e:
+                print(f"Error convirtiendo fila de EstadoLimpiezaQuirofanos: {e}. Data: {tuple(fila)}")
+        self.reemplazar(estados, leido_en=inicio)
+
+    def reemplazar(self, estados: Iterable[EstadoQuirofanoPublic], leido_en: Optional[float] = None) -> None:
+        """Reemplaza el registro completo, conservando lo escrito localmente después de `leido_en`."""
+        nuevos = {estado.nombre_quirofano: estado for estado in estados}
+        with self._lock:
+            if leido_en is not None:
+                for nombre, escrito_en in self._escrito_en.items():
+                    if escrito_en >= leido_en and nombre in self._estados:
+                        nuevos[nombre] = self._estados[nombre]
+            self._escrito_en = {}
+            self._estados = nuevos
+            self._listado = None
+            self.cargado_en = time.monotonic()
+
+    def asegurar_cargado(self) -> None:
+        """Carga bloqueante solo si la carga de inicio falló (p. ej. BD no disponible al arrancar)."""
+        if self.cargado_en is None:
+            self.cargar_desde_bd()
+
+    def iniciar_reconciliacion(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._reconciliar, name="reconciliacion-quirofanos", daemon=True)
+            self._hilo.start()
+
+    def detener_reconciliacion(self) -> None:
+        self._detener.set()
+
+    def _reconciliar(self) -> None:
+        while not self._detener.wait(SEGUNDOS_RECONCILIACION):
+            try:
+                self.cargar_desde_bd()
+            except Exception as e:
+                print(f"Error reconciliando estados de quirófanos con la BD: {e}")
+
+    # --- Escritura ---
+
+    def actualizar(self, estado: EstadoQuirofanoPublic) -> None:
+        """Registra el estado ya confirmado en la BD por una escritura de la API."""
+        with self._lock:
+            self._estados[estado.nombre_quirofano] = estado
+            self._escrito_en[estado.nombre_quirofano] = time.monotonic()
+            self._listado = None
+
+    # --- Lectura ---
+
+    def obtener(self, nombre_quirofano: str) -> Optional[EstadoQuirofanoPublic]:
+        self.asegurar_cargado()
+        return self._estados.get(nombre_quirofano)
+
+    def listar(self) -> EstadoQuirofanoListResponse:
+        """Todos los quirófanos registrados más los de LISTA_QUIROFANOS_SISTEMA sin registro, por nombre."""
+        self.asegurar_cargado()
+        listado = self._listado
+        if listado is not None:
+            return listado
+        with self._lock:
+            if self._listado is None:
+                quirofanos = list(self._estados.values())
+                for nombre in LISTA_QUIROFANOS_SISTEMA:
+                    if nombre not in self._estados:
+                        quirofanos.append(EstadoQuirofanoPublic(
+                            nombre_quirofano=nombre,
+                            estado_limpieza="Desconocido",
+                            notas_limpieza="Registro no encontrado en BD, estado por defecto.",
+                        ))
+                quirofanos.sort(key=lambda q: q.nombre_quirofano)
+                self._listado = EstadoQuirofanoListResponse(quirofanos=quirofanos, total=len(quirofanos))
+            return self._listado
+
+    def listar_json(self) -> CuerpoPrecomprimido:
+        """El listado ya serializado; se rehace solo cuando cambia el listado."""
+        listado = self.listar()
+        cuerpo = self._cuerpo_listado
+        if cuerpo is None or cuerpo[0] is not listado:
+            cuerpo = self._cuerpo_listado = (listado, CuerpoPrecomprimido.desde_modelo(listado))
+        return cuerpo[1]
+
+    def con_estado(self, estado_limpieza: str) -> List[EstadoQuirofanoPublic]:
+        """Quirófanos registrados en `estado_limpieza`, del ocupado hace más tiempo al más reciente."""
+        self.asegurar_cargado()
+        encontrados = [e for e in self._estados.values() if e.estado_limpieza == estado_limpieza]
+        encontrados.sort(key=lambda e: (e.ultima_vez_ocupado_hasta is not None, e.ultima_vez_ocupado_hasta or 0))
+        return encontrados
+
+
+registro_quirofanos = RegistroEstadosQuirofanos()
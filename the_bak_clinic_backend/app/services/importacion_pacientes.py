@@ -0,0 +1,217 @@
+import csv
+import io
+import os
+import threading
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pyodbc
+from pydantic import ValidationError
+
+from app.database import abrir_conexion
+from app.services.busqueda_pacientes import indice_pacientes
+from app.schemas.paciente_schema import PacienteCreate, ImportacionPacientesEstado, ImportacionErrorFila
+
+# Filas que se validan y se envían a la BD juntas. Cada fila usa len(COLUMNAS_IMPORTACION) parámetros
+# y SQL Server admite como máximo 2100 por sentencia.
+TAMANO_BLOQUE_IMPORTACION = 200
+MAX_ERRORES_REPORTADOS = 1000
+MAX_TRABAJOS_EN_MEMORIA = 50
+
+COLUMNAS_IMPORTACION = (
+    "nombre", "apellido", "rut", "fecha_nacimiento", "telefono",
+    "email", "direccion", "prevision", "numero_ficha",
+)
+
+_trabajos: Dict[str, ImportacionPacientesEstado] = {}
+_trabajos_lock = threading.Lock()
+
+
+def registrar_trabajo(nombre_archivo: Optional[str]) -> ImportacionPacientesEstado:
+    trabajo = ImportacionPacientesEstado(id_trabajo=uuid.uuid4().hex, nombre_archivo=nombre_archivo)
+    with _trabajos_lock:
+        _trabajos[trabajo.id_trabajo] = trabajo
+        # Se descartan los trabajos más antiguos para que el registro no crezca sin límite
+        while len(_trabajos) > MAX_TRABAJOS_EN_MEMORIA:
+            _trabajos.pop(next(iter(_trabajos)))
+    return trabajo
+
+
+def obtener_trabajo(id_trabajo: str) -> Optional[ImportacionPacientesEstado]:
+    with _trabajos_lock:
+        return _trabajos.get(id_trabajo)
+
+
+@lru_cache(maxsize=4)
+def sentencia_merge_pacientes(cantidad_filas: int) -> str:
+    """
+    MERGE que inserta pacientes nuevos y actualiza los existentes en una sola sentencia.
+    El cruce es por rut_normalizado (índice único), así que también calza con RUT antiguos guardados con puntos.
+    """
+    fila_valores = "(" + ", ".join(["?"] * len(COLUMNAS_IMPORTACION)) + ")"
+    columnas = ", ".join(COLUMNAS_IMPORTACION)
+    # La importación cuenta como edición: sube la versión (concurrencia optimista de PUT /pacientes)
+    set_update = ", ".join(f"destino.{col} = origen.{col}" for col in COLUMNAS_IMPORTACION) + ", destino.version = destino.version + 1"
+    return f"""
+        MERGE INTO Pacientes WITH (HOLDLOCK) AS destino
+        USING (VALUES {", ".join([fila_valores] * cantidad_filas)}) AS origen ({columnas})
+        ON destino.rut_normalizado = REPLACE(origen.rut, '-', '')
+        WHEN MATCHED THEN
+            UPDATE SET {set_update}
+        WHEN NOT MATCHED THEN
+            INSERT ({columnas}, fecha_registro)
+            VALUES ({", ".join(f"origen.{col}" for col in COLUMNAS_IMPORTACION)}, GETUTCDATE())
+        OUTPUT $action;
+    """
+
+
+def _leer_filas_csv(ruta: str) -> Iterator[Dict[str, str]]:
+    with open(ruta, "rb") as archivo_binario:
+        texto = io.TextIOWrapper(archivo_binario, encoding="utf-8-sig", newline="")
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        for fila in csv.DictReader(texto, dialect=dialecto):
+            yield fila
+
+
+def _leer_filas_excel(ruta: str) -> Iterator[Dict[str, object]]:
+    import openpyxl  # Dependencia opcional, solo necesaria para archivos .xlsx
+
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = [str(h).strip() if h is not None else "" for h in next(filas, [])]
+        for fila in filas:
+            yield dict(zip(encabezados, fila))
+    finally:
+        libro.close()
+
+
+def leer_filas(ruta: str, nombre_archivo: str) -> Iterator[Dict[str, object]]:
+    """Itera el archivo fila a fila sin cargarlo completo en memoria."""
+    if nombre_archivo.lower().endswith((".xlsx", ".xlsm")):
+        return _leer_filas_excel(ruta)
+    return _leer_filas_csv(ruta)
+
+
+def _limpiar_fila(fila: Dict[str, object]) -> Dict[str, object]:
+    """Normaliza encabezados (minúsculas, sin espacios) y convierte celdas vacías en None."""
+    limpia = {}
+    for clave, valor in fila.items():
+        if clave is None:
+            continue
+        clave_normalizada = str(clave).strip().lower().replace(" ", "_")
+        if isinstance(valor, str):
+            valor = valor.strip() or None
+        limpia[clave_normalizada] = valor
+    return limpia
+
+
+def _validar_bloque(
+    bloque: List[Tuple[int, Dict[str, object]]],
+    ruts_vistos: set,
+    trabajo: ImportacionPacientesEstado,
+) -> List[tuple]:
+    """
+    Valida un bloque con las reglas de PacienteCreate (que además normaliza el RUT y revisa
+    su dígito verificador) y descarta RUT repetidos dentro del archivo.
+    """
+    filas_validas = []
+    for numero_fila, fila in bloque:
+        datos = _limpiar_fila(fila)
+        if datos.get("rut") is not None:
+            datos["rut"] = str(datos["rut"])
+        try:
+            paciente = PacienteCreate(**datos)
+        except ValidationError as e:
+            primer_error = e.errors()[0]
+            campo = ".".join(str(parte) for parte in primer_error.get("loc", ()))
+            _registrar_error(trabajo, numero_fila, datos.get("rut"), f"{campo}: {primer_error.get('msg')}")
+            continue
+
+        if paciente.rut in ruts_vistos:
+            _registrar_error(trabajo, numero_fila, paciente.rut, "RUT repetido dentro del archivo; se conserva la primera aparición.")
+            continue
+        ruts_vistos.add(paciente.rut)
+        filas_validas.append(tuple(getattr(paciente, col) for col in COLUMNAS_IMPORTACION))
+    return filas_validas
+
+
+def _registrar_error(trabajo: ImportacionPacientesEstado, fila: int, rut: Optional[object], mensaje: str) -> None:
+    trabajo.rechazados += 1
+    if len(trabajo.errores) < MAX_ERRORES_REPORTADOS:
+        trabajo.errores.append(ImportacionErrorFila(fila=fila, rut=str(rut) if rut is not None else None, error=mensaje))
+
+
+def _guardar_bloque(cursor: pyodbc.Cursor, filas: List[tuple], trabajo: ImportacionPacientesEstado) -> None:
+    params = tuple(valor for fila in filas for valor in fila)
+    cursor.execute(sentencia_merge_pacientes(len(filas)), params)
+    for (accion,) in cursor.fetchall():
+        if accion == "INSERT":
+            trabajo.insertados += 1
+        else:
+            trabajo.actualizados += 1
+
+
+def ejecutar_importacion(trabajo: ImportacionPacientesEstado, ruta: str) -> None:
+    """
+    Procesa el archivo en bloques de TAMANO_BLOQUE_IMPORTACION filas: valida, descarta duplicados y
+    hace upsert de cada bloque con un MERGE. Cada bloque se confirma por separado para que un error
+    tardío no deshaga lo ya importado y el progreso sea visible mientras avanza.
+    Pensada para ejecutarse como tarea en segundo plano; borra el archivo temporal al terminar.
+    """
+    trabajo.estado = "Procesando"
+    trabajo.iniciada = datetime.utcnow()
+    ruts_vistos: set = set()
+    conn = None
+    try:
+        conn = abrir_conexion()
+        with conn.cursor() as cursor:
+            bloque: List[Tuple[int, Dict[str, object]]] = []
+            for numero_fila, fila in enumerate(leer_filas(ruta, trabajo.nombre_archivo or ""), start=1):
+                bloque.append((numero_fila, fila))
+                if len(bloque) >= TAMANO_BLOQUE_IMPORTACION:
+                    _procesar_bloque(conn, cursor, bloque, ruts_vistos, trabajo)
+                    bloque = []
+            if bloque:
+                _procesar_bloque(conn, cursor, bloque, ruts_vistos, trabajo)
+        trabajo.estado = "Completada"
+    except Exception as e:
+        print(f"Error en importación de pacientes {trabajo.id_trabajo}: {e}")
+        trabajo.estado = "Fallida"
+        trabajo.detalle = str(e)[:200]
+    finally:
+        trabajo.finalizada = datetime.utcnow()
+        # El MERGE no devuelve los ids afectados; el índice de búsqueda trae los cambios por su marca de agua
+        if trabajo.insertados or trabajo.actualizados:
+            indice_pacientes.invalidar()
+        if conn:
+            conn.close()
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def _procesar_bloque(conn, cursor, bloque, ruts_vistos, trabajo) -> None:
+    filas_validas = _validar_bloque(bloque, ruts_vistos, trabajo)
+    if filas_validas:
+        try:
+            _guardar_bloque(cursor, filas_validas, trabajo)
+            conn.commit()
+        except pyodbc.IntegrityError as e:
+            # Un conflicto (p. ej. otra restricción única) rechaza solo este bloque y la importación sigue
+            conn.rollback()
+            primera_fila = bloque[0][0]
+            trabajo.rechazados += len(filas_validas) - 1
+            _registrar_error(trabajo, primera_fila, None, f"Bloque de filas {primera_fila}-{bloque[-1][0]} rechazado por conflicto de datos: {str(e)[:100]}")
+        except pyodbc.Error:
+            conn.rollback()
+            raise
+    trabajo.filas_procesadas += len(bloque)
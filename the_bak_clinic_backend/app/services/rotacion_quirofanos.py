@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.eventos import suscribir
+from app.database import abrir_conexion
+from app.schemas.limpieza_schema import EstadoQuirofanoPublic
+from app.schemas.reporte_schema import EstadisticaRotacion, PrediccionRotacion
+from app.services.cola_limpieza import cola_limpieza, encolar_tarea_por_cirugia
+from app.services.estado_quirofanos import registro_quirofanos
+
+# Rotación de quirófanos (desocupado -> limpio):
+# - Suscriptores: cuando una cirugía pasa a "Realizada", el quirófano queda "Limpieza Pendiente" y se
+#   encola su tarea de limpieza. Se ejecutan en el procesador de eventos, fuera del request de
+#   update_cirugia. Este módulo se importa en main para registrarlos.
+# - Historial (HistorialLimpiezaQuirofanos), estadísticas para /reportes/turnover y el predictor que
+#   consultan los endpoints de agenda.
+
+EVENTO_CIRUGIA_REALIZADA = "cirugia_realizada"
+
+# Idempotente: solo marca el quirófano si el evento es más reciente que la última ocupación y que
+# la última limpieza registradas, así un reintento o un evento atrasado no revierte una limpieza.
+QUERY_MARCAR_LIMPIEZA_PENDIENTE = """
+    MERGE INTO EstadoLimpiezaQuirofanos WITH (HOLDLOCK) AS destino
+    USING (
+        SELECT nombre_quirofano, CAST(? AS DATETIME2) AS finalizada_dt
+        FROM Cirugias WHERE id_cirugia = ? AND nombre_quirofano IS NOT NULL
+    ) AS origen
+    ON destino.nombre_quirofano = origen.nombre_quirofano
+    WHEN MATCHED
+        AND (destino.ultima_vez_ocupado_hasta IS NULL OR destino.ultima_vez_ocupado_hasta < origen.finalizada_dt)
+        AND (destino.ultima_limpieza_realizada_dt IS NULL OR destino.ultima_limpieza_realizada_dt < origen.finalizada_dt) THEN
+        UPDATE SET estado_limpieza = 'Limpieza Pendiente', ultima_vez_ocupado_hasta = origen.finalizada_dt
+    WHEN NOT MATCHED THEN
+        INSERT (nombre_quirofano, estado_limpieza, ultima_vez_ocupado_hasta)
+        VALUES (origen.nombre_quirofano, 'Limpieza Pendiente', origen.finalizada_dt)
+    OUTPUT INSERTED.nombre_quirofano, INSERTED.estado_limpieza, INSERTED.ultima_vez_ocupado_hasta,
+           INSERTED.ultima_limpieza_realizada_dt, INSERTED.notas_limpieza;
+"""
+
+
+@suscribir(EVENTO_CIRUGIA_REALIZADA, nombre="marcar_quirofano_pendiente")
+def marcar_quirofano_pendiente(cursor, datos: Dict[str, Any]) -> Optional[Callable[[], None]]:
+    cursor.execute(QUERY_MARCAR_LIMPIEZA_PENDIENTE, datetime.fromisoformat(datos["finalizada_dt"]), datos["id_cirugia"])
+    fila = cursor.fetchone()
+    if not fila:
+        return None  # Sin quirófano, o el quirófano ya registra algo posterior
+    estado = EstadoQuirofanoPublic(**dict(zip([col[0] for col in cursor.description], fila)))
+    return lambda: registro_quirofanos.actualizar(estado)
+
+
+@suscribir(EVENTO_CIRUGIA_REALIZADA, nombre="encolar_tarea_limpieza")
+def encolar_tarea_limpieza(cursor, datos: Dict[str, Any]) -> Optional[Callable[[], None]]:
+    tarea = encolar_tarea_por_cirugia(cursor, datos["id_cirugia"], datetime.fromisoformat(datos["finalizada_dt"]))
+    if tarea is None:
+        return None  # Ya existía (reintento) o la cirugía no tiene quirófano
+    return lambda: cola_limpieza.agregar(tarea)
+
+
+# --- Historial ---
+
+def registrar_rotaciones(cursor, estados: Iterable[EstadoQuirofanoPublic]) -> None:
+    """
+    Agrega al historial las rotaciones cerradas por una limpieza recién registrada, en la transacción
+    de quien llama. Una sola sentencia para todos los quirófanos; las ocupaciones ya registradas se omiten.
+    """
+    filas = [
+        (e.nombre_quirofano, e.ultima_vez_ocupado_hasta, e.ultima_limpieza_realizada_dt)
+        for e in estados
+        if e.ultima_vez_ocupado_hasta is not None and e.ultima_limpieza_realizada_dt is not None
+        and e.ultima_limpieza_realizada_dt >= e.ultima_vez_ocupado_hasta
+    ]
+    if not filas:
+        return
+    valores = ", ".join(["(?, ?, ?)"] * len(filas))
+    cursor.execute(f"""
+        INSERT INTO HistorialLimpiezaQuirofanos (nombre_quirofano, ocupado_hasta, limpieza_realizada_dt)
+        SELECT v.nombre_quirofano, v.ocupado_hasta, v.limpieza_realizada_dt
+        FROM (VALUES {valores}) AS v (nombre_quirofano, ocupado_hasta, limpieza_realizada_dt)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM HistorialLimpiezaQuirofanos h
+            WHERE h.nombre_quirofano = v.nombre_quirofano AND h.ocupado_hasta = v.ocupado_hasta
+        )
+    """, [valor for fila in filas for valor in fila])
+
+
+# --- Estadísticas ---
+
+# Las franjas (día y hora) se calculan en hora local; en la BD las fechas están en UTC
+try:
+    from zoneinfo import ZoneInfo
+    ZONA_HORARIA_CLINICA = ZoneInfo(os.getenv("ZONA_HORARIA_CLINICA", "America/Santiago"))
+except Exception:  # Sin base de zonas horarias (ej. Windows sin tzdata)
+    ZONA_HORARIA_CLINICA = timezone.utc
+
+# Rotaciones más largas que esto son quirófanos que quedaron cerrados (noche, fin de semana), no limpiezas
+MAX_MINUTOS_ROTACION = 12 * 60
+DIAS_HISTORIAL_PREDICTOR = 90
+SEGUNDOS_ENTRE_RECARGAS_PREDICTOR = 15 * 60
+MIN_MUESTRAS_PREDICCION = 5
+MINUTOS_ROTACION_POR_DEFECTO = float(os.getenv("MINUTOS_ROTACION_POR_DEFECTO", "30"))
+
+ClaveGrupo = Tuple[Optional[str], Optional[int], Optional[int]]  # (quirófano, día de la semana, hora)
+
+
+def percentil(ordenados: List[float], fraccion: float) -> float:
+    """Percentil con interpolación lineal sobre una lista ya ordenada (igual que PERCENTILE_CONT)."""
+    posicion = fraccion * (len(ordenados) - 1)
+    inferior = int(posicion)
+    if inferior + 1 >= len(ordenados):
+        return ordenados[-1]
+    return ordenados[inferior] + (ordenados[inferior + 1] - ordenados[inferior]) * (posicion - inferior)
+
+
+def calcular_estadisticas(filas: Iterable[Tuple[str, datetime, float]]) -> Dict[ClaveGrupo, EstadisticaRotacion]:
+    """
+    Agrupa las rotaciones (quirófano, ocupado_hasta UTC, minutos) en una sola pasada por
+    (quirófano, día, hora), (quirófano, hora), (quirófano) y general, y calcula mediana y p90
+    ordenando cada grupo una vez.
+    """
+    grupos: Dict[ClaveGrupo, List[float]] = {}
+    for nombre_quirofano, ocupado_hasta, minutos in filas:
+        local = ocupado_hasta.replace(tzinfo=timezone.utc).astimezone(ZONA_HORARIA_CLINICA)
+        dia, hora = local.weekday(), local.hour
+        for clave in ((nombre_quirofano, dia, hora), (nombre_quirofano, None, hora), (nombre_quirofano, None, None), (None, None, None)):
+            duraciones = grupos.get(clave)
+            if duraciones is None:
+                grupos[clave] = [float(minutos)]
+            else:
+                duraciones.append(float(minutos))
+
+    estadisticas: Dict[ClaveGrupo, EstadisticaRotacion] = {}
+    for (nombre_quirofano, dia, hora), duraciones in grupos.items():
+        duraciones.sort()
+        estadisticas[(nombre_quirofano, dia, hora)] = EstadisticaRotacion(
+            nombre_quirofano=nombre_quirofano, dia_semana=dia, hora=hora, cantidad=len(duraciones),
+            mediana_minutos=round(percentil(duraciones, 0.5), 1), p90_minutos=round(percentil(duraciones, 0.9), 1),
+        )
+    return estadisticas
+
+
+def leer_rotaciones(cursor, desde: datetime, hasta: datetime, nombre_quirofano: Optional[str] = None) -> List[Tuple[str, datetime, float]]:
+    query = """
+        SELECT nombre_quirofano, ocupado_hasta, duracion_minutos
+        FROM HistorialLimpiezaQuirofanos
+        WHERE ocupado_hasta >= ? AND ocupado_hasta < ? AND duracion_minutos BETWEEN 0 AND ?
+    """
+    params: List[Any] = [desde, hasta, MAX_MINUTOS_ROTACION]
+    if nombre_quirofano:
+        query += " AND nombre_quirofano = ?"
+        params.append(nombre_quirofano)
+    cursor.execute(query, params)
+    filas = []
+    while True:
+        bloque = cursor.fetchmany(5000)
+        if not bloque:
+            break
+        filas.extend((fila[0], fila[1], fila[2]) for fila in bloque)
+    return filas
+
+
+class PredictorRotacion:
+    """
+    Predice la rotación de un quirófano en un momento dado a partir de los últimos
+    DIAS_HISTORIAL_PREDICTOR días. Usa el grupo más específico con al menos MIN_MUESTRAS_PREDICCION
+    rotaciones: quirófano + día + hora, quirófano + hora, quirófano, todos los quirófanos, y si no
+    hay historial, MINUTOS_ROTACION_POR_DEFECTO. Las estadísticas se recalculan en segundo plano.
+    """
+
+    def __init__(self):
+        self._estadisticas: Dict[ClaveGrupo, EstadisticaRotacion] = {}
+        self._lock = threading.Lock()
+        self.cargado_en: Optional[float] = None
+        self._recargando = False
+
+    def cargar_desde_bd(self) -> None:
+        hasta = datetime.utcnow()
+        conn = abrir_conexion()
+        try:
+            with conn.cursor() as cursor:
+                filas = leer_rotaciones(cursor, hasta - timedelta(days=DIAS_HISTORIAL_PREDICTOR), hasta)
+        finally:
+            conn.close()
+        self._estadisticas = calcular_estadisticas(filas)
+        self.cargado_en = time.monotonic()
+
+    def asegurar_cargado(self) -> None:
+        if self.cargado_en is None:
+            with self._lock:
+                if self.cargado_en is None:
+                    try:
+                        self.cargar_desde_bd()
+                    except Exception as e:
+                        # Sin historial disponible se predice con el valor por defecto; se reintenta más tarde
+                        print(f"Error cargando historial de rotaciones: {e}")
+                        self.cargado_en = time.monotonic() - SEGUNDOS_ENTRE_RECARGAS_PREDICTOR + 60
+            return
+        if time.monotonic() - self.cargado_en > SEGUNDOS_ENTRE_RECARGAS_PREDICTOR and not self._recargando:
+            self._recargando = True
+            threading.Thread(target=self._recargar_en_segundo_plano, daemon=True).start()
+
+    def _recargar_en_segundo_plano(self) -> None:
+        try:
+            self.cargar_desde_bd()
+        except Exception as e:
+            print(f"Error recargando historial de rotaciones: {e}")
+        finally:
+            self._recargando = False
+
+    def predecir(self, nombre_quirofano: str, momento: datetime) -> PrediccionRotacion:
+        """`momento`: cuándo se desocupa el quirófano (UTC, como el resto de las fechas de la BD)."""
+        self.asegurar_cargado()
+        local = momento.replace(tzinfo=timezone.utc).astimezone(ZONA_HORARIA_CLINICA) if momento.tzinfo is None else momento.astimezone(ZONA_HORARIA_CLINICA)
+        niveles = (
+            ("quirofano_dia_hora", (nombre_quirofano, local.weekday(), local.hour)),
+            ("quirofano_hora", (nombre_quirofano, None, local.hour)),
+            ("quirofano", (nombre_quirofano, None, None)),
+            ("general", (None, None, None)),
+        )
+        estadisticas = self._estadisticas
+        for nivel, clave in niveles:
+            estadistica = estadisticas.get(clave)
+            if estadistica is not None and estadistica.cantidad >= MIN_MUESTRAS_PREDICCION:
+                return PrediccionRotacion(
+                    nombre_quirofano=nombre_quirofano, mediana_minutos=estadistica.mediana_minutos,
+                    p90_minutos=estadistica.p90_minutos, muestras=estadistica.cantidad, nivel=nivel,
+                )
+        return PrediccionRotacion(
+            nombre_quirofano=nombre_quirofano, mediana_minutos=MINUTOS_ROTACION_POR_DEFECTO,
+            p90_minutos=MINUTOS_ROTACION_POR_DEFECTO, muestras=0, nivel="por_defecto",
+        )
+
+
+predictor_rotacion = PredictorRotacion()
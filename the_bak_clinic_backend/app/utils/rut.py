@@ -0,0 +1,56 @@
+import re
+from typing import Optional
+
+# Acepta RUT con o sin puntos y con o sin guion: 12.345.678-9, 12345678-9, 123456789
+_RUT_REGEX = re.compile(r"^(\d{1,2}\.?\d{3}\.?\d{3})-?([\dkK])$")
+
+
+def calcular_digito_verificador(cuerpo: str) -> str:
+    """Dígito verificador (módulo 11) para el cuerpo numérico de un RUT."""
+    suma, factor = 0, 2
+    for digito in reversed(cuerpo):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - (suma % 11)
+    if resto == 11:
+        return "0"
+    if resto == 10:
+        return "K"
+    return str(resto)
+
+
+def normalizar_rut(rut: str) -> Optional[str]:
+    """
+    Lleva un RUT a su forma canónica 'XXXXXXXX-D' (sin puntos, guion antes del dígito verificador
+    y 'K' en mayúscula). Devuelve None si el texto no tiene forma de RUT.
+    """
+    if rut is None:
+        return None
+    match = _RUT_REGEX.match(rut.strip().replace(" ", ""))
+    if not match:
+        return None
+    cuerpo = match.group(1).replace(".", "").lstrip("0") or "0"
+    return f"{cuerpo}-{match.group(2).upper()}"
+
+
+def validar_rut(rut: str) -> str:
+    """
+    Normaliza el RUT y verifica su dígito verificador.
+    Devuelve la forma canónica o lanza ValueError (apto para validadores de Pydantic).
+    """
+    canonico = normalizar_rut(rut)
+    if canonico is None:
+        raise ValueError("RUT con formato inválido")
+    cuerpo, digito = canonico.split("-")
+    if calcular_digito_verificador(cuerpo) != digito:
+        raise ValueError("RUT con dígito verificador inválido")
+    return canonico
+
+
+def rut_compacto(rut: str) -> Optional[str]:
+    """
+    Forma compacta 'XXXXXXXXD' usada por la columna calculada Pacientes.rut_normalizado.
+    Coincide con UPPER(REPLACE(REPLACE(rut, '.', ''), '-', '')) en SQL Server.
+    """
+    canonico = normalizar_rut(rut)
+    return canonico.replace("-", "") if canonico else None
@@ -0,0 +1,68 @@
+"""
+Compara GET /cirugias/ con y sin autenticación/autorización para medir su costo por request.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_autorizacion [requests]
+
+La BD se reemplaza por una conexión en memoria que devuelve una lista vacía, para que la
+diferencia entre ambas mediciones sea solo la verificación del token y el chequeo de permisos.
+"""
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.permisos import autorizar
+from app.core.tokens import crear_token_acceso
+from app.database import get_connection
+from app.main import app
+
+
+class _CursorVacio:
+    description = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, *args, **kwargs):
+        return self
+
+    def fetchone(self):
+        return (0,)
+
+    def fetchall(self):
+        return []
+
+
+class _ConexionVacia:
+    def cursor(self):
+        return _CursorVacio()
+
+
+def medir(cliente: TestClient, cantidad: int, headers: dict) -> float:
+    for _ in range(50):
+        cliente.get("/cirugias/", headers=headers)
+    inicio = time.perf_counter()
+    for _ in range(cantidad):
+        respuesta = cliente.get("/cirugias/", headers=headers)
+    assert respuesta.status_code == 200, respuesta.text
+    return (time.perf_counter() - inicio) / cantidad * 1e6
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    app.dependency_overrides[get_connection] = lambda: _ConexionVacia()
+    headers = {"Authorization": f"Bearer {crear_token_acceso(1, 'bench@clinicabak.cl', 'medico')}"}
+
+    with TestClient(app) as cliente:
+        con_auth = medir(cliente, cantidad, headers)
+        # Misma ruta con la dependencia de autorización anulada
+        app.dependency_overrides[autorizar("cirugias")] = lambda: None
+        sin_auth = medir(cliente, cantidad, {})
+
+    print(f"GET /cirugias/ sin auth: {sin_auth:8.1f} us/request")
+    print(f"GET /cirugias/ con auth: {con_auth:8.1f} us/request")
+    print(f"costo de auth + permisos: {con_auth - sin_auth:8.1f} us/request ({(con_auth - sin_auth) / sin_auth:.1%})")
@@ -0,0 +1,101 @@
+"""
+Carga, memoria y latencia del índice de nombres de GET /pacientes/buscar.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_busqueda_pacientes [pacientes]
+
+Se generan pacientes con nombres y apellidos chilenos frecuentes (más algunos poco comunes, que
+alargan el vocabulario) y se cargan con un cursor en memoria, como lo haría la carga inicial del
+worker. Se miden la carga completa, la memoria que ocupa el índice, un lote de cambios como el que
+trae una sincronización y la parte en memoria de algunas búsquedas típicas (sin el SELECT final
+de los resultados, que lee a lo más `limit` filas por clave primaria).
+"""
+import random
+import resource
+import sys
+import time
+
+from app.services import busqueda_pacientes
+from app.services.busqueda_pacientes import IndicePacientes, terminos
+
+NOMBRES = [
+    "María", "José", "Juan", "Luis", "Ana", "Carlos", "Jorge", "Rosa", "Francisco", "Carmen", "Pedro",
+    "Claudia", "Manuel", "Patricia", "Sofía", "Valentina", "Matías", "Benjamín", "Camila", "Martina",
+    "Sebastián", "Javiera", "Cristóbal", "Isidora", "Tomás", "Agustina", "Ignacio", "Florencia",
+]
+APELLIDOS = [
+    "González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez", "Sepúlveda",
+    "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres", "Araya", "Flores", "Espinoza",
+    "Valenzuela", "Castillo", "Tapia", "Reyes", "Gutiérrez", "Castro", "Pizarro", "Álvarez", "Vásquez",
+]
+CONSULTAS = ["m", "ma", "maria", "maria gonzalez", "gonzales", "valenzuela tapia", "sebastian muñoz rojas", "zzq"]
+
+
+def _nombre_poco_comun(azar: random.Random) -> str:
+    return "".join(azar.choice("bcdfglmnprstv") + azar.choice("aeiou") for _ in range(azar.randint(3, 4))).capitalize()
+
+
+def pacientes_de_prueba(cantidad: int):
+    azar = random.Random(7)
+    for id_paciente in range(1, cantidad + 1):
+        nombre = azar.choice(NOMBRES)
+        if azar.random() < 0.5:
+            nombre += " " + azar.choice(NOMBRES)
+        apellidos = [azar.choice(APELLIDOS), azar.choice(APELLIDOS)]
+        if azar.random() < 0.1:
+            apellidos[1] = _nombre_poco_comun(azar)
+        yield id_paciente, nombre, " ".join(apellidos)
+
+
+class _CursorEnMemoria:
+    def __init__(self, filas):
+        self._filas = filas
+
+    def execute(self, sql, *params, etiqueta=None):
+        self._resultado = iter([(b"\x00" * 8,)]) if "MIN_ACTIVE_ROWVERSION" in sql else self._filas
+        return self
+
+    def fetchone(self):
+        return next(self._resultado)
+
+    def fetchmany(self, cantidad):
+        return [fila for _, fila in zip(range(cantidad), self._resultado)]
+
+
+def _memoria_mb() -> float:
+    # ru_maxrss está en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    filas = list(pacientes_de_prueba(cantidad))
+    memoria_antes = _memoria_mb()
+
+    indice = IndicePacientes()
+    inicio = time.perf_counter()
+    indice._cargar_todo(_CursorEnMemoria(iter(filas)))
+    segundos_carga = time.perf_counter() - inicio
+    memoria_despues = _memoria_mb()
+    estructuras = indice._indice
+    print(f"{cantidad} pacientes: carga {segundos_carga:.1f} s, ~{memoria_despues - memoria_antes:.0f} MB, "
+          f"{len(estructuras.vocabulario)} términos")
+
+    # Lo que aplica una sincronización tras importar 5.000 pacientes
+    azar = random.Random(11)
+    cambios = [(azar.randint(1, cantidad), nombre, apellido) for _, nombre, apellido in filas[:5000]]
+    inicio = time.perf_counter()
+    for id_paciente, nombre, apellido in cambios:
+        indice.agregar(id_paciente, nombre, apellido)
+    print(f"5000 cambios aplicados en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    indice.cargado_en = time.monotonic()
+    for consulta in CONSULTAS:
+        repeticiones = 20
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            mejores, total, aproximado = indice.buscar_nombres(terminos(consulta), 20)
+        ms = (time.perf_counter() - inicio) / repeticiones * 1000
+        print(f"{consulta!r:26} {ms:7.2f} ms  total {'~' if aproximado else ''}{total}")
+
+    print(f"(hasta {busqueda_pacientes.MAX_POSTINGS_POR_TERMINO} ids recorridos por término)")
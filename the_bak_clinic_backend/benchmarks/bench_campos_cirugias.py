@@ -0,0 +1,70 @@
+"""
+Costo de armar la respuesta de GET /cirugias completa contra ?fields= para una vista de calendario.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_campos_cirugias [filas] [largo_notas]
+
+Se generan filas como las que devuelve pyodbc (notas de `largo_notas` caracteres, 800 por
+defecto) y se mide el mapeo y la serialización a JSON en Python, además del tamaño del cuerpo.
+El ahorro de lectura en la BD y de red (las notas son NVARCHAR(MAX)) se suma a esto.
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.routers.cirugias import COLUMNAS_CIRUGIA, PROYECCIONES_CIRUGIA, db_row_to_cirugia_public
+from app.schemas.cirugia_schema import CirugiaListResponse
+from app.core.proyecciones import respuesta_json
+
+CAMPOS_CALENDARIO = "nombre_quirofano,fecha_hora_inicio_programada,fecha_hora_fin_programada,tipo_cirugia,estado_cirugia"
+
+
+def filas_de_prueba(cantidad: int, largo_notas: int):
+    inicio = datetime(2026, 10, 1, 8)
+    notas = "x" * largo_notas
+    return [
+        (i, 100 + i, 7, None, f"Pabellón {i % 8}", inicio + timedelta(hours=i), 90, inicio + timedelta(hours=i, minutes=90),
+         "Colecistectomía", "Programada", notas, notas, inicio, inicio, 1)
+        for i in range(cantidad)
+    ]
+
+
+def completa(filas) -> bytes:
+    cirugias = [db_row_to_cirugia_public(fila, COLUMNAS_CIRUGIA) for fila in filas]
+    # Lo que hace FastAPI con el response_model
+    return JSONResponse(jsonable_encoder(CirugiaListResponse(cirugias=cirugias, total=len(cirugias)))).body
+
+
+def con_campos(filas) -> bytes:
+    proyeccion = PROYECCIONES_CIRUGIA.resolver(CAMPOS_CALENDARIO)
+    # El SELECT de la proyección trae solo sus columnas, en su orden
+    indices = [COLUMNAS_CIRUGIA.index(c) for c in proyeccion.columnas]
+    filas_proyectadas = [tuple(fila[i] for i in indices) for fila in filas]
+    inicio = time.perf_counter()
+    cuerpo = respuesta_json({"cirugias": proyeccion.filas(filas_proyectadas), "total": len(filas)}).body
+    return cuerpo, time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    largo_notas = int(sys.argv[2]) if len(sys.argv) > 2 else 800
+    filas = filas_de_prueba(cantidad, largo_notas)
+
+    repeticiones = 20
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        cuerpo_completo = completa(filas)
+    ms_completa = (time.perf_counter() - inicio) / repeticiones * 1000
+
+    duraciones = []
+    for _ in range(repeticiones):
+        cuerpo_campos, duracion = con_campos(filas)
+        duraciones.append(duracion)
+    ms_campos = sum(duraciones) / repeticiones * 1000
+
+    print(f"{cantidad} cirugías, notas de {largo_notas} caracteres")
+    print(f"completa:      {ms_completa:7.2f} ms  {len(cuerpo_completo) / 1024:8.1f} KiB")
+    print(f"fields=...:    {ms_campos:7.2f} ms  {len(cuerpo_campos) / 1024:8.1f} KiB")
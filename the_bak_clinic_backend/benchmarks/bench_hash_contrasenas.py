@@ -0,0 +1,47 @@
+"""
+Mide logins por segundo (verificaciones de contraseña) con los parámetros de scrypt actuales.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_hash_contrasenas [segundos]
+
+Los parámetros se toman de HASH_SCRYPT_N / HASH_SCRYPT_R / HASH_SCRYPT_P y el tamaño del pool
+de HASH_PROCESOS, igual que en la API, para poder ajustar el costo antes de cambiarlo en producción.
+"""
+import sys
+import time
+from concurrent.futures import wait
+
+from app.core import seguridad
+
+
+def medir_un_proceso(hash_guardado: str, segundos: float) -> float:
+    inicio, cantidad = time.perf_counter(), 0
+    while time.perf_counter() - inicio < segundos:
+        seguridad.comprobar_hash("contrasena-de-prueba", hash_guardado)
+        cantidad += 1
+    return cantidad / (time.perf_counter() - inicio)
+
+
+def medir_pool(hash_guardado: str, segundos: float) -> float:
+    pool = seguridad.obtener_pool()
+    # Calentar: los procesos "spawn" se crean al primer uso
+    wait([pool.submit(seguridad.comprobar_hash, "x", hash_guardado) for _ in range(seguridad.PROCESOS_HASH)])
+    inicio, cantidad = time.perf_counter(), 0
+    while time.perf_counter() - inicio < segundos:
+        lote = [pool.submit(seguridad.comprobar_hash, "contrasena-de-prueba", hash_guardado) for _ in range(seguridad.PROCESOS_HASH * 4)]
+        wait(lote)
+        cantidad += len(lote)
+    return cantidad / (time.perf_counter() - inicio)
+
+
+if __name__ == "__main__":
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    hash_guardado = seguridad.calcular_hash("contrasena-de-prueba")
+    print(f"scrypt n={seguridad.SCRYPT_N} r={seguridad.SCRYPT_R} p={seguridad.SCRYPT_P}")
+
+    por_nucleo = medir_un_proceso(hash_guardado, segundos)
+    print(f"1 proceso:  {por_nucleo:8.1f} logins/s ({1000 / por_nucleo:.1f} ms por verificación)")
+
+    total = medir_pool(hash_guardado, segundos)
+    print(f"pool de {seguridad.PROCESOS_HASH}:  {total:8.1f} logins/s ({total / seguridad.PROCESOS_HASH:.1f} por núcleo)")
+    seguridad.cerrar_pool()
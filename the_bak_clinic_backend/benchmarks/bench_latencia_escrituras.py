@@ -0,0 +1,149 @@
+"""
+Latencia de PUT y DELETE de cirugías, pacientes y usuarios con un RTT simulado hacia la BD.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_latencia_escrituras [requests] [rtt_ms]
+
+La BD se reemplaza a nivel de abrir_conexion por una conexión en memoria que espera `rtt_ms`
+(20 por defecto) en cada execute, commit y rollback, como una BD en otra zona o región. Cada
+endpoint se mide de punta a punta con TestClient y se cuentan los viajes a la BD.
+
+"antes" reproduce sobre la misma conexión la secuencia que hacían estos endpoints: SELECT de
+existencia (y de RUT/email duplicado en usuarios y pacientes al cambiarlos), la escritura, commit
+y, en los PUT, un SELECT de la fila actualizada.
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("LIMITE_TASA_LECTURA", "1000000/1")
+
+import app.database as database
+from app.core.tokens import crear_token_acceso
+from app.main import app
+
+AHORA = datetime(2026, 10, 1, 8)
+FILAS = {
+    "Cirugias": (2, 10, 3, None, "Pabellón 1", AHORA, 60, None, "Apendicectomía", "Programada", None, None, AHORA, AHORA, 2),
+    "Pacientes": (2, "Ana", "Soto", "12345678-5", date(1990, 1, 1), None, None, None, None, None, AHORA, 2, "12345678-5"),
+    "Usuarios": (2, "Luis", "Rojas", "11111111-1", "luis@clinicabak.cl", None, "medico", None, True, AHORA, None, 2),
+}
+
+# Endpoint -> (método, url, cuerpo, viajes del flujo anterior sin contar el commit)
+ESCRITURAS = {
+    "PUT /cirugias/{id}": ("PUT", "/cirugias/2", {"tipo_cirugia": "Colecistectomía"}, 3),
+    "PUT /pacientes/{id} (RUT)": ("PUT", "/pacientes/2", {"rut": "12.345.678-5"}, 4),
+    "PUT /usuarios/{id} (email)": ("PUT", "/usuarios/2", {"email": "luis.rojas@clinicabak.cl"}, 4),
+    "DELETE /cirugias/{id}": ("DELETE", "/cirugias/2", None, 2),
+    "DELETE /pacientes/{id}": ("DELETE", "/pacientes/2", None, 2),
+    "DELETE /usuarios/{id}": ("DELETE", "/usuarios/2", None, 2),
+}
+
+
+class _CursorRemoto:
+    description = []
+    rowcount = 1
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.sql = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def setinputsizes(self, tamanos):
+        pass
+
+    def execute(self, sql, *params):
+        self.conexion.viaje()
+        self.sql = sql
+        return self
+
+    def fetchone(self):
+        for tabla, fila in FILAS.items():
+            if f"UPDATE {tabla}" in self.sql:
+                return fila
+        if "OUTPUT DELETED" in self.sql:
+            return ("12345678-5",)
+        return None
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class _ConexionRemota:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.viajes = 0
+
+    def viaje(self):
+        self.viajes += 1
+        time.sleep(self.rtt)
+
+    def cursor(self):
+        return _CursorRemoto(self)
+
+    def commit(self):
+        self.viaje()
+
+    def rollback(self):
+        self.viaje()
+
+    def close(self):
+        pass
+
+
+def medir(funcion, cantidad: int):
+    duraciones = []
+    for _ in range(cantidad):
+        inicio = time.perf_counter()
+        funcion()
+        duraciones.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(duraciones)
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 20.0) / 1000
+    headers = {"Authorization": f"Bearer {crear_token_acceso(1, 'bench@clinicabak.cl', 'administrador')}"}
+
+    conexiones = []
+
+    def abrir():
+        conexiones.append(_ConexionRemota(rtt))
+        return conexiones[-1]
+
+    database.abrir_conexion = abrir
+
+    print(f"RTT simulado: {rtt * 1000:.0f} ms, mediana de {cantidad} requests")
+    print(f"{'endpoint':30s} {'antes':>16s} {'ahora':>16s}")
+    with TestClient(app) as cliente:
+        for nombre, (metodo, url, cuerpo, viajes_antes) in ESCRITURAS.items():
+            def request():
+                # Los PUT llevan la versión leída (If-Match); la fila en memoria siempre está en la 1
+                respuesta = cliente.request(metodo, url, json=cuerpo, headers={**headers, "If-Match": '"1"'})
+                assert respuesta.status_code in (200, 204), respuesta.text
+
+            def flujo_anterior():
+                conexion = _ConexionRemota(rtt)
+                for _ in range(viajes_antes):
+                    conexion.viaje()
+                conexion.commit()
+
+            ahora_ms = medir(request, cantidad)
+            # Las conexiones vienen del pool y se reutilizan: se cuentan los viajes de un request más
+            antes_del_request = sum(c.viajes for c in conexiones)
+            request()
+            viajes_ahora = sum(c.viajes for c in conexiones) - antes_del_request
+            antes_ms = medir(flujo_anterior, cantidad)
+            print(f"{nombre:30s} {antes_ms:7.1f} ms ({viajes_antes + 1} v) {ahora_ms:7.1f} ms ({viajes_ahora} v)")
@@ -0,0 +1,91 @@
+"""
+Mide el costo de las métricas por request frente a un GET /cirugias/ completo.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_metricas [requests]
+
+La BD se reemplaza por una conexión en memoria (a nivel de abrir_conexion, así get_connection y el
+cursor medido corren igual que en producción). El costo de las métricas se mide aparte repitiendo
+las mismas operaciones que registra un request de listado: en curso, conteo, histograma, fases y
+dos sentencias.
+"""
+import os
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+# Sin límite de tasa efectivo: el benchmark hace miles de requests con el mismo usuario
+os.environ.setdefault("LIMITE_TASA_LECTURA", "1000000/1")
+
+import app.database as database
+from app.core import metricas, perfil_sql
+from app.core.tokens import crear_token_acceso
+from app.main import app
+
+
+class _CursorVacio:
+    description = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, *args):
+        return self
+
+    def fetchone(self):
+        return (0,)
+
+    def fetchall(self):
+        return []
+
+
+class _ConexionVacia:
+    def cursor(self):
+        return _CursorVacio()
+
+    def close(self):
+        pass
+
+
+def medir_request(cliente: TestClient, cantidad: int, headers: dict) -> float:
+    for _ in range(50):
+        cliente.get("/cirugias/", headers=headers)
+    inicio = time.perf_counter()
+    for _ in range(cantidad):
+        respuesta = cliente.get("/cirugias/", headers=headers)
+    assert respuesta.status_code == 200, respuesta.text
+    return (time.perf_counter() - inicio) / cantidad * 1e6
+
+
+def medir_metricas(cantidad: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(cantidad):
+        metricas.solicitudes_en_curso.inc()
+        metricas.duracion_conexion_bd.observar(0.0001)
+        metricas.conexiones_en_uso.inc()
+        for etiqueta in ("cirugias.list.count", "cirugias.list.page"):
+            perfil_sql.registrar_sentencia(etiqueta, "SELECT ...", (), 0.002, 50)
+        metricas.conexiones_en_uso.dec()
+        metricas.solicitudes_en_curso.dec()
+        metricas.solicitudes_http.inc("GET", "/cirugias/", "200")
+        metricas.duracion_http.observar(0.01, "GET", "/cirugias/")
+        for fase in ("db_conexion", "db_consulta", "mapeo", "app"):
+            metricas.fases_http.inc("/cirugias/", fase, cantidad=0.001)
+    return (time.perf_counter() - inicio) / cantidad * 1e6
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    database.abrir_conexion = lambda: _ConexionVacia()
+    headers = {"Authorization": f"Bearer {crear_token_acceso(1, 'bench@clinicabak.cl', 'medico')}"}
+
+    with TestClient(app) as cliente:
+        por_request = medir_request(cliente, cantidad, headers)
+    costo_metricas = medir_metricas(cantidad * 10)
+
+    print(f"GET /cirugias/ (BD en memoria): {por_request:8.1f} us/request")
+    print(f"métricas por request:           {costo_metricas:8.2f} us ({costo_metricas / por_request:.2%})")
@@ -0,0 +1,93 @@
+"""
+Compara el UPDATE parcial armado con f-string (como lo hacían los routers) contra la sentencia
+de texto fijo de app.core.sentencias, para PUT /cirugias/{id}.
+
+Uso (desde the_bak_clinic_backend/):
+    python -m benchmarks.bench_sentencias_update [solicitudes]
+
+Se generan solicitudes con combinaciones de campos y largos de texto al azar y se cuenta cuántas
+sentencias distintas vería SQL Server: el plan se cachea por texto y por tipos declarados de los
+parámetros (pyodbc declara un str como nvarchar(largo del valor) si no se fija con setinputsizes).
+También se mide el costo en Python de armar cada sentencia.
+
+La reutilización de planes y el CPU de compilación se comprueban en el servidor tras una carga
+real, por ejemplo:
+
+    SELECT cp.usecounts, cp.size_in_bytes, qs.total_worker_time / qs.execution_count AS cpu_us, st.text
+    FROM sys.dm_exec_cached_plans cp
+    CROSS APPLY sys.dm_exec_sql_text(cp.plan_handle) st
+    LEFT JOIN sys.dm_exec_query_stats qs ON qs.plan_handle = cp.plan_handle
+    WHERE st.text LIKE '%UPDATE Cirugias%' AND st.text NOT LIKE '%dm_exec%'
+    ORDER BY cp.usecounts DESC;
+
+Con el f-string aparecen muchas filas con usecounts bajo; con la sentencia fija, una con usecounts alto.
+"""
+import random
+import sys
+import time
+from datetime import datetime
+
+from app.routers.cirugias import ACTUALIZACION_CIRUGIAS
+
+CAMPOS = {
+    "id_paciente": lambda: random.randint(1, 5000),
+    "id_medico_principal": lambda: random.randint(1, 200),
+    "nombre_quirofano": lambda: f"Pabellón {random.randint(1, 12)}",
+    "fecha_hora_inicio_programada": lambda: datetime(2026, 10, random.randint(1, 28), random.randint(7, 20)),
+    "duracion_estimada_minutos": lambda: random.choice((30, 45, 60, 90, 120)),
+    "tipo_cirugia": lambda: random.choice(("Apendicectomía", "Colecistectomía", "Hernioplastía inguinal")),
+    "estado_cirugia": lambda: random.choice(("Programada", "En Curso", "Realizada", "Cancelada")),
+    "notas_preoperatorias": lambda: "x" * random.randint(0, 300),
+}
+
+
+def solicitud_al_azar() -> dict:
+    campos = random.sample(list(CAMPOS), random.randint(1, 4))
+    datos = {campo: CAMPOS[campo]() for campo in campos}
+    datos["fecha_ultima_modificacion"] = datetime.utcnow()
+    return datos
+
+
+def tipo_declarado_pyodbc(valor) -> str:
+    return f"nvarchar({max(len(valor), 1)})" if isinstance(valor, str) else type(valor).__name__
+
+
+def sentencia_fstring(datos: dict, cirugia_id: int):
+    set_clauses = [f"{key} = ?" for key in datos]
+    params = list(datos.values()) + [cirugia_id]
+    return f"UPDATE Cirugias SET {', '.join(set_clauses)} WHERE id_cirugia = ?", params
+
+
+def planes_fstring(solicitudes) -> int:
+    firmas = set()
+    for datos in solicitudes:
+        sql, params = sentencia_fstring(datos, 1)
+        firmas.add((sql, tuple(tipo_declarado_pyodbc(p) for p in params)))
+    return len(firmas)
+
+
+def planes_fija(solicitudes) -> int:
+    firmas = set()
+    for datos in solicitudes:
+        ACTUALIZACION_CIRUGIAS.parametros(datos, 1, 1)
+        firmas.add((ACTUALIZACION_CIRUGIAS.sentencia, tuple(ACTUALIZACION_CIRUGIAS.tamanos)))
+    return len(firmas)
+
+
+def medir(funcion, solicitudes) -> float:
+    inicio = time.perf_counter()
+    for datos in solicitudes:
+        funcion(datos)
+    return (time.perf_counter() - inicio) / len(solicitudes) * 1e6
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(43)
+    solicitudes = [solicitud_al_azar() for _ in range(cantidad)]
+
+    print(f"{cantidad} PUT /cirugias/{{id}} con campos al azar")
+    print(f"sentencias distintas (texto + tipos) f-string: {planes_fstring(solicitudes):6d}")
+    print(f"sentencias distintas (texto + tipos) fija:     {planes_fija(solicitudes):6d}")
+    print(f"armar sentencia f-string: {medir(lambda datos: sentencia_fstring(datos, 1), solicitudes):6.2f} us")
+    print(f"armar parámetros fija:    {medir(lambda datos: ACTUALIZACION_CIRUGIAS.parametros(datos, 1, 1), solicitudes):6.2f} us")
@@ -0,0 +1,16 @@
+-- RUT normalizado de pacientes con índice único.
+-- La columna es calculada y persistida, por lo que también cubre los registros antiguos guardados
+-- con puntos ("12.345.678-9"). Los nuevos registros ya se guardan en forma canónica ("12345678-9").
+--
+-- Antes de crear el índice único, revisar duplicados existentes:
+--   SELECT UPPER(REPLACE(REPLACE(rut, '.', ''), '-', '')) AS rut_normalizado, COUNT(*)
+--   FROM Pacientes GROUP BY UPPER(REPLACE(REPLACE(rut, '.', ''), '-', '')) HAVING COUNT(*) > 1;
+
+ALTER TABLE Pacientes
+    ADD rut_normalizado AS UPPER(REPLACE(REPLACE(rut, '.', ''), '-', '')) PERSISTED;
+GO
+
+CREATE UNIQUE NONCLUSTERED INDEX UX_Pacientes_rut_normalizado
+    ON Pacientes (rut_normalizado)
+    INCLUDE (nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro);
+GO
@@ -0,0 +1,47 @@
+-- Soporte de GET /pacientes/buscar (app/services/busqueda_pacientes.py).
+--
+-- Cada worker carga los nombres una vez al arrancar y después solo trae lo que cambió: `cambio`
+-- (ROWVERSION) sube en cada INSERT/UPDATE, incluida la importación masiva, y los borrados quedan
+-- en PacientesEliminados con su propia ROWVERSION. El worker lee desde su última marca hasta
+-- MIN_ACTIVE_ROWVERSION(), así no se salta filas de transacciones que aún no confirman.
+
+ALTER TABLE Pacientes ADD cambio ROWVERSION;
+GO
+
+CREATE NONCLUSTERED INDEX IX_Pacientes_cambio
+    ON Pacientes (cambio)
+    INCLUDE (nombre, apellido);
+GO
+
+CREATE TABLE PacientesEliminados (
+    cambio ROWVERSION NOT NULL CONSTRAINT PK_PacientesEliminados PRIMARY KEY,
+    id_paciente INT NOT NULL,
+    eliminado_dt DATETIME2 NOT NULL CONSTRAINT DF_PacientesEliminados_eliminado DEFAULT SYSUTCDATETIME()
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_PacientesEliminados_eliminado
+    ON PacientesEliminados (eliminado_dt);
+GO
+
+-- Un worker que pasa más de 12 horas sin sincronizar vuelve a cargar todo, así que basta con
+-- conservar un día de borrados.
+-- Con este trigger, un DELETE sobre Pacientes no puede usar OUTPUT sin INTO (error 334): ver
+-- delete_paciente en app/routers/pacientes.py. Los INSERT/UPDATE/MERGE con OUTPUT siguen igual
+-- porque ninguno borra.
+CREATE TRIGGER TR_Pacientes_eliminados ON Pacientes AFTER DELETE AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO PacientesEliminados (id_paciente) SELECT id_paciente FROM deleted;
+    DELETE FROM PacientesEliminados WHERE eliminado_dt < DATEADD(DAY, -1, SYSUTCDATETIME());
+END;
+GO
+
+-- Número de ficha normalizado como el RUT (sql/028): la búsqueda por prefijo usa el índice
+ALTER TABLE Pacientes
+    ADD ficha_normalizada AS UPPER(REPLACE(REPLACE(numero_ficha, '.', ''), '-', '')) PERSISTED;
+GO
+
+CREATE NONCLUSTERED INDEX IX_Pacientes_ficha_normalizada
+    ON Pacientes (ficha_normalizada);
+GO
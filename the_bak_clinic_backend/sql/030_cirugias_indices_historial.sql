@@ -0,0 +1,33 @@
+-- Índices de apoyo para list_cirugias (historial con filtros, búsqueda y orden en el servidor).
+-- Los filtros por fecha comparan la columna directamente, así que todos llevan la fecha como
+-- segunda clave para resolver rango + orden sin ordenar en memoria.
+
+CREATE NONCLUSTERED INDEX IX_Cirugias_fecha_inicio
+    ON Cirugias (fecha_hora_inicio_programada, id_cirugia)
+    INCLUDE (id_paciente, id_medico_principal, nombre_quirofano, estado_cirugia, tipo_cirugia);
+GO
+
+CREATE NONCLUSTERED INDEX IX_Cirugias_estado_fecha
+    ON Cirugias (estado_cirugia, fecha_hora_inicio_programada)
+    INCLUDE (nombre_quirofano, id_medico_principal);
+GO
+
+CREATE NONCLUSTERED INDEX IX_Cirugias_quirofano_fecha
+    ON Cirugias (nombre_quirofano, fecha_hora_inicio_programada)
+    INCLUDE (estado_cirugia, id_medico_principal);
+GO
+
+CREATE NONCLUSTERED INDEX IX_Cirugias_medico_fecha
+    ON Cirugias (id_medico_principal, fecha_hora_inicio_programada);
+GO
+
+CREATE NONCLUSTERED INDEX IX_Cirugias_paciente_fecha
+    ON Cirugias (id_paciente, fecha_hora_inicio_programada);
+GO
+
+-- La búsqueda de texto usa LIKE '%texto%' sobre tipo_cirugia y notas; este índice angosto hace que
+-- el recorrido de tipo_cirugia lea mucho menos que la tabla completa. Las notas (nvarchar(max))
+-- no pueden ser clave de índice y se evalúan solo sobre las filas que pasan los demás filtros.
+CREATE NONCLUSTERED INDEX IX_Cirugias_tipo
+    ON Cirugias (tipo_cirugia);
+GO
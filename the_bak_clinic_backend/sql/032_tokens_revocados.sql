@@ -0,0 +1,22 @@
+-- Tokens cerrados con POST /auth/logout (app/core/tokens.py).
+-- El logout revoca en su worker al momento y deja aquí el jti; los demás workers traen las filas
+-- nuevas cada pocos segundos (desde su marca hasta MIN_ACTIVE_ROWVERSION()) y las vigentes al
+-- arrancar. exp es la expiración del token en segundos Unix: pasada esa hora la fila ya no sirve y se
+-- borra.
+
+CREATE TABLE TokensRevocados (
+    jti CHAR(16) NOT NULL CONSTRAINT PK_TokensRevocados PRIMARY KEY,
+    exp BIGINT NOT NULL,
+    cambio ROWVERSION NOT NULL,
+    revocado_dt DATETIME2 NOT NULL CONSTRAINT DF_TokensRevocados_revocado DEFAULT SYSUTCDATETIME()
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_TokensRevocados_cambio
+    ON TokensRevocados (cambio)
+    INCLUDE (exp);
+GO
+
+CREATE NONCLUSTERED INDEX IX_TokensRevocados_exp
+    ON TokensRevocados (exp);
+GO
@@ -0,0 +1,31 @@
+-- Tareas de limpieza de quirófanos. Se crean al marcar una cirugía como "Realizada" (o a mano
+-- desde el panel) y el personal de limpieza las toma de a una.
+
+CREATE TABLE TareasLimpieza (
+    id_tarea_limpieza INT IDENTITY(1,1) NOT NULL CONSTRAINT PK_TareasLimpieza PRIMARY KEY,
+    nombre_quirofano NVARCHAR(100) NOT NULL,
+    id_cirugia INT NULL
+        CONSTRAINT FK_TareasLimpieza_Cirugias REFERENCES Cirugias (id_cirugia) ON DELETE SET NULL,
+    asignada_a INT NULL
+        CONSTRAINT FK_TareasLimpieza_Usuarios REFERENCES Usuarios (id_usuario),
+    estado_tarea NVARCHAR(30) NOT NULL CONSTRAINT DF_TareasLimpieza_estado DEFAULT 'Pendiente',
+    -- Hasta cuándo estuvo ocupado el quirófano; a igual próxima cirugía, se limpia primero el que lleva más tiempo esperando
+    ocupado_hasta DATETIME2 NULL,
+    solicitada_dt DATETIME2 NOT NULL CONSTRAINT DF_TareasLimpieza_solicitada DEFAULT SYSUTCDATETIME(),
+    asignada_dt DATETIME2 NULL,
+    completada_dt DATETIME2 NULL,
+    notas_tarea NVARCHAR(500) NULL
+);
+GO
+
+-- Una sola tarea por cirugía: hace idempotente el encolado al finalizar una cirugía
+CREATE UNIQUE NONCLUSTERED INDEX UX_TareasLimpieza_id_cirugia
+    ON TareasLimpieza (id_cirugia)
+    WHERE id_cirugia IS NOT NULL;
+GO
+
+-- Carga de la cola (pendientes sin asignar) y listados por estado
+CREATE NONCLUSTERED INDEX IX_TareasLimpieza_estado
+    ON TareasLimpieza (estado_tarea, asignada_a)
+    INCLUDE (nombre_quirofano, id_cirugia, ocupado_hasta, solicitada_dt);
+GO
@@ -0,0 +1,35 @@
+-- Bandeja de salida de eventos (patrón outbox). Los routers insertan el evento en la misma
+-- transacción que el cambio que lo origina; un worker en segundo plano lo entrega a los
+-- suscriptores. La entrega es al menos una vez: un evento tomado por un worker que se cae
+-- vuelve a estar disponible cuando vence su bloqueo (disponible_desde).
+
+CREATE TABLE EventosSalida (
+    id_evento BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_EventosSalida PRIMARY KEY,
+    tipo NVARCHAR(50) NOT NULL,
+    -- Evita publicar dos veces el mismo hecho (ej. 'cirugia_realizada:123')
+    clave_idempotencia NVARCHAR(150) NOT NULL CONSTRAINT UX_EventosSalida_clave UNIQUE,
+    datos NVARCHAR(MAX) NOT NULL,  -- JSON
+    creado_dt DATETIME2 NOT NULL CONSTRAINT DF_EventosSalida_creado DEFAULT SYSUTCDATETIME(),
+    intentos INT NOT NULL CONSTRAINT DF_EventosSalida_intentos DEFAULT 0,
+    disponible_desde DATETIME2 NOT NULL CONSTRAINT DF_EventosSalida_disponible DEFAULT SYSUTCDATETIME(),
+    procesado_dt DATETIME2 NULL,
+    ultimo_error NVARCHAR(1000) NULL
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_EventosSalida_pendientes
+    ON EventosSalida (disponible_desde, id_evento)
+    INCLUDE (intentos)
+    WHERE procesado_dt IS NULL;
+GO
+
+-- Suscriptores que ya procesaron cada evento. Se escribe en la misma transacción que los
+-- efectos del suscriptor, así un reintento no repite lo que ya quedó confirmado.
+CREATE TABLE EventosProcesados (
+    id_evento BIGINT NOT NULL
+        CONSTRAINT FK_EventosProcesados_EventosSalida REFERENCES EventosSalida (id_evento) ON DELETE CASCADE,
+    suscriptor NVARCHAR(100) NOT NULL,
+    procesado_dt DATETIME2 NOT NULL CONSTRAINT DF_EventosProcesados_procesado DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT PK_EventosProcesados PRIMARY KEY (id_evento, suscriptor)
+);
+GO
@@ -0,0 +1,22 @@
+-- Historial de rotaciones de quirófano (desocupado -> limpio). Solo se insertan filas: la API
+-- nunca actualiza ni borra este historial; de aquí salen las estadísticas de /reportes/turnover.
+
+CREATE TABLE HistorialLimpiezaQuirofanos (
+    id_historial BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_HistorialLimpiezaQuirofanos PRIMARY KEY,
+    nombre_quirofano NVARCHAR(100) NOT NULL,
+    ocupado_hasta DATETIME2 NOT NULL,
+    limpieza_realizada_dt DATETIME2 NOT NULL,
+    duracion_minutos AS CAST(DATEDIFF(second, ocupado_hasta, limpieza_realizada_dt) / 60.0 AS DECIMAL(9, 2)) PERSISTED,
+    registrado_dt DATETIME2 NOT NULL CONSTRAINT DF_HistorialLimpieza_registrado DEFAULT SYSUTCDATETIME()
+);
+GO
+
+-- Una rotación por ocupación: si el quirófano se marca limpio dos veces, cuenta la primera
+CREATE UNIQUE NONCLUSTERED INDEX UX_HistorialLimpieza_quirofano_ocupado
+    ON HistorialLimpiezaQuirofanos (nombre_quirofano, ocupado_hasta);
+GO
+
+CREATE NONCLUSTERED INDEX IX_HistorialLimpieza_ocupado
+    ON HistorialLimpiezaQuirofanos (ocupado_hasta)
+    INCLUDE (nombre_quirofano, duracion_minutos);
+GO
@@ -0,0 +1,17 @@
+-- Índices únicos de Usuarios (RUT y email).
+-- Los routers ya no consultan si el RUT o el email están en uso antes de insertar o actualizar:
+-- la BD rechaza el duplicado en la misma sentencia y el router traduce el IntegrityError a 409
+-- según el nombre del índice (UX_Usuarios_rut, UX_Usuarios_email). Pacientes ya tiene
+-- UX_Pacientes_rut_normalizado (028).
+--
+-- Antes de crear los índices, revisar duplicados existentes:
+--   SELECT rut, COUNT(*) FROM Usuarios GROUP BY rut HAVING COUNT(*) > 1;
+--   SELECT email, COUNT(*) FROM Usuarios GROUP BY email HAVING COUNT(*) > 1;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Usuarios_rut' AND object_id = OBJECT_ID('Usuarios'))
+    CREATE UNIQUE NONCLUSTERED INDEX UX_Usuarios_rut ON Usuarios (rut);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Usuarios_email' AND object_id = OBJECT_ID('Usuarios'))
+    CREATE UNIQUE NONCLUSTERED INDEX UX_Usuarios_email ON Usuarios (email);
+GO
@@ -0,0 +1,20 @@
+-- Versión de fila para el control de concurrencia optimista (app/core/concurrencia.py).
+-- Es un entero que incrementan las ediciones (PUT y la importación de pacientes), no un rowversion:
+-- escrituras que no son ediciones, como ultimo_acceso y el rehash de la contraseña al iniciar
+-- sesión, no deben invalidar el formulario que alguien tiene abierto.
+
+ALTER TABLE Cirugias ADD version INT NOT NULL CONSTRAINT DF_Cirugias_version DEFAULT 1;
+GO
+
+ALTER TABLE Pacientes ADD version INT NOT NULL CONSTRAINT DF_Pacientes_version DEFAULT 1;
+GO
+
+ALTER TABLE Usuarios ADD version INT NOT NULL CONSTRAINT DF_Usuarios_version DEFAULT 1;
+GO
+
+-- UX_Pacientes_rut_normalizado cubre GET /pacientes/por-rut; se recrea incluyendo la versión
+CREATE UNIQUE NONCLUSTERED INDEX UX_Pacientes_rut_normalizado
+    ON Pacientes (rut_normalizado)
+    INCLUDE (nombre, apellido, rut, fecha_nacimiento, telefono, email, direccion, prevision, numero_ficha, fecha_registro, version)
+    WITH (DROP_EXISTING = ON);
+GO
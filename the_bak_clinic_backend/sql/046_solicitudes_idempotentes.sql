@@ -0,0 +1,21 @@
+-- Respuestas guardadas de POST con header Idempotency-Key (app/core/idempotencia.py).
+-- Una fila por usuario y clave: mientras la solicitud se procesa, codigo es NULL y expira_dt es un
+-- plazo corto (si el worker se cae, otro puede retomarla al vencer); al terminar se guarda la
+-- respuesta (cuerpo comprimido con zlib y los headers que se repiten) y expira_dt pasa a la
+-- retención configurada (24 h por defecto).
+
+CREATE TABLE SolicitudesIdempotentes (
+    id_usuario INT NOT NULL,
+    clave NVARCHAR(100) NOT NULL,
+    huella BINARY(32) NOT NULL,  -- SHA-256 de método, ruta y cuerpo: la misma clave con otra solicitud es un error
+    codigo SMALLINT NULL,
+    headers NVARCHAR(2000) NULL,  -- JSON [[nombre, valor], ...]: Content-Type, ETag y Location a repetir
+    cuerpo VARBINARY(MAX) NULL,
+    expira_dt DATETIME2 NOT NULL,
+    CONSTRAINT PK_SolicitudesIdempotentes PRIMARY KEY (id_usuario, clave)
+);
+GO
+
+CREATE NONCLUSTERED INDEX IX_SolicitudesIdempotentes_expira
+    ON SolicitudesIdempotentes (expira_dt);
+GO